@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib import admin
+from django.db.models import Q
 
-from .models import Proxy, User, UserAgent, hash_url
+from .models import Proxy, User, UserAgent, UserDomainStatus, hash_endpoint, hash_url
+from .pairing import pair_users
 
 
 class ProxyAdminForm(forms.ModelForm):
@@ -11,25 +13,68 @@ class ProxyAdminForm(forms.ModelForm):
 
     def clean(self):
         cleaned_data = super().clean()
-        url = cleaned_data.get("url")
-        if tmp := Proxy.objects.filter(url=url).exists():
-            exists = tmp
-        else:
-            url_hash = hash_url(url)
-            if self.instance.pk:
-                exists = Proxy.objects.exclude(pk=self.instance.pk).filter(url_hash=url_hash).exists()
-            else:
-                exists = Proxy.objects.filter(url_hash=url_hash).exists()
-
-        if exists:
+        # Шифротекст случаен, поэтому дубликат ищется только по слепому индексу
+        duplicates = Proxy.objects.filter(url_hash=hash_url(cleaned_data.get("url")))
+        if self.instance.pk:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
             self.add_error("url", "Прокси с таким URL уже существует.")
 
         return cleaned_data
 
 
-class ProxyAdmin(admin.ModelAdmin):
+class PairingAdminMixin:
+    """
+    Создание пользователей для новых и выбранных прокси или User-Agent.
+    """
+
+    actions = ["create_users"]
+    pairing_lookup = None
+
+    def pair(self, queryset):
+        return pair_users(**{self.pairing_lookup: queryset})
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            self.pair(type(obj).objects.filter(pk=obj.pk))
+
+    @admin.action(description="Создать недостающих пользователей")
+    def create_users(self, request, queryset):
+        created = self.pair(queryset)
+        self.message_user(request, f"Создано {created} пользователей.")
+
+
+class ProxyAdmin(PairingAdminMixin, admin.ModelAdmin):
     form = ProxyAdminForm
+    pairing_lookup = "proxies"
+    # Поиск идёт по слепому индексу, а не по зашифрованному полю (см. get_search_results)
+    search_fields = ["url_hash"]
+    search_help_text = "Полный URL прокси или host:port"
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        lookup = Q(url_hash=hash_url(search_term))
+        endpoint_hash = hash_endpoint(search_term)
+        if endpoint_hash is not None:
+            lookup |= Q(endpoint_hash=endpoint_hash)
+        return queryset.filter(lookup), False
+
+
+class UserAgentAdmin(PairingAdminMixin, admin.ModelAdmin):
+    pairing_lookup = "agents"
+
+
+class UserDomainStatusAdmin(admin.ModelAdmin):
+    list_display = ("user", "domain", "status", "consecutive_failures", "next_available_at", "last_used_at")
+    list_filter = ("status",)
+    search_fields = ("domain",)
+    raw_id_fields = ("user",)
 
 
 admin.site.register(Proxy, ProxyAdmin)
-admin.site.register([User, UserAgent])
+admin.site.register(UserAgent, UserAgentAdmin)
+admin.site.register(User)
+admin.site.register(UserDomainStatus, UserDomainStatusAdmin)
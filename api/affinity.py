@@ -0,0 +1,126 @@
+"""
+Привязка клиентских сессий к пользователям (?session=) через кольцо
+консистентного хеширования.
+
+Каждый пользователь занимает на кольце USER_SESSION_VNODES точек, сессия
+достаётся владельцу первой точки по часовой стрелке от хеша ключа сессии.
+Пользователи, ставшие недоступными (статус, cooldown, аренда), из кольца не
+удаляются, а пропускаются при обходе: их сессии переходят к следующей точке,
+остальные не двигаются, а после восстановления пользователя сессии к нему
+возвращаются. Так при изменении пула из N пользователей переезжает около 1/N
+сессий, а смена статуса не требует перестройки кольца.
+"""
+
+import bisect
+import hashlib
+from array import array
+
+from django.conf import settings
+
+MASK = (1 << 64) - 1
+# Сколько новых точек вставлять по одной; больше — пересортировка всего кольца
+MAX_INSERTS = 256
+
+
+def point_hash(user_id, replica):
+    # hash() кортежа целых не зависит от PYTHONHASHSEED: все процессы строят одинаковое кольцо
+    return hash((user_id, replica)) & MASK
+
+
+def session_hash(session: str) -> int:
+    return int.from_bytes(hashlib.blake2b(session.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Кольцо консистентного хеширования ID пользователей.
+
+    Кольцо строится при первом обращении (active); новые пользователи копятся
+    в pending и вливаются в кольцо перед следующим поиском: немногие — вставкой
+    в отсортированные массивы, много — общей пересортировкой.
+    """
+
+    def __init__(self, vnodes=None):
+        self._vnodes = vnodes
+        self._hashes = array("Q")
+        self._ids = array("q")
+        self._members = set()
+        self._pending = []
+        self.active = False
+
+    @property
+    def vnodes(self):
+        if self._vnodes is not None:
+            return self._vnodes
+        return getattr(settings, "USER_SESSION_VNODES", 4)
+
+    def _points(self, user_ids):
+        # Точка упакована в одно число (хеш << 64 | ID): такой список сортируется быстрее кортежей
+        vnodes = range(self.vnodes)
+        return [point_hash(user_id, replica) << 64 | user_id for user_id in user_ids for replica in vnodes]
+
+    def _store(self, points):
+        points.sort()
+        self._hashes = array("Q", (point >> 64 for point in points))
+        self._ids = array("q", (point & MASK for point in points))
+
+    def build(self, user_ids):
+        """
+        Строит кольцо заново из user_ids (заодно убирая точки удалённых пользователей).
+        """
+        self._members = set(user_ids)
+        self._pending = []
+        self._store(self._points(self._members))
+        self.active = True
+
+    def add(self, user_id):
+        if self.active and user_id not in self._members:
+            self._members.add(user_id)
+            self._pending.append(user_id)
+
+    def add_many(self, user_ids):
+        for user_id in user_ids:
+            self.add(user_id)
+
+    def _merge(self):
+        pending, self._pending = self._pending, []
+        points = self._points(pending)
+        if len(points) <= MAX_INSERTS:
+            for point in points:
+                index = bisect.bisect(self._hashes, point >> 64)
+                self._hashes.insert(index, point >> 64)
+                self._ids.insert(index, point & MASK)
+        else:
+            # Кольцо уже отсортировано, поэтому сортировка добавленных к нему точек почти линейна
+            self._store([*(point << 64 | user_id for point, user_id in zip(self._hashes, self._ids)), *points])
+
+    def lookup(self, key, accept, max_walk=None):
+        """
+        Первый по часовой стрелке от хеша key пользователь, для которого accept(id) истинно,
+        или None, если среди max_walk следующих точек такого нет.
+        """
+        if self._pending:
+            self._merge()
+        count = len(self._hashes)
+        if not count:
+            return None
+        max_walk = max_walk or getattr(settings, "USER_SESSION_MAX_WALK", 64)
+        start = bisect.bisect(self._hashes, session_hash(key))
+        for step in range(min(max_walk, count)):
+            user_id = self._ids[(start + step) % count]
+            if accept(user_id):
+                return user_id
+        return None
+
+    def clear(self):
+        self._hashes = array("Q")
+        self._ids = array("q")
+        self._members = set()
+        self._pending = []
+        self.active = False
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, user_id):
+        return user_id in self._members
@@ -0,0 +1,88 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .domains import normalize_domain
+from .models import User
+from .pool import STRATEGIES, apick_random_user
+from .ratelimit import Saturated
+from .renderers import CompactJSONRenderer, dumps
+from .serializers import (
+    COMPACT_USER_FIELDS,
+    UserDomainStatusSerializer,
+    UserSerializer,
+    UserStatusSerializer,
+    compact_user,
+)
+from .services import record_report, report_domain_statuses
+
+
+class AsyncRandomUserView(View):
+    """
+    Асинхронная версия RandomUserView для запуска под ASGI (uvicorn).
+    Поддерживает ?format=compact, ?strategy=, ?domain= и ?session=.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        strategy = request.GET.get("strategy", settings.USER_SELECTION_STRATEGY)
+        if strategy not in STRATEGIES:
+            return JsonResponse({"strategy": [f"Допустимые значения: {', '.join(STRATEGIES)}."]}, status=400)
+        domain = request.GET.get("domain")
+        if domain is not None:
+            domain = normalize_domain(domain)
+            if domain is None:
+                return JsonResponse({"domain": ["Ожидается домен или URL сайта."]}, status=400)
+        session = request.GET.get("session")
+        if session is not None and not 0 < len(session) <= 256:
+            return JsonResponse({"session": ["Ожидается строка длиной от 1 до 256 символов."]}, status=400)
+        compact = request.GET.get("format") == CompactJSONRenderer.format
+        try:
+            user = await apick_random_user(
+                fields=COMPACT_USER_FIELDS if compact else None, strategy=strategy, domain=domain, session=session
+            )
+        except Saturated as exc:
+            response = JsonResponse({"detail": str(exc)}, status=429)
+            response["Retry-After"] = str(exc.retry_after)
+            return response
+        if compact:
+            if user is None:
+                return JsonResponse({"message": "Нет пользователей со статусом 200"}, status=404)
+            return HttpResponse(dumps(compact_user(user)), content_type=CompactJSONRenderer.media_type)
+        if user is None:
+            return JsonResponse({"message": "Нет пользователей со статусом 200"}, status=404)
+        return JsonResponse(UserSerializer(user).data)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncUserStatusUpdateView(View):
+    """
+    Асинхронная версия UserStatusUpdateView: обновляет только статус и cooldown
+    (с полем domain — статус на этом сайте).
+    """
+
+    async def patch(self, request, pk, *args, **kwargs):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error."}, status=400)
+        serializer = UserStatusSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        try:
+            user = await User.objects.select_related("proxy", "user_agent").aget(pk=pk)
+        except User.DoesNotExist:
+            return JsonResponse({"detail": "User not found."}, status=404)
+        if "domain" in serializer.validated_data:
+            statuses = {(user.pk, serializer.validated_data["domain"]): serializer.validated_data["status"]}
+            [row] = await sync_to_async(report_domain_statuses)(statuses)
+            return JsonResponse(UserDomainStatusSerializer(row).data)
+        user.apply_status(serializer.validated_data["status"])
+        await user.asave(update_fields=User.STATUS_FIELDS)  # пул обновляется сигналом post_save
+        record_report(user.pk, user.proxy_id, user.status, serializer.validated_data.get("latency_ms"))
+        return JsonResponse(UserSerializer(user).data)
@@ -0,0 +1,97 @@
+"""
+Слепой индекс для зашифрованных URL прокси.
+
+Шифротекст Fernet случаен, поэтому искать по нему нельзя. Вместо этого рядом
+хранятся детерминированные HMAC-SHA256 от URL (url_hash) и от host:port
+(endpoint_hash) с ключом BLIND_INDEX_KEY: поиск и дедупликация сводятся к
+индексированному сравнению строк без расшифровки, а без ключа по хешу нельзя
+подобрать URL перебором.
+"""
+
+import hashlib
+import hmac
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+
+from .fields import DECRYPTION_ERROR
+
+
+@lru_cache(maxsize=4)
+def _key_bytes(key: str) -> bytes:
+    return key.encode()
+
+
+def blind_index_key() -> bytes:
+    key = getattr(settings, "BLIND_INDEX_KEY", None)
+    if not key:
+        raise ImproperlyConfigured(
+            "BLIND_INDEX_KEY не задан: без него нельзя вычислить url_hash и endpoint_hash прокси. "
+            "После смены ключа выполните manage.py rebuild_proxy_index."
+        )
+    return _key_bytes(key)
+
+
+def keyed_hash(value: str) -> str:
+    return hmac.new(blind_index_key(), value.encode(), hashlib.sha256).hexdigest()
+
+
+def hash_url(url: str) -> str:
+    if url:
+        return keyed_hash(url)
+    else:
+        return None
+
+
+def parse_endpoint(value: str):
+    """
+    (host, port) из URL прокси или строки host:port; None, если порт не указан.
+    """
+    try:
+        parts = urlsplit(value if "://" in value else f"//{value}")
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        return None
+    if not host or port is None:
+        return None
+    return host, port
+
+
+def hash_endpoint(value: str) -> str:
+    """
+    Хеш адреса прокси без схемы и логина: все прокси одного host:port имеют одинаковый хеш.
+    """
+    endpoint = parse_endpoint(value) if value else None
+    if endpoint is None:
+        return None
+    host, port = endpoint
+    return keyed_hash(f"{host.lower()}:{port}")
+
+
+def backfill_hashes(proxy_model, batch_size=1000, using="default"):
+    """
+    Пересчитывает url_hash и endpoint_hash всех прокси пачками по batch_size.
+
+    Нужен после добавления индекса и после смены BLIND_INDEX_KEY. Каждая пачка
+    расшифровывается и записывается одним executemany в своей транзакции,
+    поэтому таблица не блокируется целиком; нерасшифрованные строки пропускаются.
+    Возвращает количество обновлённых строк.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(proxy_model._meta.db_table)
+    sql = f"UPDATE {table} SET url_hash = %s, endpoint_hash = %s WHERE id = %s"
+    queryset = proxy_model.objects.using(using).filter(url__isnull=False).order_by("pk")
+    updated = 0
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_id).values_list("pk", "url")[:batch_size])
+        if not rows:
+            return updated
+        last_id = rows[-1][0]
+        params = [(hash_url(url), hash_endpoint(url), proxy_id) for proxy_id, url in rows if url != DECRYPTION_ERROR]
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+        updated += len(params)
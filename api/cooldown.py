@@ -0,0 +1,37 @@
+import random
+
+from django.conf import settings
+from django.utils import timezone
+
+HEALTHY_STATUS = 200
+
+
+def cooldown_statuses():
+    """
+    Статусы, после которых пользователь уходит на cooldown, а не выключается навсегда.
+    """
+    return set(getattr(settings, "USER_COOLDOWN_STATUSES", [429]))
+
+
+def available_statuses():
+    """
+    Статусы, при которых пользователь может быть выдан клиенту (после окончания cooldown).
+    """
+    return {HEALTHY_STATUS, *cooldown_statuses()}
+
+
+def cooldown_delay(failures):
+    """
+    Длительность cooldown в секундах после failures неудач подряд:
+    экспоненциальный рост от базовой задержки с потолком и случайным разбросом (jitter).
+    """
+    base = getattr(settings, "USER_COOLDOWN_BASE_SECONDS", 60)
+    maximum = getattr(settings, "USER_COOLDOWN_MAX_SECONDS", 6 * 60 * 60)
+    jitter = getattr(settings, "USER_COOLDOWN_JITTER", 0.2)
+    delay = min(maximum, base * 2 ** max(0, failures - 1))
+    return delay * random.uniform(1 - jitter, 1 + jitter)
+
+
+def next_available_at(failures, now=None):
+    now = now or timezone.now()
+    return now + timezone.timedelta(seconds=cooldown_delay(failures))
@@ -0,0 +1,159 @@
+"""
+Статусы пользователей по целевым сайтам (доменам).
+
+Пул домена хранит не доступных пользователей, а только тех, кто для этого сайта
+заблокирован (статус не из доступных или cooldown), с моментом освобождения.
+Выбор для домена берёт кандидата из общего пула и отбрасывает заблокированных,
+поэтому стоимость выбора и память растут с числом блокировок, а не с числом
+доменов × числом пользователей. Пулы доменов загружаются лениво одним
+индексированным запросом, обновляются по сообщениям о статусах и вытесняются
+по LRU, когда доменов больше USER_DOMAIN_POOLS_MAX.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .cooldown import available_statuses
+
+
+def normalize_domain(value):
+    """
+    Домен в нижнем регистре из строки домена или URL; None, если это не домен.
+    """
+    value = (value or "").strip()
+    try:
+        host = urlsplit(value if "://" in value else f"//{value}").hostname
+        host = (host or "").rstrip(".").encode("idna").decode()
+    except (ValueError, UnicodeError):
+        return None
+    if not host or len(host) > 253:
+        return None
+    return host
+
+
+def blocked_for_domain(domain, now=None):
+    """
+    Queryset статусов пользователей, которых нельзя выдавать для сайта domain прямо сейчас.
+    """
+    from .models import UserDomainStatus
+
+    now = now or timezone.now()
+    return UserDomainStatus.objects.filter(domain=domain).filter(
+        ~Q(status__in=available_statuses()) | Q(next_available_at__gt=now)
+    )
+
+
+class DomainPool:
+    """
+    Пользователи, заблокированные для одного сайта: ID → момент освобождения
+    (timestamp; inf — до сообщения о статусе 200).
+    """
+
+    def __init__(self, domain):
+        self.domain = domain
+        self._blocked = {}
+        self._lock = threading.Lock()
+        self.loaded_at = None
+
+    def load(self):
+        now = timezone.now()
+        blocked = {}
+        for user_id, status, until in blocked_for_domain(self.domain, now).values_list(
+            "user_id", "status", "next_available_at"
+        ):
+            blocked[user_id] = until.timestamp() if status in available_statuses() else math.inf
+        with self._lock:
+            self._blocked = blocked
+            self.loaded_at = time.monotonic()
+
+    def update(self, user_id, status, until=None):
+        """
+        Синхронизирует пул с новым статусом пользователя на сайте.
+        """
+        with self._lock:
+            if status not in available_statuses():
+                self._blocked[user_id] = math.inf
+            elif until is not None and until > timezone.now():
+                self._blocked[user_id] = until.timestamp()
+            else:
+                self._blocked.pop(user_id, None)
+
+    def blocks(self, user_id):
+        until = self._blocked.get(user_id)
+        if until is None:
+            return False
+        if until <= time.time():
+            with self._lock:
+                self._blocked.pop(user_id, None)
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._blocked)
+
+
+class DomainPools:
+    """
+    Кэш пулов доменов в памяти процесса с вытеснением давно не использованных.
+    """
+
+    def __init__(self, max_domains=None, refresh_interval=None):
+        self._max_domains = max_domains
+        self._refresh_interval = refresh_interval
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_domains(self):
+        if self._max_domains is not None:
+            return self._max_domains
+        return getattr(settings, "USER_DOMAIN_POOLS_MAX", 1000)
+
+    @property
+    def refresh_interval(self):
+        if self._refresh_interval is not None:
+            return self._refresh_interval
+        return getattr(settings, "USER_POOL_REFRESH_SECONDS", 300)
+
+    def get(self, domain):
+        """
+        Пул домена; загружается при первом обращении и раз в refresh_interval секунд.
+        """
+        with self._lock:
+            pool = self._pools.get(domain)
+            if pool is None:
+                pool = self._pools[domain] = DomainPool(domain)
+                while len(self._pools) > self.max_domains:
+                    self._pools.popitem(last=False)
+            self._pools.move_to_end(domain)
+        if pool.loaded_at is None or time.monotonic() - pool.loaded_at > self.refresh_interval:
+            pool.load()
+        return pool
+
+    def update(self, domain, user_id, status, until=None):
+        """
+        Обновляет пул домена, если он загружен; незагруженный прочитает статус из базы.
+        """
+        pool = self._pools.get(domain)
+        if pool is not None:
+            pool.update(user_id, status, until)
+
+    def clear(self):
+        with self._lock:
+            self._pools.clear()
+
+    def __contains__(self, domain):
+        return domain in self._pools
+
+    def __len__(self):
+        return len(self._pools)
+
+
+domain_pools = DomainPools()
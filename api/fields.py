@@ -1,28 +1,130 @@
-from cryptography.fernet import Fernet, InvalidToken
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from django.conf import settings
 from django.db import models
 
 from logger import logger
 
+from .metrics import DECRYPTION_ERRORS
+
 ENCRYPTED_PREFIX = "enc:"
+# Значение поля, которое не удалось расшифровать ни одним ключом
+DECRYPTION_ERROR = "(Decryption Error)"
+
+
+@lru_cache(maxsize=8)
+def get_cipher_for_key(key: str) -> Fernet:
+    """
+    Возвращает закешированный объект Fernet для ключа.
+    """
+    return Fernet(key.encode())
+
+
+@lru_cache(maxsize=8)
+def get_cipher_for_keys(keys: tuple) -> MultiFernet:
+    """
+    Возвращает закешированный MultiFernet: шифрует первым ключом, расшифровывает любым.
+    """
+    return MultiFernet([get_cipher_for_key(key) for key in keys])
+
+
+def encryption_keys() -> tuple:
+    """
+    Действующие ключи: CRYPTOGRAPHY_KEY и предыдущие ключи из CRYPTOGRAPHY_KEYS.
+    """
+    primary = settings.CRYPTOGRAPHY_KEY
+    return (primary, *(key for key in getattr(settings, "CRYPTOGRAPHY_KEYS", ()) if key != primary))
+
+
+class DecryptionCache:
+    """
+    Потокобезопасный LRU-кеш расшифрованных значений с ограничением размера и TTL.
+
+    Записи хранятся по паре (набор ключей шифрования, шифротекст), поэтому после
+    удаления ключа ранее расшифрованные им значения никогда не будут возвращены.
+    """
+
+    def __init__(self, maxsize=10_000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if self.ttl is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+decryption_cache = DecryptionCache(
+    maxsize=getattr(settings, "ENCRYPTED_FIELD_CACHE_SIZE", 10_000),
+    ttl=getattr(settings, "ENCRYPTED_FIELD_CACHE_TTL", 3600),
+)
 
 
 class EncryptedCharField(models.CharField):
     """
     Кастомное поле, которое автоматически шифрует и дешифрует значения,
     с защитой от повторного шифрования и безопасной дешифровкой.
+    Расшифрованные значения кешируются в decryption_cache.
     """
 
     def get_cipher(self):
         """
-        Создаёт объект Fernet на лету.
+        Возвращает закешированный MultiFernet для действующих ключей.
         """
-        return Fernet(settings.CRYPTOGRAPHY_KEY.encode())
+        return get_cipher_for_keys(encryption_keys())
 
     def get_prep_value(self, value):
         """
         Шифрует значение перед сохранением в базу данных.
         """
+        # Уже зашифрованные значения (например, из пакетного импорта) не должны
+        # проходить через to_python: он расшифровал бы их для повторного шифрования
+        if isinstance(value, str) and value.startswith(ENCRYPTED_PREFIX):
+            return value
         value = super().get_prep_value(value)
 
         if value is None:
@@ -32,13 +134,37 @@ class EncryptedCharField(models.CharField):
             try:
                 cipher = self.get_cipher()
                 encrypted = cipher.encrypt(value.encode()).decode()
-                return f"{ENCRYPTED_PREFIX}{encrypted}"
             except Exception as e:
                 logger.error(f"Encryption error in get_prep_value: {e}")
                 raise e
+            # Сразу кладём значение в кеш: только что сохранённая запись будет прочитана без расшифровки
+            decryption_cache.set((encryption_keys(), encrypted), value)
+            return f"{ENCRYPTED_PREFIX}{encrypted}"
 
         return value
 
+    def decrypt(self, value, source):
+        """
+        Дешифрует значение с префиксом ENCRYPTED_PREFIX, используя кеш.
+        """
+        encrypted_part = value[len(ENCRYPTED_PREFIX) :]
+        try:
+            cache_key = (encryption_keys(), encrypted_part)
+            decrypted = decryption_cache.get(cache_key)
+            if decrypted is None:
+                cipher = self.get_cipher()
+                decrypted = cipher.decrypt(encrypted_part.encode()).decode()
+                decryption_cache.set(cache_key, decrypted)
+            return decrypted
+        except InvalidToken:
+            logger.error(f"Invalid token during decryption in {source}", extra={"sample": "decryption_error"})
+            DECRYPTION_ERRORS.labels(source).inc()
+            return DECRYPTION_ERROR
+        except Exception as e:
+            logger.error(f"Decryption error in {source}: {e}", extra={"sample": "decryption_error"})
+            DECRYPTION_ERRORS.labels(source).inc()
+            return DECRYPTION_ERROR
+
     def from_db_value(self, value, expression, connection):
         """
         Дешифрует значение при извлечении из базы данных.
@@ -47,16 +173,7 @@ class EncryptedCharField(models.CharField):
             return value
 
         if value.startswith(ENCRYPTED_PREFIX):
-            encrypted_part = value[len(ENCRYPTED_PREFIX) :]
-            try:
-                cipher = self.get_cipher()
-                return cipher.decrypt(encrypted_part.encode()).decode()
-            except InvalidToken:
-                logger.error("Invalid token during decryption in from_db_value")
-                return "(Decryption Error)"
-            except Exception as e:
-                logger.error(f"Decryption error in from_db_value: {e}")
-                return "(Decryption Error)"
+            return self.decrypt(value, "from_db_value")
         return value  # Уже дешифровано или незашифровано
 
     def to_python(self, value):
@@ -67,14 +184,5 @@ class EncryptedCharField(models.CharField):
             return value
 
         if value.startswith(ENCRYPTED_PREFIX):
-            encrypted_part = value[len(ENCRYPTED_PREFIX) :]
-            try:
-                cipher = self.get_cipher()
-                return cipher.decrypt(encrypted_part.encode()).decode()
-            except InvalidToken:
-                logger.error("Invalid token during decryption in to_python")
-                return "(Decryption Error)"
-            except Exception as e:
-                logger.error(f"Decryption error in to_python: {e}")
-                return "(Decryption Error)"
+            return self.decrypt(value, "to_python")
         return value  # Уже расшифровано или это обычное значение
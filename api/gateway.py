@@ -0,0 +1,455 @@
+"""
+Шлюз — прямой HTTP-прокси поверх пула пользователей.
+
+Скрейпер указывает шлюз как обычный HTTP-прокси. На каждый запрос шлюз выбирает
+пользователя из пула (как /random-user/), подставляет его User-Agent, отправляет
+запрос через прокси пользователя и сам сообщает код ответа (как PATCH статуса),
+поэтому клиенту не нужны два лишних запроса к API.
+
+- Запросы с абсолютным URL (GET http://...) пересылаются с заменой User-Agent;
+  соединения с прокси остаются открытыми (keep-alive) и переиспользуются.
+- CONNECT (HTTPS) строит туннель через прокси пользователя. Внутри туннеля TLS,
+  поэтому подставить User-Agent и узнать код ответа сайта нельзя: сообщается
+  только отказ прокси построить туннель.
+
+Сессия (см. api/affinity.py) задаётся заголовком X-Proxy-Session или логином
+в Proxy-Authorization; пароль сверяется с GATEWAY_TOKEN, если он задан.
+Статусы копятся и записываются пачкой раз в GATEWAY_REPORT_SECONDS.
+"""
+
+import asyncio
+import base64
+import hmac
+import time
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from logger import logger
+
+from .cooldown import HEALTHY_STATUS, cooldown_statuses
+from .domains import normalize_domain
+from .pool import apick_random_user
+from .ratelimit import Saturated
+from .serializers import COMPACT_USER_FIELDS
+from .services import report_domain_statuses, report_statuses
+from .upstream import HTTP_SCHEMES, UpstreamError, open_proxy, proxy_authorization, proxy_endpoint, tunnel
+
+# Заголовки одного соединения: клиенту и прокси пользователя они не пересылаются
+HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "proxy-authorization",
+    "proxy-authenticate",
+    "te",
+    "trailer",
+    "upgrade",
+    "x-proxy-session",
+}
+UPSTREAM_ERRORS = (OSError, TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, UpstreamError)
+
+
+def parse_head(head):
+    """
+    Разбирает заголовок HTTP-сообщения на стартовую строку и список пар (имя, значение).
+    """
+    lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+def get_header(headers, name):
+    name = name.lower()
+    return next((value for key, value in headers if key.lower() == name), None)
+
+
+def build_head(start, headers):
+    return (start + "\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers) + "\r\n").encode("latin-1")
+
+
+def error_response(status, reason, headers=()):
+    return build_head(f"HTTP/1.1 {status} {reason}", [*headers, ("Content-Length", "0"), ("Connection", "close")])
+
+
+async def relay_body(reader, writer, headers, until_close=False):
+    """
+    Пересылает тело сообщения: chunked, по Content-Length или (ответ без длины) до закрытия соединения.
+    Возвращает False, если после тела соединение нельзя использовать повторно.
+    """
+    if "chunked" in (get_header(headers, "Transfer-Encoding") or "").lower():
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            writer.write(line)
+            size = int(line.split(b";", 1)[0], 16)
+            if size == 0:
+                while line != b"\r\n":
+                    line = await reader.readuntil(b"\r\n")
+                    writer.write(line)
+                break
+            writer.write(await reader.readexactly(size + 2))
+            await writer.drain()
+        await writer.drain()
+        return True
+    length = get_header(headers, "Content-Length")
+    if length is not None:
+        remaining = int(length)
+        while remaining:
+            chunk = await reader.read(min(remaining, 65536))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            writer.write(chunk)
+            await writer.drain()
+            remaining -= len(chunk)
+        return True
+    if until_close:
+        while chunk := await reader.read(65536):
+            writer.write(chunk)
+            await writer.drain()
+        return False
+    return True
+
+
+async def pipe(reader, writer):
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class UpstreamPool:
+    """
+    Простаивающие keep-alive соединения с прокси пользователей по ключу
+    (URL прокси, а для SOCKS — ещё и адрес сайта, к которому построен туннель).
+    """
+
+    def __init__(self, max_idle=None, idle_timeout=None):
+        self.max_idle = max_idle or getattr(settings, "GATEWAY_MAX_IDLE_PER_PROXY", 8)
+        self.idle_timeout = idle_timeout or getattr(settings, "GATEWAY_IDLE_TIMEOUT_SECONDS", 30)
+        self._idle = {}
+
+    def acquire(self, key):
+        connections = self._idle.get(key)
+        now = time.monotonic()
+        while connections:
+            reader, writer, released_at = connections.pop()
+            if writer.is_closing() or reader.at_eof() or now - released_at > self.idle_timeout:
+                writer.close()
+                continue
+            if not connections:
+                del self._idle[key]
+            return reader, writer
+        self._idle.pop(key, None)
+        return None
+
+    def release(self, key, reader, writer):
+        connections = self._idle.setdefault(key, [])
+        if len(connections) >= self.max_idle:
+            writer.close()
+            return
+        connections.append((reader, writer, time.monotonic()))
+
+    def close(self):
+        for connections in self._idle.values():
+            for _, writer, _ in connections:
+                writer.close()
+        self._idle.clear()
+
+    def __len__(self):
+        return sum(len(connections) for connections in self._idle.values())
+
+
+class StatusReporter:
+    """
+    Копит коды ответов и записывает их пачкой: report_statuses для общих статусов
+    (с оценками здоровья, как PATCH статуса), report_domain_statuses — для статусов на сайтах.
+    Неудачей пользователя считаются только коды, говорящие о проблеме прокси
+    (GATEWAY_FAILURE_STATUSES и статусы cooldown), остальные записываются как 200;
+    из нескольких кодов одного пользователя за интервал записывается последний.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, "GATEWAY_REPORT_SECONDS", 0.5)
+        self.statuses = {}
+        self.latencies = {}
+        self.domain_statuses = {}
+
+    def add(self, user_id, status, latency_ms=None, domain=None):
+        # 404 или 500 от сайта не говорят ничего о прокси: без этого одна плохая страница
+        # навсегда выключала бы пару прокси × User-Agent
+        if status not in {*getattr(settings, "GATEWAY_FAILURE_STATUSES", [403, 407]), *cooldown_statuses()}:
+            status = HEALTHY_STATUS
+        if domain is not None:
+            self.domain_statuses[(user_id, domain)] = status
+            return
+        self.statuses[user_id] = status
+        if latency_ms is not None:
+            self.latencies[user_id] = latency_ms
+
+    def write(self, statuses, latencies, domain_statuses):
+        close_old_connections()
+        if statuses:
+            report_statuses(statuses, latencies=latencies)
+        if domain_statuses:
+            report_domain_statuses(domain_statuses)
+
+    async def flush(self):
+        statuses, latencies, domain_statuses = self.statuses, self.latencies, self.domain_statuses
+        self.statuses, self.latencies, self.domain_statuses = {}, {}, {}
+        if not statuses and not domain_statuses:
+            return 0
+        try:
+            await sync_to_async(self.write)(statuses, latencies, domain_statuses)
+        except Exception:
+            # Возвращаем незаписанное, не затирая коды, пришедшие во время записи
+            self.statuses = {**statuses, **self.statuses}
+            self.latencies = {**latencies, **self.latencies}
+            self.domain_statuses = {**domain_statuses, **self.domain_statuses}
+            raise
+        return len(statuses) + len(domain_statuses)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи статусов шлюза: {e}")
+
+    def __len__(self):
+        return len(self.statuses) + len(self.domain_statuses)
+
+
+class Gateway:
+    """
+    Прямой HTTP-прокси, пересылающий запросы через пользователей пула (см. описание модуля).
+    """
+
+    def __init__(self, token=None, domain_statuses=None, timeout=None, upstreams=None, reporter=None):
+        self.token = token if token is not None else getattr(settings, "GATEWAY_TOKEN", "")
+        if domain_statuses is None:
+            domain_statuses = getattr(settings, "GATEWAY_DOMAIN_STATUSES", False)
+        self.domain_statuses = domain_statuses
+        self.timeout = timeout or getattr(settings, "GATEWAY_TIMEOUT_SECONDS", 30)
+        self.upstreams = upstreams if upstreams is not None else UpstreamPool()
+        self.reporter = reporter if reporter is not None else StatusReporter()
+        self._reporter_task = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Начинает принимать соединения и возвращает asyncio-сервер.
+        """
+        self._reporter_task = asyncio.create_task(self.reporter.run())
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def close(self):
+        """
+        Останавливает запись статусов, дописывает накопленные и закрывает соединения с прокси.
+        """
+        if self._reporter_task is not None:
+            self._reporter_task.cancel()
+            self._reporter_task = None
+        await self.reporter.flush()
+        self.upstreams.close()
+
+    def authenticate(self, headers):
+        """
+        Возвращает (авторизован ли клиент, сессия из логина Proxy-Authorization).
+        """
+        session = password = None
+        value = get_header(headers, "Proxy-Authorization") or ""
+        scheme, _, credentials = value.partition(" ")
+        if scheme.lower() == "basic":
+            try:
+                session, _, password = base64.b64decode(credentials).decode().partition(":")
+            except ValueError:
+                return False, None
+        if self.token and not hmac.compare_digest((password or "").encode(), self.token.encode()):
+            return False, None
+        return True, session or None
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                if not await self.handle_request(reader, writer, head):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader, writer, head):
+        """
+        Обрабатывает один запрос клиента; False — соединение с клиентом нужно закрыть.
+        """
+        start, headers = parse_head(head)
+        try:
+            method, target, version = start.split(" ", 2)
+        except ValueError:
+            writer.write(error_response(400, "Bad Request"))
+            return False
+        authorized, session = self.authenticate(headers)
+        if not authorized:
+            writer.write(error_response(407, "Proxy Authentication Required", [("Proxy-Authenticate", "Basic")]))
+            return False
+        session = get_header(headers, "X-Proxy-Session") or session
+        if session is not None and len(session) > 256:
+            writer.write(error_response(400, "Bad Request"))
+            return False
+
+        if method == "CONNECT":
+            host, _, port = target.rpartition(":")
+        else:
+            url = urlsplit(target)
+            if url.scheme != "http" or not url.hostname:
+                # HTTPS-сайты запрашиваются через CONNECT, прямые запросы к шлюзу не обслуживаются
+                writer.write(error_response(400, "Bad Request"))
+                return False
+            host, port = url.hostname, url.port or 80
+        if not host or not str(port).isdigit():
+            writer.write(error_response(400, "Bad Request"))
+            return False
+        domain = normalize_domain(host.strip("[]")) if self.domain_statuses else None
+
+        try:
+            user = await apick_random_user(
+                fields=COMPACT_USER_FIELDS, strategy=settings.USER_SELECTION_STRATEGY, domain=domain, session=session
+            )
+        except Saturated as exc:
+            writer.write(error_response(429, "Too Many Requests", [("Retry-After", str(exc.retry_after))]))
+            return False
+        if user is None:
+            writer.write(error_response(503, "Service Unavailable"))
+            return False
+
+        if method == "CONNECT":
+            await self.connect(reader, writer, user, host.strip("[]"), int(port), domain)
+            return False
+        keep_alive = version == "HTTP/1.1" and "close" not in (get_header(headers, "Connection") or "").lower()
+        return await self.forward(reader, writer, method, url, version, headers, user, domain) and keep_alive
+
+    async def open_upstream(self, proxy_url, host, port, connect):
+        """
+        Открывает соединение с прокси пользователя (с https://-прокси — по TLS). Через SOCKS
+        туннель к host:port строится всегда, через HTTP-прокси — только при connect.
+        """
+        proxy, proxy_host, proxy_port = proxy_endpoint(proxy_url)
+        reader, writer = await open_proxy(proxy, proxy_host, proxy_port)
+        try:
+            if connect or proxy.scheme not in HTTP_SCHEMES:
+                await tunnel(reader, writer, proxy, host, port)
+        except BaseException:
+            writer.close()
+            raise
+        return proxy, reader, writer
+
+    async def connect(self, client_reader, client_writer, user, host, port, domain):
+        user_id, proxy_url, _ = user
+        try:
+            async with asyncio.timeout(self.timeout):
+                _, reader, writer = await self.open_upstream(proxy_url, host, port, connect=True)
+        except UPSTREAM_ERRORS as e:
+            if getattr(e, "status", None):
+                self.reporter.add(user_id, e.status, domain=domain)
+            logger.warning(f"Шлюз: не удалось построить туннель к {host}:{port} через пользователя {user_id}: {e}")
+            client_writer.write(error_response(502, "Bad Gateway"))
+            return
+        client_writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        await client_writer.drain()
+        await asyncio.gather(pipe(client_reader, writer), pipe(reader, client_writer))
+
+    async def forward(self, client_reader, client_writer, method, url, version, headers, user, domain):
+        """
+        Пересылает запрос с абсолютным URL через прокси пользователя и возвращает ответ клиенту.
+        Возвращает False, если соединение с клиентом нужно закрыть.
+        """
+        user_id, proxy_url, agent = user
+        if "chunked" in (get_header(headers, "Transfer-Encoding") or "").lower():
+            client_writer.write(error_response(411, "Length Required"))
+            return False
+        length = int(get_header(headers, "Content-Length") or 0)
+        body = await client_reader.readexactly(length) if length else b""
+
+        host, port = url.hostname, url.port or 80
+        socks = proxy_url.startswith("socks")
+        outgoing = [(name, value) for name, value in headers if name.lower() not in (*HOP_HEADERS, "user-agent")]
+        if get_header(outgoing, "Host") is None:
+            outgoing.insert(0, ("Host", url.netloc))
+        outgoing += [("User-Agent", agent), ("Connection", "keep-alive")]
+        if socks:
+            path = (url.path or "/") + (f"?{url.query}" if url.query else "")
+            key = (proxy_url, host, port)
+            authorization = b""
+        else:
+            # HTTP-прокси получает запрос с абсолютным URL, как от обычного клиента
+            path = url.geturl()
+            key = proxy_url
+            authorization = proxy_authorization(urlsplit(proxy_url))
+        request = build_head(f"{method} {path} HTTP/1.1", outgoing)[:-2] + authorization + b"\r\n" + body
+
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                reader, writer, response = await self.send(key, proxy_url, host, port, request)
+        except UPSTREAM_ERRORS as e:
+            if getattr(e, "status", None):
+                self.reporter.add(user_id, e.status, domain=domain)
+            logger.warning(f"Шлюз: запрос к {url.netloc} через пользователя {user_id} не удался: {e}")
+            client_writer.write(error_response(502, "Bad Gateway"))
+            return False
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        status_line, response_headers = parse_head(response)
+        status = int(status_line.split(" ", 2)[1])
+        self.reporter.add(user_id, status, latency_ms, domain=domain)
+        client_writer.write(response)
+        reusable = True
+        try:
+            if method != "HEAD" and status >= 200 and status not in (204, 304):
+                reusable = await relay_body(reader, client_writer, response_headers, until_close=True)
+            await client_writer.drain()
+        except UPSTREAM_ERRORS:
+            writer.close()
+            return False
+        if reusable and "close" not in (get_header(response_headers, "Connection") or "").lower():
+            self.upstreams.release(key, reader, writer)
+            return True
+        writer.close()
+        return reusable
+
+    async def send(self, key, proxy_url, host, port, request):
+        """
+        Отправляет запрос по свободному соединению из пула или по новому и читает заголовок ответа.
+        """
+        connection = self.upstreams.acquire(key)
+        if connection is not None:
+            reader, writer = connection
+            try:
+                writer.write(request)
+                await writer.drain()
+                return reader, writer, await reader.readuntil(b"\r\n\r\n")
+            except (OSError, asyncio.IncompleteReadError):
+                # Прокси мог закрыть простаивавшее соединение: повторяем по новому
+                writer.close()
+        _, reader, writer = await self.open_upstream(proxy_url, host, port, connect=False)
+        try:
+            writer.write(request)
+            await writer.drain()
+            return reader, writer, await reader.readuntil(b"\r\n\r\n")
+        except BaseException:
+            writer.close()
+            raise
@@ -0,0 +1,174 @@
+import asyncio
+import ssl
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from logger import logger
+
+from .models import Proxy
+from .pool import healthy_pool
+from .upstream import (
+    HTTP_SCHEMES,
+    UpstreamError,
+    open_proxy,
+    proxy_authorization,
+    proxy_endpoint,
+    read_status,
+    split_endpoint,
+    tunnel,
+)
+
+
+@dataclass
+class CheckResult:
+    proxy_id: int
+    ok: bool
+    latency_ms: float = None
+    error: str = ""
+
+
+async def probe(proxy_url, target_url, timeout):
+    """
+    Запрашивает target_url через прокси и возвращает код ответа и задержку в мс.
+
+    HTTP-цель через HTTP-прокси запрашивается обычным GET с абсолютным URL,
+    в остальных случаях сначала строится туннель (CONNECT, SOCKS5 или SOCKS4),
+    для HTTPS-цели внутри туннеля поднимается TLS. С https://-прокси
+    соединение с самим прокси тоже идёт по TLS.
+    """
+    proxy, proxy_host, proxy_port = proxy_endpoint(proxy_url)
+    target, host, port = split_endpoint(target_url, 443 if target_url.startswith("https") else 80)
+    path = target.path or "/"
+    if target.query:
+        path = f"{path}?{target.query}"
+
+    started = time.perf_counter()
+    async with asyncio.timeout(timeout):
+        reader, writer = await open_proxy(proxy, proxy_host, proxy_port)
+        try:
+            if proxy.scheme in HTTP_SCHEMES and target.scheme == "http":
+                request_line = f"GET {target_url} HTTP/1.1\r\n".encode()
+                extra = proxy_authorization(proxy)
+            else:
+                await tunnel(reader, writer, proxy, host, port)
+                if target.scheme == "https":
+                    await writer.start_tls(ssl.create_default_context(), server_hostname=host)
+                request_line = f"GET {path} HTTP/1.1\r\n".encode()
+                extra = b""
+            writer.write(
+                request_line
+                + f"Host: {target.netloc}\r\nConnection: close\r\nUser-Agent: proxy-manager-healthcheck\r\n".encode()
+                + extra
+                + b"\r\n"
+            )
+            await writer.drain()
+            status = await read_status(reader)
+        finally:
+            writer.close()
+    return status, (time.perf_counter() - started) * 1000
+
+
+async def check_proxy(proxy_id, proxy_url, target_url, timeout):
+    try:
+        status, latency_ms = await probe(proxy_url, target_url, timeout)
+    except TimeoutError:
+        return CheckResult(proxy_id, False, error="timeout")
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, UpstreamError, ValueError) as e:
+        return CheckResult(proxy_id, False, error=str(e) or type(e).__name__)
+    if 200 <= status < 400:
+        return CheckResult(proxy_id, True, latency_ms)
+    return CheckResult(proxy_id, False, latency_ms, error=f"HTTP {status}")
+
+
+async def check_many(proxies, target_url, concurrency, timeout):
+    """
+    Проверяет пары (ID, URL) не более чем concurrency соединениями одновременно.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(proxy_id, proxy_url):
+        async with semaphore:
+            return await check_proxy(proxy_id, proxy_url, target_url, timeout)
+
+    return await asyncio.gather(*(limited(proxy_id, proxy_url) for proxy_id, proxy_url in proxies))
+
+
+def save_results(results, now=None):
+    """
+    Записывает результаты проверки и возвращает количество прокси, сменивших состояние.
+
+    Состояние меняется несколькими UPDATE на всю пачку, задержки успешных
+    проверок пишутся одним executemany: bulk_update на десятках тысяч строк
+    строит огромные выражения CASE и работает на порядок медленнее.
+    """
+    now = now or timezone.now()
+    max_failures = getattr(settings, "HEALTHCHECK_MAX_FAILURES", 2)
+    ok = [result for result in results if result.ok]
+    failed_ids = [result.proxy_id for result in results if not result.ok]
+
+    with transaction.atomic():
+        changed = 0
+        if ok:
+            ok_ids = [result.proxy_id for result in ok]
+            changed += Proxy.objects.filter(pk__in=ok_ids, is_alive=False).update(is_alive=True)
+            Proxy.objects.filter(pk__in=ok_ids).update(check_failures=0, last_checked_at=now, last_success_at=now)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {connection.ops.quote_name(Proxy._meta.db_table)} SET latency_ms = %s WHERE id = %s",
+                    [(result.latency_ms, result.proxy_id) for result in ok],
+                )
+        if failed_ids:
+            Proxy.objects.filter(pk__in=failed_ids).update(
+                check_failures=F("check_failures") + 1, last_checked_at=now, latency_ms=None
+            )
+            # Прокси выключается только после нескольких неудачных проверок подряд
+            changed += Proxy.objects.filter(pk__in=failed_ids, is_alive=True, check_failures__gte=max_failures).update(
+                is_alive=False
+            )
+    return changed
+
+
+def run_health_check(
+    queryset=None, target_url=None, concurrency=None, timeout=None, chunk_size=None, pool=healthy_pool
+):
+    """
+    Проверяет все прокси из queryset (по умолчанию все) пачками по chunk_size.
+
+    Пачка читается из базы, проверяется в одном цикле asyncio и записывается
+    несколькими UPDATE и одним executemany (см. save_results), поэтому в памяти одновременно находится только одна пачка.
+    Возвращает словарь со счётчиками проверенных, живых и сменивших состояние прокси.
+    """
+    queryset = queryset if queryset is not None else Proxy.objects.all()
+    target_url = target_url or settings.HEALTHCHECK_TARGET_URL
+    concurrency = concurrency or getattr(settings, "HEALTHCHECK_CONCURRENCY", 500)
+    timeout = timeout or getattr(settings, "HEALTHCHECK_TIMEOUT_SECONDS", 5)
+    chunk_size = chunk_size or getattr(settings, "HEALTHCHECK_CHUNK_SIZE", 10_000)
+
+    started = time.perf_counter()
+    stats = {"checked": 0, "alive": 0, "changed": 0}
+    last_id = 0
+    while True:
+        chunk = list(
+            queryset.filter(pk__gt=last_id, url__isnull=False).order_by("pk").values_list("pk", "url")[:chunk_size]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        results = asyncio.run(check_many(chunk, target_url, concurrency, timeout))
+        stats["checked"] += len(results)
+        stats["alive"] += sum(result.ok for result in results)
+        stats["changed"] += save_results(results)
+
+    if stats["changed"]:
+        # Пул этого процесса перечитается с учётом новых мёртвых и оживших прокси
+        pool.clear()
+    logger.info(
+        f"Проверено {stats['checked']} прокси за {time.perf_counter() - started:.1f} с: "
+        f"работают {stats['alive']}, сменили состояние {stats['changed']}."
+    )
+    return stats
@@ -0,0 +1,302 @@
+import abc
+import csv
+import io
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from urllib.parse import urlsplit
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from logger import logger
+
+from .fields import ENCRYPTED_PREFIX, decryption_cache, encryption_keys
+from .models import Proxy, UserAgent, hash_endpoint, hash_url
+from .pairing import pair_users
+
+FORMATS = ("text", "csv", "jsonl")
+PROXY_SCHEMES = ("http", "https", "socks4", "socks5", "socks5h")
+
+
+@dataclass
+class ImportResult:
+    """
+    Итог импорта: сколько строк прочитано, создано, пропущено как дубликаты и с ошибками,
+    а также сколько пользователей создано для новых записей.
+    """
+
+    total: int = 0
+    created: int = 0
+    duplicates: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    paired: int = 0
+    error_samples: list = field(default_factory=list)
+
+    @property
+    def rate(self):
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {**asdict(self), "rate": round(self.rate, 1)}
+
+
+def guess_format(filename):
+    if filename.endswith(".csv"):
+        return "csv"
+    if filename.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "text"
+
+
+def iter_records(stream, fmt, column):
+    """
+    Потоково читает записи из текстового потока.
+
+    text — одно значение на строку (пустые строки и строки с # пропускаются),
+    csv — колонка column (или первая колонка, если заголовка нет),
+    jsonl — объект с ключом column или просто строка JSON.
+    Возвращает словари {column: значение, ...}; непарсящиеся строки — None.
+    """
+    if fmt == "csv":
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        if header is None:
+            return
+        if column in header:
+            names = header
+        else:
+            names = [column, *header[1:]]
+            yield dict(zip(names, header))
+        for row in reader:
+            if row:
+                yield dict(zip(names, row))
+        return
+
+    for line in stream:
+        line = line.strip()
+        if not line or (fmt == "text" and line.startswith("#")):
+            continue
+        if fmt == "text":
+            yield {column: line}
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield item if isinstance(item, dict) else {column: item}
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def encrypt_chunk(key, values):
+    """
+    Шифрует список строк одним объектом Fernet (вызывается и в дочерних процессах).
+    """
+    cipher = Fernet(key.encode())
+    return [cipher.encrypt(value.encode()).decode() for value in values]
+
+
+def is_valid_proxy_url(url):
+    try:
+        parts = urlsplit(url)
+        return parts.scheme in PROXY_SCHEMES and bool(parts.hostname) and parts.port is not None
+    except ValueError:
+        return False
+
+
+class BaseImporter(abc.ABC):
+    """
+    Пакетный импорт: разбор, дедупликация, подготовка и вставка с пропуском конфликтов.
+    Наследники задают column, model и import_batch.
+    """
+
+    column = None
+    model = None
+
+    def __init__(self, batch_size=None, progress=None, pair=None):
+        self.batch_size = batch_size or getattr(settings, "IMPORT_BATCH_SIZE", 2000)
+        self.progress = progress
+        # Создавать ли пользователей для новых записей (см. api/pairing.py)
+        self.pair = pair if pair is not None else getattr(settings, "USER_PAIRING_ON_IMPORT", True)
+        self.result = ImportResult()
+
+    def error(self, message):
+        self.result.errors += 1
+        if len(self.result.error_samples) < 10:
+            self.result.error_samples.append(message)
+
+    def run(self, stream, fmt="text"):
+        started = time.perf_counter()
+        for batch in batched(iter_records(stream, fmt, self.column), self.batch_size):
+            self.result.total += len(batch)
+            self.import_batch(batch)
+            self.result.elapsed = time.perf_counter() - started
+            if self.progress is not None:
+                self.progress(self.result)
+        self.finish()
+        self.result.elapsed = time.perf_counter() - started
+        logger.info(
+            f"Импорт {self.model.__name__}: прочитано {self.result.total}, создано {self.result.created}, "
+            f"дубликатов {self.result.duplicates}, ошибок {self.result.errors} "
+            f"за {self.result.elapsed:.1f} с ({self.result.rate:.0f} строк/с)."
+        )
+        return self.result
+
+    @abc.abstractmethod
+    def import_batch(self, batch):
+        """
+        Проверяет и сохраняет пачку записей, обновляя self.result.
+        """
+
+    def finish(self):
+        pass
+
+
+class ProxyImporter(BaseImporter):
+    """
+    Импорт прокси: хеширование, дедупликация по url_hash и шифрование пачками,
+    при workers > 1 — в нескольких процессах.
+    """
+
+    column = "url"
+    model = Proxy
+
+    def __init__(self, batch_size=None, progress=None, pair=None, workers=None):
+        super().__init__(batch_size, progress, pair)
+        self.workers = workers or getattr(settings, "IMPORT_WORKERS", 1)
+        self.keys = encryption_keys()
+        self.key = self.keys[0]
+
+    def run(self, stream, fmt="text"):
+        self.executor = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            return super().run(stream, fmt)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+    def encrypt(self, urls):
+        if self.executor is None:
+            return encrypt_chunk(self.key, urls)
+        chunk = max(1, len(urls) // self.workers + 1)
+        encrypted = []
+        for part in self.executor.map(encrypt_chunk, [self.key] * self.workers, list(batched(urls, chunk))):
+            encrypted.extend(part)
+        return encrypted
+
+    def import_batch(self, batch):
+        rows = {}
+        for record in batch:
+            url = (record or {}).get(self.column)
+            if not isinstance(url, str) or not is_valid_proxy_url(url.strip()):
+                self.error(f"Некорректный URL прокси: {record!r}")
+                continue
+            url = url.strip()
+            expire_at = record.get("expire_at") or None
+            if expire_at is not None:
+                expire_at = parse_datetime(expire_at)
+                if expire_at is None:
+                    self.error(f"Некорректная дата expire_at: {record!r}")
+                    continue
+            url_hash = hash_url(url)
+            if url_hash in rows:
+                self.result.duplicates += 1
+                continue
+            rows[url_hash] = (url, expire_at)
+
+        existing = set(Proxy.objects.filter(url_hash__in=rows.keys()).values_list("url_hash", flat=True))
+        self.result.duplicates += len(existing)
+        new = [(url_hash, url, expire_at) for url_hash, (url, expire_at) in rows.items() if url_hash not in existing]
+        if not new:
+            return
+        encrypted = self.encrypt([url for _, url, _ in new])
+        proxies = []
+        for (url_hash, url, expire_at), token in zip(new, encrypted):
+            decryption_cache.set((self.keys, token), url)
+            proxies.append(
+                Proxy(
+                    url=f"{ENCRYPTED_PREFIX}{token}",
+                    url_hash=url_hash,
+                    endpoint_hash=hash_endpoint(url),
+                    expire_at=expire_at,
+                )
+            )
+        Proxy.objects.bulk_create(proxies, ignore_conflicts=True)
+        # ignore_conflicts молча пропускает строки, вставленные параллельным импортом с тем же URL.
+        # Шифротекст каждой строки уникален, поэтому по нему находятся только вставленные здесь
+        created = Proxy.objects.filter(url__in=[proxy.url for proxy in proxies]).count()
+        self.result.created += created
+        self.result.duplicates += len(proxies) - created
+        if self.pair:
+            self.result.paired += pair_users(
+                proxies=Proxy.objects.filter(url_hash__in=[url_hash for url_hash, *_ in new])
+            )
+
+
+class UserAgentImporter(BaseImporter):
+    """
+    Импорт строк User-Agent с дедупликацией пачками.
+    """
+
+    column = "agent"
+    model = UserAgent
+
+    def import_batch(self, batch):
+        agents = []
+        seen = set()
+        for record in batch:
+            agent = (record or {}).get(self.column)
+            if not isinstance(agent, str) or not agent.strip():
+                self.error(f"Пустой User-Agent: {record!r}")
+                continue
+            agent = agent.strip()
+            if agent in seen:
+                self.result.duplicates += 1
+                continue
+            seen.add(agent)
+            agents.append(agent)
+
+        existing = set(UserAgent.objects.filter(agent__in=agents).values_list("agent", flat=True))
+        self.result.duplicates += len(existing)
+        new = [agent for agent in agents if agent not in existing]
+        if not new:
+            return
+        # Строки, вставленные параллельным импортом после проверки выше, ON CONFLICT пропускает,
+        # а rowcount считает только вставленные этим запросом
+        table = connection.ops.quote_name(UserAgent._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (agent) VALUES (%s) ON CONFLICT (agent) DO NOTHING", [(agent,) for agent in new]
+            )
+            created = max(cursor.rowcount, 0)
+        self.result.created += created
+        self.result.duplicates += len(new) - created
+        if self.pair and created and self.policy == "all":
+            self.result.paired += pair_users(agents=UserAgent.objects.filter(agent__in=new))
+
+    @property
+    def policy(self):
+        return getattr(settings, "USER_PAIRING_POLICY", "all")
+
+    def finish(self):
+        # При политике random новые агенты нужны только прокси, которым не хватает пар
+        if self.pair and self.result.created and self.policy != "all":
+            self.result.paired += pair_users()
+
+
+def open_text(uploaded_file):
+    """
+    Оборачивает загруженный файл в текстовый поток без чтения целиком в память.
+    """
+    return io.TextIOWrapper(uploaded_file.file, encoding="utf-8", newline="")
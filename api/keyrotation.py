@@ -0,0 +1,115 @@
+import time
+from dataclasses import dataclass, field
+
+from cryptography.fernet import InvalidToken
+from django.conf import settings
+from django.db import connection, transaction
+
+from logger import logger
+
+from .fields import ENCRYPTED_PREFIX, encryption_keys, get_cipher_for_key, get_cipher_for_keys
+from .models import Proxy
+
+
+@dataclass
+class ReencryptResult:
+    """
+    Итог перешифрования: просмотрено и переписано строк, строк, не расшифрованных
+    ни одним ключом (и первые 100 их ID), ID последней обработанной строки
+    (для продолжения) и время.
+    """
+
+    scanned: int = 0
+    rewritten: int = 0
+    errors: int = 0
+    last_id: int = 0
+    elapsed: float = 0.0
+    error_ids: list = field(default_factory=list)
+
+    @property
+    def rate(self):
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "scanned": self.scanned,
+            "rewritten": self.rewritten,
+            "errors": self.errors,
+            "last_id": self.last_id,
+            "elapsed": round(self.elapsed, 3),
+            "rate": round(self.rate, 1),
+        }
+
+
+def reencrypt_value(value, primary, cipher):
+    """
+    Новое значение поля для value или None, если оно уже зашифровано основным ключом.
+    Незашифрованные значения шифруются, InvalidToken означает, что не подошёл ни один ключ.
+    """
+    if not value.startswith(ENCRYPTED_PREFIX):
+        return f"{ENCRYPTED_PREFIX}{primary.encrypt(value.encode()).decode()}"
+    token = value[len(ENCRYPTED_PREFIX) :].encode()
+    try:
+        primary.decrypt(token)
+        return None
+    except InvalidToken:
+        pass
+    return f"{ENCRYPTED_PREFIX}{cipher.rotate(token).decode()}"
+
+
+def reencrypt_proxies(start_after=0, batch_size=None, pause=0, progress=None, keys=None):
+    """
+    Перешифровывает URL прокси основным ключом (CRYPTOGRAPHY_KEY) без остановки сервиса.
+
+    Таблица обходится по возрастанию id пачками по batch_size (keyset-пагинация), каждая
+    пачка переписывается в своей короткой транзакции, поэтому таблица не блокируется,
+    а прерванный обход продолжается с start_after = result.last_id. Строки, уже
+    зашифрованные основным ключом, пропускаются, так что повторный запуск безопасен.
+    UPDATE срабатывает, только если значение не изменилось после чтения: запись,
+    сохранённая в это время через админку, уже зашифрована новым ключом.
+    """
+    keys = tuple(keys or encryption_keys())
+    batch_size = batch_size or getattr(settings, "REENCRYPT_BATCH_SIZE", 1000)
+    primary = get_cipher_for_key(keys[0])
+    cipher = get_cipher_for_keys(keys)
+    table = connection.ops.quote_name(Proxy._meta.db_table)
+    select_sql = f"SELECT id, url FROM {table} WHERE id > %s AND url IS NOT NULL ORDER BY id LIMIT %s"
+    update_sql = f"UPDATE {table} SET url = %s WHERE id = %s AND url = %s"
+
+    result = ReencryptResult(last_id=start_after)
+    started = time.perf_counter()
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(select_sql, [result.last_id, batch_size])
+            rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        for proxy_id, value in rows:
+            try:
+                new_value = reencrypt_value(value, primary, cipher)
+            except InvalidToken:
+                result.errors += 1
+                if len(result.error_ids) < 100:
+                    result.error_ids.append(proxy_id)
+                continue
+            if new_value is not None:
+                updates.append((new_value, proxy_id, value))
+        if updates:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(update_sql, updates)
+        result.scanned += len(rows)
+        result.rewritten += len(updates)
+        result.last_id = rows[-1][0]
+        result.elapsed = time.perf_counter() - started
+        if progress is not None:
+            progress(result)
+        if pause:
+            time.sleep(pause)
+
+    result.elapsed = time.perf_counter() - started
+    logger.info(
+        f"Перешифровано {result.rewritten} из {result.scanned} прокси за {result.elapsed:.1f} с "
+        f"({result.rate:.0f} строк/с), не расшифровано {result.errors}."
+    )
+    return result
@@ -0,0 +1,62 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importers import FORMATS, guess_format
+
+
+class ImportCommand(BaseCommand):
+    """
+    Общая часть команд импорта: чтение файла или stdin, выбор формата и вывод прогресса.
+    """
+
+    importer_class = None
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу или - для чтения из stdin")
+        parser.add_argument("--format", choices=FORMATS, help="Формат файла (по умолчанию — по расширению)")
+        parser.add_argument("--batch-size", type=int, default=None, help="Размер пачки для вставки")
+        parser.add_argument(
+            "--no-pair",
+            dest="pair",
+            action="store_false",
+            default=None,
+            help="Не создавать пользователей для новых записей",
+        )
+
+    def get_importer(self, options):
+        return self.importer_class(
+            batch_size=options["batch_size"], progress=self.report_progress, pair=options["pair"]
+        )
+
+    def report_progress(self, result):
+        self.stdout.write(
+            f"\rПрочитано {result.total}, создано {result.created}, дубликатов {result.duplicates}, "
+            f"ошибок {result.errors} — {result.rate:.0f} строк/с",
+            ending="",
+        )
+        self.stdout.flush()
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or guess_format(path)
+        importer = self.get_importer(options)
+        try:
+            if path == "-":
+                result = importer.run(sys.stdin, fmt)
+            else:
+                with open(path, encoding="utf-8", newline="") as stream:
+                    result = importer.run(stream, fmt)
+        except OSError as e:
+            raise CommandError(f"Не удалось прочитать {path}: {e}")
+
+        self.stdout.write("")
+        for message in result.error_samples:
+            self.stderr.write(message)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово: создано {result.created} из {result.total} за {result.elapsed:.1f} с "
+                f"({result.rate:.0f} строк/с), дубликатов {result.duplicates}, ошибок {result.errors}, "
+                f"создано пользователей {result.paired}."
+            )
+        )
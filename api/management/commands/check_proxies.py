@@ -0,0 +1,43 @@
+import resource
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.healthcheck import run_health_check
+
+
+class Command(BaseCommand):
+    help = "Проверяет работоспособность прокси; с --interval работает как отдельный воркер."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default=None, help="URL, который запрашивается через каждый прокси")
+        parser.add_argument("--concurrency", type=int, default=None, help="Максимум одновременных соединений")
+        parser.add_argument("--timeout", type=float, default=None, help="Таймаут одной проверки, с")
+        parser.add_argument("--interval", type=int, default=None, help="Повторять проверку каждые N секунд")
+
+    def raise_file_limit(self, concurrency):
+        # Каждая проверка держит открытый сокет
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = concurrency + 256
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"] or settings.HEALTHCHECK_CONCURRENCY
+        self.raise_file_limit(concurrency)
+        while True:
+            stats = run_health_check(
+                target_url=options["target"],
+                concurrency=concurrency,
+                timeout=options["timeout"],
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Проверено {stats['checked']}, работают {stats['alive']}, сменили состояние {stats['changed']}."
+                )
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
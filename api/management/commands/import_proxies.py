@@ -0,0 +1,21 @@
+from api.importers import ProxyImporter
+
+from ._import import ImportCommand
+
+
+class Command(ImportCommand):
+    help = "Импортирует прокси из текстового, CSV или JSONL файла (колонки url и необязательно expire_at)."
+
+    importer_class = ProxyImporter
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--workers", type=int, default=None, help="Число процессов для шифрования")
+
+    def get_importer(self, options):
+        return ProxyImporter(
+            batch_size=options["batch_size"],
+            progress=self.report_progress,
+            pair=options["pair"],
+            workers=options["workers"],
+        )
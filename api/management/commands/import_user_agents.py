@@ -0,0 +1,9 @@
+from api.importers import UserAgentImporter
+
+from ._import import ImportCommand
+
+
+class Command(ImportCommand):
+    help = "Импортирует строки User-Agent из текстового, CSV или JSONL файла (колонка agent)."
+
+    importer_class = UserAgentImporter
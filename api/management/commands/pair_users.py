@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.pairing import POLICIES, pair_users
+
+
+class Command(BaseCommand):
+    help = "Создаёт недостающих пользователей (пары прокси × User-Agent)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--policy", choices=POLICIES, help="all — все пары, random — K случайных агентов на прокси")
+        parser.add_argument("--per-proxy", type=int, default=None, help="K для политики random")
+
+    def handle(self, *args, **options):
+        created = pair_users(policy=options["policy"], per_proxy=options["per_proxy"])
+        self.stdout.write(self.style.SUCCESS(f"Создано {created} пользователей."))
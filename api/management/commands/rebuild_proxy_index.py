@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.blindindex import backfill_hashes
+from api.models import Proxy
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает слепой индекс прокси (url_hash, endpoint_hash), например после смены BLIND_INDEX_KEY."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Строк в одной транзакции")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated = backfill_hashes(Proxy, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Обновлено {updated} прокси за {time.perf_counter() - started:.1f} с."))
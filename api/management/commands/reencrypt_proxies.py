@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.fields import encryption_keys
+from api.keyrotation import reencrypt_proxies
+from api.models import Proxy
+
+
+class Command(BaseCommand):
+    help = "Перешифровывает URL прокси основным ключом после ротации ключей (без остановки сервиса)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start-after", type=int, default=0, help="Продолжить с id больше указанного")
+        parser.add_argument("--batch-size", type=int, default=None, help="Строк в одной транзакции")
+        parser.add_argument("--pause", type=float, default=0, help="Пауза между пачками, с")
+
+    def report_progress(self, result):
+        done = result.scanned / self.total * 100 if self.total else 100
+        eta = (self.total - result.scanned) / result.rate if result.rate else 0
+        self.stdout.write(
+            f"\rПросмотрено {result.scanned} из {self.total} ({done:.1f}%), перешифровано {result.rewritten}, "
+            f"ошибок {result.errors}, последний id {result.last_id} — {result.rate:.0f} строк/с, "
+            f"осталось ~{eta:.0f} с",
+            ending="",
+        )
+        self.stdout.flush()
+
+    def handle(self, *args, **options):
+        if len(encryption_keys()) < 2:
+            self.stdout.write("Задан один ключ: значения, зашифрованные другим ключом, не расшифровать.")
+        self.total = Proxy.objects.filter(pk__gt=options["start_after"]).count()
+        try:
+            result = reencrypt_proxies(
+                start_after=options["start_after"],
+                batch_size=options["batch_size"],
+                pause=options["pause"],
+                progress=self.report_progress,
+            )
+        except KeyboardInterrupt:
+            raise CommandError("Прервано; для продолжения запустите команду с --start-after <последний id>.")
+        self.stdout.write("")
+        if result.errors:
+            self.stderr.write(
+                f"Не удалось расшифровать {result.errors} прокси ни одним ключом, например: "
+                f"{', '.join(map(str, result.error_ids[:10]))}."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово: перешифровано {result.rewritten} из {result.scanned} за {result.elapsed:.1f} с "
+                f"({result.rate:.0f} строк/с)."
+            )
+        )
+        if not result.errors and not options["start_after"]:
+            self.stdout.write(
+                "Все значения зашифрованы основным ключом, старые ключи можно удалить из CRYPTOGRAPHY_KEYS."
+            )
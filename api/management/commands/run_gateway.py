@@ -0,0 +1,35 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.gateway import Gateway
+from logger import logger
+
+
+class Command(BaseCommand):
+    help = "Запускает шлюз — HTTP-прокси, пересылающий запросы через пользователей пула."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default=None, help="Адрес, на котором слушает шлюз")
+        parser.add_argument("--port", type=int, default=None, help="Порт шлюза")
+
+    def handle(self, *args, **options):
+        host = options["host"] or settings.GATEWAY_HOST
+        port = options["port"] or settings.GATEWAY_PORT
+        if not settings.GATEWAY_TOKEN and host not in ("127.0.0.1", "localhost", "::1"):
+            logger.warning("Шлюз слушает внешний адрес без GATEWAY_TOKEN: им сможет воспользоваться любой.")
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, host, port):
+        gateway = Gateway()
+        server = await gateway.start(host, port)
+        logger.info(f"Шлюз слушает {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await gateway.close()
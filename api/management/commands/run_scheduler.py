@@ -0,0 +1,42 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.scheduler import create_scheduler, leader_lock, start_scheduler
+from logger import logger
+
+
+class Command(BaseCommand):
+    help = "Запускает планировщик задач отдельным процессом; второй экземпляр ждёт, пока лидер не завершится."
+
+    def handle(self, *args, **options):
+        stopped = threading.Event()
+
+        def stop(signum, frame):
+            logger.info("Received signal, shutting down...")
+            stopped.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        lock = leader_lock()
+        waiting = False
+        while not lock.acquire():
+            if not waiting:
+                logger.info("Планировщик уже запущен другим процессом, ожидаем освобождения блокировки...")
+                waiting = True
+            if stopped.wait(settings.SCHEDULER_LEADER_RETRY_SECONDS):
+                return
+
+        scheduler = create_scheduler()
+        try:
+            start_scheduler(scheduler)
+            logger.info("Scheduler start")
+            stopped.wait()
+        finally:
+            if scheduler.running:
+                scheduler.shutdown()
+            lock.release()
+            logger.info("Scheduler stopped.")
@@ -0,0 +1,214 @@
+import functools
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+REQUEST_LATENCY = Histogram(
+    "proxy_manager_http_request_duration_seconds",
+    "Время обработки HTTP-запроса по представлениям",
+    ["view", "method", "status"],
+)
+DECRYPTION_ERRORS = Counter(
+    "proxy_manager_decryption_errors_total",
+    "Ошибки расшифровки EncryptedCharField",
+    ["source"],
+)
+JOB_DURATION = Histogram(
+    "proxy_manager_job_duration_seconds",
+    "Длительность задач планировщика",
+    ["job"],
+    buckets=(0.1, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+JOB_RUNS = Counter(
+    "proxy_manager_job_runs_total",
+    "Запуски задач планировщика",
+    ["job", "result"],
+)
+JOB_ROWS = Counter(
+    "proxy_manager_job_rows_total",
+    "Строки, изменённые задачами планировщика",
+    ["job", "kind"],
+)
+# В многопроцессном режиме у каждого воркера свой пул, поэтому значение отдаётся с меткой pid
+POOL_SIZE = Gauge(
+    "proxy_manager_pool_users",
+    "Доступные пользователи в пуле процесса",
+    multiprocess_mode="liveall",
+)
+
+
+_pool_size_updated_at = 0.0
+
+
+def update_pool_size(force=False):
+    """
+    Обновляет размер пула не чаще раза в секунду: у общего пула подсчёт занимает O(n).
+    """
+    global _pool_size_updated_at
+    from .pool import healthy_pool
+
+    now = time.monotonic()
+    if force or now - _pool_size_updated_at >= 1:
+        _pool_size_updated_at = now
+        POOL_SIZE.set(len(healthy_pool))
+
+
+class MetricsMiddleware:
+    """
+    Записывает время обработки запроса в гистограмму с меткой имени URL-маршрута.
+
+    Работает и под WSGI, и под ASGI: для асинхронной цепочки middleware
+    сам становится корутиной и не переключает запрос в поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    @staticmethod
+    def observe(request, response, started):
+        match = getattr(request, "resolver_match", None)
+        # Метка — имя маршрута, а не путь: ID в URL не должны порождать новые ряды
+        view = match.view_name if match is not None else "unmatched"
+        REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(time.perf_counter() - started)
+        update_pool_size()
+
+
+def observe_job(job, rows=()):
+    """
+    Декоратор задачи планировщика: длительность, результат запуска и строки из
+    возвращённого словаря по ключам rows.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                JOB_RUNS.labels(job, "error").inc()
+                raise
+            finally:
+                JOB_DURATION.labels(job).observe(time.perf_counter() - started)
+            JOB_RUNS.labels(job, "success").inc()
+            for kind in rows:
+                JOB_ROWS.labels(job, kind).inc(result[kind])
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class DatabaseCollector:
+    """
+    Gauge-метрики, считаемые запросами к базе: пользователи по статусам,
+    прокси по состоянию и прокси, истекающие в ближайший час.
+
+    Результат запросов кешируется на METRICS_CACHE_SECONDS, поэтому частый
+    сбор метрик (и несколько Prometheus) не нагружают базу.
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._values = None
+        self._computed_at = None
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, "METRICS_CACHE_SECONDS", 30)
+
+    def query(self):
+        from .models import Proxy, User
+
+        now = timezone.now()
+        users = dict(User.objects.order_by().values_list("status").annotate(count=Count("id")))
+        proxies = Proxy.objects.aggregate(
+            alive=Count("id", filter=Q(is_alive=True)),
+            dead=Count("id", filter=Q(is_alive=False)),
+            expiring=Count("id", filter=Q(expire_at__gt=now, expire_at__lte=now + timezone.timedelta(hours=1))),
+        )
+        return {"users": users, "proxies": proxies}
+
+    def values(self):
+        with self._lock:
+            if self._computed_at is None or time.monotonic() - self._computed_at > self.ttl:
+                self._values = self.query()
+                self._computed_at = time.monotonic()
+            return self._values
+
+    def clear(self):
+        with self._lock:
+            self._values = None
+            self._computed_at = None
+
+    def describe(self):
+        # Регистрация не должна выполнять запросы к базе
+        return []
+
+    def collect(self):
+        values = self.values()
+        users = GaugeMetricFamily("proxy_manager_users", "Пользователи по статусам", labels=["status"])
+        for status, count in sorted(values["users"].items()):
+            users.add_metric([str(status)], count)
+        yield users
+        proxies = GaugeMetricFamily("proxy_manager_proxies", "Прокси по состоянию проверки", labels=["state"])
+        proxies.add_metric(["alive"], values["proxies"]["alive"])
+        proxies.add_metric(["dead"], values["proxies"]["dead"])
+        yield proxies
+        yield GaugeMetricFamily(
+            "proxy_manager_proxies_expiring",
+            "Прокси, срок которых истекает в ближайший час",
+            value=values["proxies"]["expiring"],
+        )
+
+
+database_collector = DatabaseCollector()
+database_registry = CollectorRegistry()
+database_registry.register(database_collector)
+
+
+def render():
+    """
+    Метрики в текстовом формате Prometheus.
+
+    При PROMETHEUS_MULTIPROC_DIR метрики процессов собираются из общего каталога
+    (prometheus_client multiprocess), иначе отдаются метрики текущего процесса.
+    """
+    update_pool_size(force=True)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(database_registry)
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0007_alter_proxy_url"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="lease_token",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="Токен аренды, выданный вместе с пользователем",
+                max_length=32,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="leased_until",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Пользователь выдан в аренду до этого времени и не выдаётся другим клиентам",
+                null=True,
+            ),
+        ),
+    ]
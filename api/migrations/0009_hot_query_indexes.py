@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0008_user_lease"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="proxy",
+            index=models.Index(
+                condition=models.Q(("expire_at__isnull", False)), fields=["expire_at"], name="proxy_expire_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:57
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_cooldown(apps, schema_editor):
+    """
+    Пользователи с 429 раньше возвращались в ротацию через минуту после updated_at.
+    """
+    User = apps.get_model("api", "User")
+    User.objects.filter(status=429, next_available_at__isnull=True).update(
+        consecutive_failures=1, next_available_at=F("updated_at") + timedelta(minutes=1)
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0009_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="consecutive_failures",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Количество неудачных статусов подряд (сбрасывается статусом 200)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="next_available_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Окончание cooldown: до этого времени пользователь не выдаётся", null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                fields=["status", "next_available_at", "leased_until"], name="user_status_available_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_cooldown, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0010_user_cooldown"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="proxy",
+            name="check_failures",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, help_text="Количество неудачных проверок здоровья подряд"
+            ),
+        ),
+        migrations.AddField(
+            model_name="proxy",
+            name="is_alive",
+            field=models.BooleanField(
+                default=True, help_text="Прокси проходит проверку здоровья; пользователи мёртвых прокси не выдаются"
+            ),
+        ),
+        migrations.AddField(
+            model_name="proxy",
+            name="last_checked_at",
+            field=models.DateTimeField(editable=False, help_text="Время последней проверки здоровья", null=True),
+        ),
+        migrations.AddField(
+            model_name="proxy",
+            name="last_success_at",
+            field=models.DateTimeField(editable=False, help_text="Время последней успешной проверки", null=True),
+        ),
+        migrations.AddField(
+            model_name="proxy",
+            name="latency_ms",
+            field=models.FloatField(editable=False, help_text="Задержка последней проверки, мс", null=True),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:37
+
+import hashlib
+import hmac
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations, models, transaction
+
+# Копия логики api/blindindex.py на момент миграции: изменения модуля не должны
+# менять результат повторного применения старых миграций
+DECRYPTION_ERROR = "(Decryption Error)"
+BATCH_SIZE = 1000
+
+
+def keyed_hash(key, value):
+    return hmac.new(key, value.encode(), hashlib.sha256).hexdigest()
+
+
+def endpoint_hash(key, url):
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        return None
+    if not host or port is None:
+        return None
+    return keyed_hash(key, f"{host.lower()}:{port}")
+
+
+def backfill(apps, schema_editor):
+    """
+    SHA-256 в url_hash заменяется на HMAC, endpoint_hash заполняется впервые.
+    Каждая пачка записывается одним executemany в своей транзакции.
+    """
+    Proxy = apps.get_model("api", "Proxy")
+    connection = schema_editor.connection
+    queryset = Proxy.objects.using(connection.alias).filter(url__isnull=False).order_by("pk")
+    if not queryset.exists():
+        return
+    key = getattr(settings, "BLIND_INDEX_KEY", None)
+    if not key:
+        raise ImproperlyConfigured("BLIND_INDEX_KEY не задан: без него нельзя заполнить слепой индекс прокси.")
+    key = key.encode()
+    table = connection.ops.quote_name(Proxy._meta.db_table)
+    sql = f"UPDATE {table} SET url_hash = %s, endpoint_hash = %s WHERE id = %s"
+    last_id = 0
+    while rows := list(queryset.filter(pk__gt=last_id).values_list("pk", "url")[:BATCH_SIZE]):
+        last_id = rows[-1][0]
+        params = [
+            (keyed_hash(key, url), endpoint_hash(key, url), proxy_id)
+            for proxy_id, url in rows
+            if url and url != DECRYPTION_ERROR
+        ]
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+class Migration(migrations.Migration):
+    # Пачки записываются в отдельных транзакциях
+    atomic = False
+
+    dependencies = [
+        ("api", "0011_proxy_health"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="proxy",
+            name="endpoint_hash",
+            field=models.CharField(
+                db_index=True,
+                editable=False,
+                help_text="HMAC-SHA256 host:port для поиска прокси по адресу",
+                max_length=64,
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="proxy",
+            name="url_hash",
+            field=models.CharField(
+                editable=False,
+                help_text="HMAC-SHA256 URL (слепой индекс) для уникальности и поиска",
+                max_length=64,
+                unique=True,
+            ),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
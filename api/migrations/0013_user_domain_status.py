@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0012_proxy_blind_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserDomainStatus",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("status", models.IntegerField(default=200, help_text="Статус использования прокси и User-agent")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, help_text="Дата и время последнего обновления записи"),
+                ),
+                (
+                    "consecutive_failures",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Количество неудачных статусов подряд (сбрасывается статусом 200)"
+                    ),
+                ),
+                (
+                    "next_available_at",
+                    models.DateTimeField(
+                        blank=True, help_text="Окончание cooldown: до этого времени пользователь не выдаётся", null=True
+                    ),
+                ),
+                ("domain", models.CharField(help_text="Домен целевого сайта (e.g., example.com)", max_length=253)),
+                (
+                    "last_used_at",
+                    models.DateTimeField(
+                        blank=True, help_text="Время последнего сообщения о статусе для этого сайта", null=True
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        help_text="Пользователь (прокси × User-Agent)",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="domain_statuses",
+                        to="api.user",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["domain", "status", "next_available_at"], name="user_domain_status_idx")
+                ],
+                "unique_together": {("user", "domain")},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0013_user_domain_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RateLimitBucket",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "key",
+                    models.CharField(
+                        help_text="Прокси (proxy:<id>) или адрес (endpoint:<хеш>)", max_length=80, unique=True
+                    ),
+                ),
+                ("tokens", models.FloatField(help_text="Доступные токены на момент updated")),
+                ("updated", models.FloatField(help_text="Время последнего пересчёта токенов (Unix time)")),
+            ],
+        ),
+    ]
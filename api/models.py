@@ -1,17 +1,11 @@
-import hashlib
-
 from django.db import models
+from django.utils import timezone
 
+from .blindindex import hash_endpoint, hash_url
+from .cooldown import HEALTHY_STATUS, cooldown_statuses, next_available_at
 from .fields import EncryptedCharField
 
 
-def hash_url(url: str) -> str:
-    if url:
-        return hashlib.sha256(url.encode()).hexdigest()
-    else:
-        return None
-
-
 class Proxy(models.Model):
     """
     Модель для хранения информации о прокси-сервере.
@@ -28,17 +22,48 @@ class Proxy(models.Model):
         max_length=64,
         unique=True,
         editable=False,
-        help_text="SHA-256 хеш URL для уникальности",
+        help_text="HMAC-SHA256 URL (слепой индекс) для уникальности и поиска",
+    )
+    endpoint_hash = models.CharField(
+        max_length=64,
+        null=True,
+        db_index=True,
+        editable=False,
+        help_text="HMAC-SHA256 host:port для поиска прокси по адресу",
     )
     expire_at = models.DateTimeField(
         null=True,
         blank=True,
         help_text="Дата и время истечения срока действия прокси (опционально)",
     )
+    is_alive = models.BooleanField(
+        default=True,
+        help_text="Прокси проходит проверку здоровья; пользователи мёртвых прокси не выдаются",
+    )
+    # Поля ниже заполняет только проверка здоровья (api/healthcheck.py)
+    check_failures = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Количество неудачных проверок здоровья подряд",
+    )
+    last_checked_at = models.DateTimeField(null=True, editable=False, help_text="Время последней проверки здоровья")
+    last_success_at = models.DateTimeField(null=True, editable=False, help_text="Время последней успешной проверки")
+    latency_ms = models.FloatField(null=True, editable=False, help_text="Задержка последней проверки, мс")
+
+    class Meta:
+        indexes = [
+            # delete_expired_proxies: expire_at <= now, прокси без срока в индекс не попадают
+            models.Index(
+                fields=["expire_at"],
+                name="proxy_expire_at_idx",
+                condition=models.Q(expire_at__isnull=False),
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if self.url:
             self.url_hash = hash_url(self.url)
+            self.endpoint_hash = hash_endpoint(self.url)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -59,7 +84,60 @@ class UserAgent(models.Model):
         return self.agent
 
 
-class User(models.Model):
+class StatusTracking(models.Model):
+    """
+    Статус использования и cooldown: общие поля пользователя и его статуса на отдельном сайте.
+    """
+
+    status = models.IntegerField(default=200, help_text="Статус использования прокси и User-agent")
+    updated_at = models.DateTimeField(auto_now=True, help_text="Дата и время последнего обновления записи")
+    consecutive_failures = models.PositiveIntegerField(
+        default=0,
+        help_text="Количество неудачных статусов подряд (сбрасывается статусом 200)",
+    )
+    next_available_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Окончание cooldown: до этого времени пользователь не выдаётся",
+    )
+
+    class Meta:
+        abstract = True
+
+    # Поля, которые меняет apply_status
+    STATUS_FIELDS = ["status", "consecutive_failures", "next_available_at", "updated_at"]
+
+    def save(self, *args, **kwargs):
+        # Статус, выставленный напрямую (например, в админке), согласуем с cooldown
+        if self.status == HEALTHY_STATUS:
+            self.next_available_at = None
+        elif self.status in cooldown_statuses() and self.next_available_at is None:
+            self.next_available_at = next_available_at(max(1, self.consecutive_failures))
+        super().save(*args, **kwargs)
+
+    def apply_status(self, status, now=None):
+        """
+        Устанавливает статус и пересчитывает cooldown.
+
+        Статус 200 сбрасывает счётчик неудач. Статусы из USER_COOLDOWN_STATUSES
+        откладывают пользователя с экспоненциально растущей задержкой, остальные
+        статусы выключают его до явного сообщения о статусе 200.
+        """
+        now = now or timezone.now()
+        self.status = status
+        self.updated_at = now
+        if status == HEALTHY_STATUS:
+            self.consecutive_failures = 0
+            self.next_available_at = None
+            return
+        self.consecutive_failures += 1
+        if status in cooldown_statuses():
+            self.next_available_at = next_available_at(self.consecutive_failures, now)
+        else:
+            self.next_available_at = None
+
+
+class User(StatusTracking):
     """
     Модель для связи прокси и User-Agent.  Также фиксирует статус использования.
     """
@@ -76,11 +154,73 @@ class User(models.Model):
         related_name="users",
         help_text="Прокси-сервер, используемый для запросов",
     )
-    status = models.IntegerField(default=200, help_text="Статус использования прокси и User-agent")
-    updated_at = models.DateTimeField(auto_now=True, help_text="Дата и время последнего обновления записи")
+    leased_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Пользователь выдан в аренду до этого времени и не выдаётся другим клиентам",
+    )
+    lease_token = models.CharField(
+        max_length=32,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Токен аренды, выданный вместе с пользователем",
+    )
 
     class Meta:
         unique_together = ("user_agent", "proxy")
+        indexes = [
+            # available_users и update_user_statuses:
+            # status IN (...) AND next_available_at <= now AND leased_until <= now
+            models.Index(
+                fields=["status", "next_available_at", "leased_until"],
+                name="user_status_available_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"User: {self.user_agent.agent[:20]}... | Proxy: {self.proxy.url}"
+
+
+class UserDomainStatus(StatusTracking):
+    """
+    Статус пользователя на отдельном сайте (домене): 429 от одного сайта не убирает
+    пользователя из выдачи для остальных. Нет записи — для сайта действует только
+    общий статус пользователя.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="domain_statuses",
+        help_text="Пользователь (прокси × User-Agent)",
+    )
+    domain = models.CharField(max_length=253, help_text="Домен целевого сайта (e.g., example.com)")
+    last_used_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Время последнего сообщения о статусе для этого сайта",
+    )
+
+    class Meta:
+        unique_together = ("user", "domain")
+        indexes = [
+            # blocked_for_domain: domain = %s AND (status NOT IN (...) OR next_available_at > now)
+            models.Index(fields=["domain", "status", "next_available_at"], name="user_domain_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.domain}: {self.status} (user {self.user_id})"
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket ограничителя выдачи прокси для PROXY_LIMIT_BACKEND=database (api/ratelimit.py).
+    """
+
+    key = models.CharField(max_length=80, unique=True, help_text="Прокси (proxy:<id>) или адрес (endpoint:<хеш>)")
+    tokens = models.FloatField(help_text="Доступные токены на момент updated")
+    updated = models.FloatField(help_text="Время последнего пересчёта токенов (Unix time)")
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
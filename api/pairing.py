@@ -0,0 +1,118 @@
+import random
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from logger import logger
+
+from .cooldown import HEALTHY_STATUS
+from .models import Proxy, User, UserAgent
+from .pool import healthy_pool
+
+POLICIES = ("all", "random")
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _insert_sql():
+    columns = "user_agent_id, proxy_id, status, updated_at, consecutive_failures"
+    return f"INSERT INTO {_qn(User._meta.db_table)} ({columns})"
+
+
+def _subquery(queryset):
+    sql, params = queryset.values("pk").query.sql_with_params()
+    return f"({sql})", list(params)
+
+
+def pair_all(proxies=None, agents=None):
+    """
+    Создаёт недостающие пары прокси × User-Agent одним INSERT ... SELECT.
+
+    Декартово произведение строится в базе данных и в память процесса не загружается.
+    proxies и agents — необязательные querysets, ограничивающие стороны произведения.
+    Возвращает количество созданных пользователей.
+    """
+    conditions = ["TRUE"]
+    params = [HEALTHY_STATUS, connection.ops.adapt_datetimefield_value(timezone.now())]
+    for queryset, column in ((proxies, "p.id"), (agents, "ua.id")):
+        if queryset is not None:
+            sql, subquery_params = _subquery(queryset)
+            conditions.append(f"{column} IN {sql}")
+            params.extend(subquery_params)
+    sql = (
+        f"{_insert_sql()} "
+        f"SELECT ua.id, p.id, %s, %s, 0 "
+        f"FROM {_qn(Proxy._meta.db_table)} p CROSS JOIN {_qn(UserAgent._meta.db_table)} ua "
+        f"WHERE {' AND '.join(conditions)} "
+        # WHERE обязателен: без него SQLite не отличает ON CONFLICT от условия соединения
+        f"ON CONFLICT (user_agent_id, proxy_id) DO NOTHING"
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return max(cursor.rowcount, 0)
+
+
+def pair_random(per_proxy, proxies=None, chunk_size=None):
+    """
+    Дополняет каждый прокси до per_proxy случайных User-Agent.
+
+    Прокси обрабатываются пачками по chunk_size: для пачки читаются уже
+    существующие пары, недостающие вставляются одним executemany без создания моделей.
+    В памяти одновременно находятся только ID всех User-Agent и одна пачка пар.
+    """
+    chunk_size = chunk_size or getattr(settings, "USER_PAIRING_CHUNK_SIZE", 1000)
+    agent_ids = list(UserAgent.objects.values_list("id", flat=True))
+    if not agent_ids:
+        return 0
+    proxies = proxies if proxies is not None else Proxy.objects.all()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    sql = f"{_insert_sql()} VALUES (%s, %s, %s, %s, 0) ON CONFLICT (user_agent_id, proxy_id) DO NOTHING"
+    created = 0
+    proxy_ids = proxies.order_by("pk").values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+    while chunk := [proxy_id for _, proxy_id in zip(range(chunk_size), proxy_ids)]:
+        existing = {}
+        for proxy_id, agent_id in User.objects.filter(proxy_id__in=chunk).values_list("proxy_id", "user_agent_id"):
+            existing.setdefault(proxy_id, set()).add(agent_id)
+        rows = []
+        for proxy_id in chunk:
+            paired = existing.get(proxy_id, set())
+            needed = per_proxy - len(paired)
+            if needed <= 0:
+                continue
+            # Выборка с запасом на уже занятые агенты, без копирования всего списка
+            candidates = random.sample(agent_ids, min(len(agent_ids), needed + len(paired)))
+            for agent_id in [agent_id for agent_id in candidates if agent_id not in paired][:needed]:
+                rows.append((agent_id, proxy_id, HEALTHY_STATUS, now))
+        if rows:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+                # Пары, вставленные параллельным созданием, ON CONFLICT пропускает: считаем вставленные
+                created += max(cursor.rowcount, 0)
+    return created
+
+
+def pair_users(policy=None, per_proxy=None, proxies=None, agents=None, pool=healthy_pool):
+    """
+    Создаёт недостающих пользователей по политике policy:
+    all — все пары прокси × User-Agent, random — per_proxy случайных User-Agent на прокси.
+    Ограничение agents учитывается только политикой all: при random агенты
+    выбираются из всех, а дополняются только прокси из proxies.
+
+    После создания пар пул здоровых пользователей перечитывается при следующем обращении.
+    Возвращает количество созданных пользователей.
+    """
+    policy = policy or getattr(settings, "USER_PAIRING_POLICY", "all")
+    if policy == "all":
+        created = pair_all(proxies=proxies, agents=agents)
+    elif policy == "random":
+        per_proxy = per_proxy or getattr(settings, "USER_PAIRING_AGENTS_PER_PROXY", 10)
+        created = pair_random(per_proxy, proxies=proxies)
+    else:
+        raise ValueError(f"Неизвестная политика создания пар: {policy}")
+    if created:
+        pool.clear()
+    logger.info(f"Создано {created} пользователей (политика {policy}).")
+    return created
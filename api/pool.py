@@ -0,0 +1,493 @@
+import heapq
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from logger import logger
+
+from .affinity import HashRing
+from .cooldown import available_statuses
+from .domains import blocked_for_domain, domain_pools
+from .ratelimit import Saturated, proxy_limiter
+from .scoring import WeightedSet, health_scores
+
+
+def selectable_proxies(now):
+    """
+    Условие на прокси пользователя: прокси жив и не истекает в ближайшие
+    PROXY_EXPIRY_MARGIN_SECONDS, чтобы клиент не получил прокси, который вот-вот удалят.
+    """
+    margin = timezone.timedelta(seconds=getattr(settings, "PROXY_EXPIRY_MARGIN_SECONDS", 300))
+    return Q(proxy__is_alive=True) & (Q(proxy__expire_at__isnull=True) | Q(proxy__expire_at__gt=now + margin))
+
+
+def available_users(now=None):
+    """
+    Queryset пользователей, которых можно выдать клиенту прямо сейчас:
+    со статусом 200 (или 429 с истёкшим cooldown), без действующей аренды
+    и с прокси, прошедшим проверку здоровья и не истекающим в ближайшее время.
+    """
+    from .models import User
+
+    now = now or timezone.now()
+    return (
+        User.objects.filter(selectable_proxies(now), status__in=available_statuses())
+        .filter(Q(next_available_at__isnull=True) | Q(next_available_at__lte=now))
+        .filter(Q(leased_until__isnull=True) | Q(leased_until__lte=now))
+    )
+
+
+def deferred_users(now=None):
+    """
+    Queryset пользователей, которые станут доступны позже: на cooldown или в аренде.
+    """
+    from .models import User
+
+    now = now or timezone.now()
+    return User.objects.filter(selectable_proxies(now), status__in=available_statuses()).filter(
+        Q(next_available_at__gt=now) | Q(leased_until__gt=now)
+    )
+
+
+def available_at(user):
+    """
+    Момент, когда пользователь станет доступен (None — доступен сразу).
+    """
+    moments = [moment for moment in (user.next_available_at, user.leased_until) if moment is not None]
+    return max(moments) if moments else None
+
+
+STRATEGIES = ("uniform", "weighted", "least-recently-used")
+
+
+class HealthyUserPool:
+    """
+    Пул ID доступных пользователей, хранящийся в памяти процесса.
+
+    Пул является подсказкой, а не источником истины: выбранный ID всегда
+    перепроверяется запросом к базе, а устаревшие ID удаляются по факту промаха.
+    Пользователи на cooldown или в аренде лежат в куче по времени освобождения
+    и возвращаются в пул при обращении к нему, без периодических задач.
+
+    Стратегии выбора:
+    - uniform — равновероятный выбор за O(1);
+    - weighted — пропорционально оценкам HealthScores: сначала прокси
+      (оценка прокси × сумма оценок его пользователей), затем пользователь
+      внутри прокси, оба шага за O(log n) на деревьях Фенвика;
+    - least-recently-used — пользователь, которого дольше всех не выдавали, за O(1).
+
+    Для ?session= пул держит кольцо консистентного хеширования (см. api/affinity.py),
+    которое строится при первом запросе с сессией и дополняется новыми пользователями.
+    """
+
+    def __init__(self, refresh_interval=None, scores=health_scores):
+        self._lock = threading.Lock()
+        self._scores = scores
+        self._ids = []
+        self._positions = {}
+        self._proxy_of = {}
+        self._by_proxy = {}
+        self._proxies = WeightedSet()
+        self._lru = OrderedDict()
+        self._deferred = []
+        self._loaded_at = None
+        self._refresh_interval = refresh_interval
+        self._ring = HashRing()
+        self._ring_lock = threading.Lock()
+
+    @property
+    def refresh_interval(self):
+        if self._refresh_interval is not None:
+            return self._refresh_interval
+        return getattr(settings, "USER_POOL_REFRESH_SECONDS", 300)
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def load(self):
+        """
+        Полностью перечитывает ID доступных пользователей из базы данных.
+        """
+        now = timezone.now()
+        pairs = list(available_users(now).values_list("id", "proxy_id"))
+        deferred = [
+            (max(moment for moment in moments if moment is not None).timestamp(), user_id, proxy_id)
+            for user_id, proxy_id, *moments in deferred_users(now).values_list(
+                "id", "proxy_id", "next_available_at", "leased_until"
+            )
+        ]
+        heapq.heapify(deferred)
+        with self._lock:
+            self._reset()
+            for user_id, proxy_id in pairs:
+                self._add(user_id, proxy_id)
+            self._deferred = deferred
+            self._loaded_at = time.monotonic()
+            if self._ring.active:
+                self._sync_ring()
+        logger.info(f"Пул пользователей загружен: {len(pairs)} доступных ID, {len(deferred)} отложенных.")
+
+    def _ring_members(self):
+        return [*self._ids, *(user_id for _, user_id, _ in self._deferred)]
+
+    def _sync_ring(self):
+        members = self._ring_members()
+        # Точки удалённых пользователей убираются, когда их становится больше, чем живых
+        if len(self._ring) > 2 * len(members):
+            self._ring.build(members)
+        else:
+            self._ring.add_many(members)
+
+    def needs_reload(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def _ensure_loaded(self):
+        if self.needs_reload():
+            self.load()
+
+    def _reset(self):
+        self._ids = []
+        self._positions = {}
+        self._proxy_of = {}
+        self._by_proxy = {}
+        self._proxies = WeightedSet()
+        self._lru = OrderedDict()
+        self._deferred = []
+
+    def _reweight_proxy(self, proxy_id):
+        users = self._by_proxy.get(proxy_id)
+        if not users:
+            self._by_proxy.pop(proxy_id, None)
+            self._proxies.discard(proxy_id)
+        else:
+            self._proxies.set(proxy_id, self._scores.proxy_score(proxy_id) * users.total())
+
+    def _add(self, user_id, proxy_id):
+        if user_id in self._positions:
+            return
+        self._positions[user_id] = len(self._ids)
+        self._ids.append(user_id)
+        self._proxy_of[user_id] = proxy_id
+        self._by_proxy.setdefault(proxy_id, WeightedSet()).set(user_id, self._scores.user_score(user_id))
+        self._reweight_proxy(proxy_id)
+        self._ring.add(user_id)
+        # Новые пользователи ещё не выдавались — они первые в очереди LRU
+        self._lru[user_id] = None
+        self._lru.move_to_end(user_id, last=False)
+
+    def _discard(self, user_id):
+        index = self._positions.pop(user_id, None)
+        if index is None:
+            return
+        last = self._ids.pop()
+        if last != user_id:
+            # Переносим последний элемент на место удалённого, чтобы не сдвигать список
+            self._ids[index] = last
+            self._positions[last] = index
+        proxy_id = self._proxy_of.pop(user_id)
+        self._by_proxy[proxy_id].discard(user_id)
+        self._reweight_proxy(proxy_id)
+        del self._lru[user_id]
+
+    def add(self, user_id, proxy_id):
+        with self._lock:
+            self._add(user_id, proxy_id)
+
+    def add_many(self, pairs):
+        """
+        Добавляет пары (ID пользователя, ID прокси).
+        """
+        with self._lock:
+            for user_id, proxy_id in pairs:
+                self._add(user_id, proxy_id)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._discard(user_id)
+
+    def discard_many(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._discard(user_id)
+
+    def defer(self, user_id, proxy_id, until):
+        """
+        Убирает ID из пула до момента until (datetime).
+        """
+        with self._lock:
+            self._discard(user_id)
+            heapq.heappush(self._deferred, (until.timestamp(), user_id, proxy_id))
+
+    def _promote_due(self):
+        now = time.time()
+        while self._deferred and self._deferred[0][0] <= now:
+            _, user_id, proxy_id = heapq.heappop(self._deferred)
+            self._add(user_id, proxy_id)
+
+    def update(self, user_id, proxy_id, status, until=None):
+        """
+        Синхронизирует пул с новым статусом пользователя и временем его освобождения.
+        """
+        if status not in available_statuses():
+            self.discard(user_id)
+        elif until is not None and until > timezone.now():
+            self.defer(user_id, proxy_id, until)
+        else:
+            self.add(user_id, proxy_id)
+
+    def sync(self, user):
+        """
+        Синхронизирует пул с состоянием модели пользователя.
+        """
+        self.update(user.pk, user.proxy_id, user.status, available_at(user))
+
+    def reweight(self, user_id, proxy_id):
+        """
+        Пересчитывает веса пользователя и его прокси после изменения оценок.
+        """
+        with self._lock:
+            if user_id in self._positions:
+                self._by_proxy[proxy_id].set(user_id, self._scores.user_score(user_id))
+            if proxy_id in self._by_proxy:
+                self._reweight_proxy(proxy_id)
+
+    def _pick(self, strategy):
+        if strategy == "weighted":
+            proxy_id = self._proxies.sample()
+            return self._by_proxy[proxy_id].sample()
+        if strategy == "least-recently-used":
+            return next(iter(self._lru))
+        return self._ids[random.randrange(len(self._ids))]
+
+    def choice(self, strategy="uniform"):
+        """
+        Возвращает ID из пула по стратегии strategy или None, если пул пуст.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            self._promote_due()
+            if not self._ids:
+                return None
+            user_id = self._pick(strategy)
+            self._lru.move_to_end(user_id)
+            return user_id
+
+    def proxy_of(self, user_id):
+        return self._proxy_of.get(user_id)
+
+    def choice_for_session(self, session, exclude=None):
+        """
+        Возвращает ID, закреплённый за сессией session, или None, если рядом с ней
+        на кольце нет доступных пользователей. exclude(id) отбрасывает кандидатов.
+        """
+        self._ensure_loaded()
+        if not self._ring.active:
+            self._build_ring()
+        with self._lock:
+            self._promote_due()
+            user_id = self._ring.lookup(
+                session, lambda user_id: user_id in self._positions and not (exclude and exclude(user_id))
+            )
+            if user_id is not None:
+                self._lru.move_to_end(user_id)
+            return user_id
+
+    def _build_ring(self):
+        # На миллионе пользователей кольцо строится секунды: строит один поток, остальные
+        # запросы с сессией ждут его. Блокировка пула при этом не берётся, чтобы не задерживать
+        # выбор без сессий
+        with self._ring_lock:
+            if self._ring.active:
+                return
+            with self._lock:
+                members = self._ring_members()
+            ring = HashRing()
+            ring.build(members)
+            with self._lock:
+                ring.add_many(self._ring_members())
+                self._ring = ring
+
+    def sample(self, k):
+        """
+        Возвращает до k различных случайных ID из пула.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            self._promote_due()
+            return random.sample(self._ids, min(k, len(self._ids)))
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            # Кольцо сохраняется: после перезагрузки сессии остаются у тех же пользователей
+            self._loaded_at = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, user_id):
+        return user_id in self._positions
+
+
+def create_pool():
+    """
+    Пул по настройке USER_POOL_BACKEND: local — в памяти процесса, shared — в общей памяти машины.
+    """
+    if getattr(settings, "USER_POOL_BACKEND", "local") == "shared":
+        from .sharedpool import SharedUserPool
+
+        return SharedUserPool()
+    return HealthyUserPool()
+
+
+healthy_pool = create_pool()
+
+
+def user_queryset(fields=None, domain=None):
+    """
+    Queryset для загрузки выбранного пользователя: модель с прокси и User-Agent
+    или, если переданы fields, кортежи values_list без создания моделей.
+    С domain исключаются пользователи, заблокированные для этого сайта.
+    """
+    queryset = available_users()
+    if domain:
+        queryset = queryset.exclude(pk__in=blocked_for_domain(domain).values("user_id"))
+    if fields:
+        return queryset.values_list(*fields)
+    return queryset.select_related("proxy", "user_agent")
+
+
+def pick_candidate(pool, domain_pool, strategy, session=None, limiter=None):
+    """
+    ID, закреплённый за сессией session, а без сессии (или если её пользователи
+    недоступны) — выбранный по стратегии strategy.
+
+    Кандидаты, заблокированные для сайта domain_pool или с исчерпанным лимитом
+    прокси (limiter), пропускаются без запросов к базе. После USER_POOL_MAX_SKIPS
+    пропусков подряд возвращается None, а если пропускать пришлось из-за лимита,
+    выбрасывается Saturated.
+    """
+    if session is not None:
+        user_id = pool.choice_for_session(session, exclude=domain_pool.blocks if domain_pool is not None else None)
+        if user_id is not None:
+            if limiter is not None and not limiter.allow(pool.proxy_of(user_id)):
+                # Сессия не переезжает к другому пользователю из-за нагрузки на её прокси
+                raise Saturated(limiter.retry_after)
+            return user_id
+    throttled = False
+    for _ in range(getattr(settings, "USER_POOL_MAX_SKIPS", 100)):
+        user_id = pool.choice(strategy)
+        if user_id is None:
+            break
+        if domain_pool is not None and domain_pool.blocks(user_id):
+            continue
+        if limiter is not None and not limiter.allow(pool.proxy_of(user_id)):
+            throttled = True
+            continue
+        return user_id
+    if throttled:
+        raise Saturated(limiter.retry_after)
+    return None
+
+
+def fallback_user(fields, domain, limiter=None):
+    """
+    Пользователь для сайта, почти весь пул которого заблокирован: ищется прямо в базе.
+    """
+    if limiter is None:
+        return user_queryset(fields, domain).first()
+    candidates = list(user_queryset(("id", "proxy_id"), domain)[: getattr(settings, "USER_POOL_MAX_SKIPS", 100)])
+    for user_id, proxy_id in candidates:
+        if limiter.allow(proxy_id):
+            return user_queryset(fields, domain).filter(pk=user_id).first()
+    if candidates:
+        raise Saturated(limiter.retry_after)
+    return None
+
+
+def pick_random_user(
+    pool=healthy_pool,
+    fields=None,
+    strategy="uniform",
+    domain=None,
+    session=None,
+    domains=domain_pools,
+    limiter=proxy_limiter,
+):
+    """
+    Выбирает случайного доступного пользователя одним запросом к базе.
+
+    Если выбранный ID устарел, он удаляется из пула и выбор повторяется.
+    После серии промахов пул один раз перечитывается целиком.
+    С domain выбираются только пользователи, не заблокированные для этого сайта;
+    если почти весь пул для сайта заблокирован, пользователь ищется прямо в базе.
+    С session одна и та же сессия получает одного и того же пользователя, пока он доступен.
+    Пользователи прокси с исчерпанным лимитом выдачи пропускаются (см. api/ratelimit.py);
+    если заняты все, выбрасывается Saturated.
+    """
+    max_misses = getattr(settings, "USER_POOL_MAX_MISSES", 10)
+    misses = 0
+    reloaded = False
+    domain_pool = domains.get(domain) if domain else None
+    limiter = limiter if limiter is not None and limiter.enabled else None
+    while True:
+        user_id = pick_candidate(pool, domain_pool, strategy, session, limiter)
+        if user_id is None:
+            if domain_pool is not None and len(pool):
+                return fallback_user(fields, domain, limiter)
+            return None
+        user = user_queryset(fields, domain).filter(pk=user_id).first()
+        if user is not None:
+            return user
+        pool.discard(user_id)
+        misses += 1
+        if misses >= max_misses and not reloaded:
+            pool.load()
+            reloaded = True
+
+
+async def apick_random_user(
+    pool=healthy_pool,
+    fields=None,
+    strategy="uniform",
+    domain=None,
+    session=None,
+    domains=domain_pools,
+    limiter=proxy_limiter,
+):
+    """
+    Асинхронный вариант pick_random_user для ASGI-представлений.
+    """
+    max_misses = getattr(settings, "USER_POOL_MAX_MISSES", 10)
+    misses = 0
+    reloaded = False
+    if pool.needs_reload():
+        await sync_to_async(pool.load)()
+    domain_pool = await sync_to_async(domains.get)(domain) if domain else None
+    limiter = limiter if limiter is not None and limiter.enabled else None
+    while True:
+        if limiter is None and session is None:
+            user_id = pick_candidate(pool, domain_pool, strategy, session)
+        else:
+            # Ограничитель может обращаться к базе (PROXY_LIMIT_BACKEND=database), а первый запрос
+            # с сессией строит кольцо: ни то ни другое не должно блокировать цикл событий
+            user_id = await sync_to_async(pick_candidate)(pool, domain_pool, strategy, session, limiter)
+        if user_id is None:
+            if domain_pool is not None and len(pool):
+                return await sync_to_async(fallback_user)(fields, domain, limiter)
+            return None
+        user = await user_queryset(fields, domain).filter(pk=user_id).afirst()
+        if user is not None:
+            return user
+        pool.discard(user_id)
+        misses += 1
+        if misses >= max_misses and not reloaded:
+            await sync_to_async(pool.load)()
+            reloaded = True
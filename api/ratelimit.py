@@ -0,0 +1,323 @@
+"""
+Ограничение нагрузки на прокси при выдаче пользователей.
+
+Для каждого прокси (или, с PROXY_LIMIT_SCOPE=endpoint, для каждого host:port, на котором
+может быть несколько прокси с разными логинами) действуют:
+- token bucket: не больше PROXY_RATE_LIMIT выдач в секунду с запасом PROXY_RATE_BURST;
+- лимит одновременных аренд PROXY_MAX_LEASES.
+Аренда пачкой (lease_users) берёт токен выдачи за каждого пользователя, как одиночный выбор.
+
+Выбор пропускает кандидатов с исчерпанным лимитом, проверка — словарь в памяти процесса,
+без запросов к базе. Счётчики в памяти у каждого процесса свои, поэтому при нескольких
+воркерах лимит на прокси умножается на их число. PROXY_LIMIT_BACKEND=database хранит
+ведёрки в таблице RateLimitBucket (один атомарный UPDATE на выдачу), а аренды считает
+по таблице User — это общий лимит для всех процессов и машин.
+"""
+
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Least
+from django.utils import timezone
+
+
+class Saturated(Exception):
+    """
+    Все кандидаты отклонены ограничителем: клиенту стоит повторить запрос позже.
+    """
+
+    def __init__(self, retry_after=1):
+        super().__init__(f"Все прокси заняты, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+    def take(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class MemoryBackend:
+    """
+    Ведёрки и аренды в памяти процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._leases = {}
+
+    def acquire(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(burst, now)
+            return bucket.take(rate, burst, now)
+
+    def _active(self, key, now):
+        leases = self._leases.get(key)
+        # Истёкшие аренды снимаются сами, даже если клиент их не вернул
+        while leases and leases[0] <= now:
+            heapq.heappop(leases)
+        return leases
+
+    def lease_counts(self, keys):
+        now = time.time()
+        with self._lock:
+            return {key: len(self._active(key, now) or ()) for key in keys}
+
+    def lease(self, key, until):
+        with self._lock:
+            heapq.heappush(self._leases.setdefault(key, []), until.timestamp())
+
+    def release(self, key):
+        with self._lock:
+            if leases := self._active(key, time.time()):
+                heapq.heappop(leases)
+
+    def saturated(self, max_leases):
+        now = time.time()
+        with self._lock:
+            return [key for key in list(self._leases) if len(self._active(key, now) or ()) >= max_leases]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._leases.clear()
+
+
+class DatabaseBackend:
+    """
+    Ведёрки в таблице RateLimitBucket, аренды — по полю leased_until пользователей.
+    """
+
+    def acquire(self, key, rate, burst):
+        from .models import RateLimitBucket
+
+        now = time.time()
+        tokens = Least(Value(float(burst)), F("tokens") + (Value(now) - F("updated")) * Value(float(rate)))
+        # Условный UPDATE атомарен: параллельные процессы не возьмут один и тот же токен
+        taken = (
+            RateLimitBucket.objects.filter(key=key)
+            .alias(available=tokens)
+            .filter(available__gte=1)
+            .update(tokens=tokens - 1, updated=now)
+        )
+        if taken:
+            return True
+        _, created = RateLimitBucket.objects.get_or_create(
+            key=key, defaults={"tokens": float(burst) - 1, "updated": now}
+        )
+        return created and burst >= 1
+
+    def lease_counts(self, keys):
+        from .models import User
+
+        leased = User.objects.filter(leased_until__gt=timezone.now())
+        counts = {}
+        for prefix, field in (("proxy", "proxy_id"), ("endpoint", "proxy__endpoint_hash")):
+            values = [key.split(":", 1)[1] for key in keys if key.startswith(f"{prefix}:")]
+            if values:
+                rows = leased.filter(**{f"{field}__in": values}).values(field).annotate(leases=Count("id"))
+                counts.update((f"{prefix}:{row[field]}", row["leases"]) for row in rows)
+        return counts
+
+    def lease(self, key, until):
+        # Аренда записывается в leased_until пользователя самим lease_users
+        pass
+
+    def release(self, key):
+        pass
+
+    def clear(self):
+        from .models import RateLimitBucket
+
+        RateLimitBucket.objects.all().delete()
+
+
+class ProxyLimiter:
+    """
+    Лимиты выдачи по прокси (см. описание модуля). Параметры читаются из настроек при
+    каждом вызове, поэтому выключенный ограничитель (нулевые лимиты) ничего не стоит.
+    """
+
+    def __init__(self):
+        self._memory = MemoryBackend()
+        self._database = DatabaseBackend()
+        self._endpoints = {}
+        self._endpoints_loaded_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return getattr(settings, "PROXY_RATE_LIMIT", 0)
+
+    @property
+    def burst(self):
+        return getattr(settings, "PROXY_RATE_BURST", 0) or max(1, self.rate)
+
+    @property
+    def max_leases(self):
+        return getattr(settings, "PROXY_MAX_LEASES", 0)
+
+    @property
+    def scope(self):
+        return getattr(settings, "PROXY_LIMIT_SCOPE", "proxy")
+
+    @property
+    def backend(self):
+        if getattr(settings, "PROXY_LIMIT_BACKEND", "memory") == "database":
+            return self._database
+        return self._memory
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    @property
+    def leases_enabled(self):
+        return self.max_leases > 0
+
+    @property
+    def retry_after(self):
+        return max(1, round(1 / self.rate)) if self.rate else 1
+
+    def _load_endpoints(self, proxy_ids):
+        """
+        Дочитывает хеши host:port только тех прокси, которых ещё нет в кеше.
+
+        Раз в USER_POOL_REFRESH_SECONDS кеш сбрасывается, чтобы забыть удалённые
+        и изменённые прокси; новые прокси дочитываются при первом обращении, а не
+        получают ключ proxy:<id> до следующего сброса.
+        """
+        from .models import Proxy
+
+        refresh = getattr(settings, "USER_POOL_REFRESH_SECONDS", 300)
+        with self._lock:
+            if self._endpoints_loaded_at is None or time.monotonic() - self._endpoints_loaded_at > refresh:
+                self._endpoints = {}
+                self._endpoints_loaded_at = time.monotonic()
+            missing = [proxy_id for proxy_id in proxy_ids if proxy_id not in self._endpoints]
+        if not missing:
+            return
+        endpoints = dict.fromkeys(missing)
+        endpoints.update(Proxy.objects.filter(pk__in=missing).values_list("id", "endpoint_hash"))
+        with self._lock:
+            self._endpoints.update(endpoints)
+
+    def _endpoint_of(self, proxy_id):
+        self._load_endpoints([proxy_id])
+        return self._endpoints.get(proxy_id)
+
+    def key(self, proxy_id):
+        """
+        Ключ лимита: прокси или, с PROXY_LIMIT_SCOPE=endpoint, его host:port.
+        """
+        if self.scope == "endpoint":
+            endpoint = self._endpoint_of(proxy_id)
+            if endpoint is not None:
+                return f"endpoint:{endpoint}"
+        return f"proxy:{proxy_id}"
+
+    def allow(self, proxy_id):
+        """
+        Берёт токен выдачи для прокси; False — лимит исчерпан и кандидата нужно пропустить.
+        """
+        if not self.enabled or proxy_id is None:
+            return True
+        return self.backend.acquire(self.key(proxy_id), self.rate, self.burst)
+
+    def lease_capacity(self, proxy_ids):
+        """
+        Сколько ещё аренд можно выдать на каждый ключ лимита прокси proxy_ids: {ключ: число}.
+        """
+        if self.scope == "endpoint":
+            self._load_endpoints(proxy_ids)
+        keys = {self.key(proxy_id) for proxy_id in proxy_ids}
+        counts = self.backend.lease_counts(keys)
+        return {key: max(0, self.max_leases - counts.get(key, 0)) for key in keys}
+
+    def admit(self, pairs, count, capacity):
+        """
+        Первые count ID из пар (ID, прокси), прокси которых не превысили ни лимит аренд,
+        ни частоту выдачи; за каждого выбранного берётся токен, как при одиночном выборе.
+
+        capacity — остаток аренд по ключам, общий для нескольких вызовов в одной выдаче:
+        недостающие ключи дочитываются, выбранные пользователи вычитаются из остатка.
+        """
+        pairs = [(user_id, proxy_id) for user_id, proxy_id in pairs if proxy_id is not None]
+        if self.scope == "endpoint":
+            self._load_endpoints({proxy_id for _, proxy_id in pairs})
+        if self.leases_enabled:
+            missing = {proxy_id for _, proxy_id in pairs if self.key(proxy_id) not in capacity}
+            if missing:
+                capacity.update(self.lease_capacity(missing))
+        selected = []
+        for user_id, proxy_id in pairs:
+            if len(selected) >= count:
+                break
+            key = self.key(proxy_id)
+            if self.leases_enabled and capacity[key] <= 0:
+                continue
+            # Токен берётся после проверки аренд, чтобы не тратить его на отклонённых
+            if not self.allow(proxy_id):
+                continue
+            if self.leases_enabled:
+                capacity[key] -= 1
+            selected.append(user_id)
+        return selected
+
+    def saturated_filter(self, now=None):
+        """
+        Условие на пользователей, прокси которых исчерпали лимит аренд (для запросов к базе).
+        """
+        if not self.leases_enabled:
+            return Q(pk__in=[])
+        field = "proxy__endpoint_hash" if self.scope == "endpoint" else "proxy_id"
+        if self.backend is self._database:
+            from .models import User
+
+            now = now or timezone.now()
+            saturated = (
+                User.objects.filter(leased_until__gt=now)
+                .values(field)
+                .annotate(leases=Count("id"))
+                .filter(leases__gte=self.max_leases)
+                .values(field)
+            )
+            return Q(**{f"{field}__in": saturated})
+        keys = [key.split(":", 1)[1] for key in self._memory.saturated(self.max_leases)]
+        if self.scope != "endpoint":
+            keys = [int(key) for key in keys]
+        return Q(**{f"{field}__in": keys})
+
+    def lease(self, proxy_id, until):
+        if self.leases_enabled:
+            self.backend.lease(self.key(proxy_id), until)
+
+    def release(self, proxy_id):
+        if self.leases_enabled:
+            self.backend.release(self.key(proxy_id))
+
+    def clear(self):
+        self._memory.clear()
+        with self._lock:
+            self._endpoints = {}
+            self._endpoints_loaded_at = None
+
+
+proxy_limiter = ProxyLimiter()
@@ -0,0 +1,32 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+
+def dumps(data):
+    """
+    Сериализует данные в компактный JSON (orjson, если установлен).
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class CompactJSONRenderer(BaseRenderer):
+    """
+    Рендерер для ?format=compact: минимальный JSON без отступов и лишних полей.
+    """
+
+    media_type = "application/json"
+    format = "compact"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return dumps(data)
@@ -0,0 +1,204 @@
+import fcntl
+import os
+import sys
+import threading
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from logger import logger
+
+
+class FileLeaderLock:
+    """
+    Лидерство через flock на файле: работает для процессов одной машины.
+    Блокировка снимается операционной системой при завершении процесса.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.SCHEDULER_LOCK_FILE
+        self._file = None
+
+    def acquire(self):
+        file = open(self.path, "a+")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        file.seek(0)
+        file.truncate()
+        file.write(str(os.getpid()))
+        file.flush()
+        self._file = file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class AdvisoryLeaderLock:
+    """
+    Лидерство через pg_try_advisory_lock: работает для процессов на разных машинах.
+    Блокировка держится отдельным соединением и снимается при его закрытии.
+    """
+
+    def __init__(self, key=None, alias=DEFAULT_DB_ALIAS):
+        self.key = key or settings.SCHEDULER_LOCK_KEY
+        self.alias = alias
+        self._connection = None
+
+    def acquire(self):
+        connection = connections.create_connection(self.alias)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.key])
+            acquired = cursor.fetchone()[0]
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def release(self):
+        if self._connection is not None:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [self.key])
+            self._connection.close()
+            self._connection = None
+
+
+def leader_lock():
+    """
+    Блокировка лидера: advisory lock для PostgreSQL, иначе файловая.
+    """
+    if connections[DEFAULT_DB_ALIAS].vendor == "postgresql":
+        return AdvisoryLeaderLock()
+    return FileLeaderLock()
+
+
+def job_definitions():
+    """
+    Задачи планировщика: (ID, функция, триггер).
+    """
+    from .tasks import check_proxy_health, delete_expired_proxies, delete_old_job_executions, update_user_statuses
+
+    jobs = [
+        ("delete_expired_proxies", delete_expired_proxies, CronTrigger(minute=0, timezone=settings.TIME_ZONE)),
+        ("update_user_statuses", update_user_statuses, IntervalTrigger(minutes=10)),
+        (
+            "delete_old_job_executions",
+            delete_old_job_executions,
+            CronTrigger(hour=3, minute=30, timezone=settings.TIME_ZONE),
+        ),
+    ]
+    if settings.HEALTHCHECK_INTERVAL_MINUTES:
+        jobs.append(
+            ("check_proxy_health", check_proxy_health, IntervalTrigger(minutes=settings.HEALTHCHECK_INTERVAL_MINUTES))
+        )
+    return jobs
+
+
+def register_jobs(scheduler):
+    """
+    Сохраняет задачи в DjangoJobStore.
+
+    Задача с тем же триггером не перезаписывается, чтобы перезапуск лидера
+    не сдвигал время следующего запуска; задачи, которых больше нет в
+    job_definitions, удаляются.
+    """
+    jobs = job_definitions()
+    for job_id, func, trigger in jobs:
+        existing = scheduler.get_job(job_id)
+        if existing is not None and str(existing.trigger) == str(trigger):
+            continue
+        scheduler.add_job(func, trigger, id=job_id, name=job_id, replace_existing=True)
+        logger.info(f"Задача {job_id} зарегистрирована: {trigger}.")
+    known = {job_id for job_id, *_ in jobs}
+    for job in scheduler.get_jobs():
+        if job.id not in known:
+            job.remove()
+
+
+def create_scheduler():
+    """
+    Планировщик с задачами и историей запусков в базе (django_apscheduler).
+
+    Пропущенные запуски схлопываются в один, одна задача не выполняется параллельно сама с собой.
+    """
+    from django_apscheduler.jobstores import DjangoJobStore
+
+    scheduler = BackgroundScheduler(
+        timezone=settings.TIME_ZONE,
+        job_defaults={
+            "coalesce": True,
+            "max_instances": 1,
+            "misfire_grace_time": settings.SCHEDULER_MISFIRE_GRACE_SECONDS,
+        },
+    )
+    scheduler.add_jobstore(DjangoJobStore(), "default")
+    return scheduler
+
+
+def start_scheduler(scheduler):
+    """
+    Запускает планировщик и регистрирует задачи до первого запуска любой из них.
+    """
+    scheduler.start(paused=True)
+    register_jobs(scheduler)
+    scheduler.resume()
+
+
+def is_management_command(argv=None):
+    """
+    Процесс запущен через manage.py (кроме runserver), а не веб-сервером.
+    """
+    argv = argv if argv is not None else sys.argv
+    return os.path.basename(argv[0]) == "manage.py" and argv[1:2] != ["runserver"]
+
+
+class EmbeddedScheduler:
+    """
+    Планировщик внутри веб-процесса, запускаемый только в процессе-лидере.
+
+    Процессы, не получившие блокировку, раз в retry_interval секунд пробуют
+    стать лидером снова, поэтому при гибели лидера задачи подхватит другой воркер.
+    """
+
+    def __init__(self, lock=None, retry_interval=None):
+        self.lock = lock
+        self.retry_interval = retry_interval or settings.SCHEDULER_LEADER_RETRY_SECONDS
+        self.scheduler = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._wait_for_leadership, name="scheduler-leader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _wait_for_leadership(self):
+        lock = self.lock or leader_lock()
+        while not self._stopped.is_set():
+            try:
+                if lock.acquire():
+                    break
+            except Exception as e:
+                logger.error(f"Не удалось получить блокировку планировщика: {e}")
+            self._stopped.wait(self.retry_interval)
+        else:
+            return
+        self.scheduler = create_scheduler()
+        start_scheduler(self.scheduler)
+        logger.info(f"Scheduler start (лидер — процесс {os.getpid()})")
+
+    def shutdown(self):
+        self._stopped.set()
+        if self.scheduler is not None and self.scheduler.running:
+            logger.info("Stopping scheduler...")
+            self.scheduler.shutdown(wait=False)
+            logger.info("Scheduler stopped.")
@@ -0,0 +1,221 @@
+import random
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class FenwickTree:
+    """
+    Дерево Фенвика над массивом неотрицательных весов.
+
+    Изменение веса и поиск элемента по префиксной сумме — O(log n),
+    добавление и удаление последнего элемента — O(log n) и O(1).
+    """
+
+    def __init__(self):
+        self._tree = [0.0]  # индексация с 1
+        self._values = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def _prefix(self, index):
+        total = 0.0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def append(self, weight):
+        self._values.append(weight)
+        index = len(self._values)
+        # Узел index покрывает отрезок (index - lowbit, index]
+        self._tree.append(weight + self._prefix(index - 1) - self._prefix(index - (index & -index)))
+
+    def pop(self):
+        # От последнего элемента не зависит ни один из оставшихся узлов
+        self._tree.pop()
+        return self._values.pop()
+
+    def set(self, position, weight):
+        delta = weight - self._values[position]
+        self._values[position] = weight
+        index = position + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def get(self, position):
+        return self._values[position]
+
+    def total(self):
+        return self._prefix(len(self._values))
+
+    def find(self, value):
+        """
+        Возвращает позицию первого элемента, на котором префиксная сумма превышает value.
+        """
+        index = 0
+        step = 1 << (len(self._values).bit_length())
+        while step:
+            candidate = index + step
+            if candidate < len(self._tree) and self._tree[candidate] <= value:
+                index = candidate
+                value -= self._tree[candidate]
+            step >>= 1
+        return min(index, len(self._values) - 1)
+
+
+class WeightedSet:
+    """
+    Множество ключей с весами и взвешенным случайным выбором за O(log n).
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._positions = {}
+        self._weights = FenwickTree()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def set(self, key, weight):
+        position = self._positions.get(key)
+        if position is None:
+            self._positions[key] = len(self._keys)
+            self._keys.append(key)
+            self._weights.append(weight)
+        else:
+            self._weights.set(position, weight)
+
+    def discard(self, key):
+        position = self._positions.pop(key, None)
+        if position is None:
+            return
+        last_key = self._keys.pop()
+        last_weight = self._weights.pop()
+        if last_key != key:
+            self._keys[position] = last_key
+            self._positions[last_key] = position
+            self._weights.set(position, last_weight)
+
+    def total(self):
+        return self._weights.total()
+
+    def sample(self):
+        if not self._keys:
+            return None
+        total = self._weights.total()
+        if total <= 0:
+            return random.choice(self._keys)
+        return self._keys[self._weights.find(random.random() * total)]
+
+
+class Ewma:
+    """
+    Экспоненциально взвешенное скользящее среднее.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def add(self, sample, alpha):
+        self.value = sample if self.value is None else self.value + alpha * (sample - self.value)
+
+
+class HealthScores:
+    """
+    Скользящая доля успешных статусов и задержка для каждого прокси и пользователя.
+
+    Оценки обновляются по сообщениям о статусах и хранятся в памяти процесса.
+    Вес пользователя при взвешенном выборе — произведение оценки пользователя
+    и оценки его прокси. Хранится не больше HEALTH_SCORE_MAX_ENTRIES оценок
+    каждого вида: дольше всех не обновлявшиеся вытесняются, удалённые
+    пользователи и прокси убираются через discard.
+    """
+
+    def __init__(self, max_entries=None):
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._users = OrderedDict()
+        self._proxies = OrderedDict()
+
+    @property
+    def alpha(self):
+        return getattr(settings, "HEALTH_SCORE_ALPHA", 0.1)
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, "HEALTH_SCORE_MAX_ENTRIES", 200_000)
+
+    def record(self, user_id, proxy_id, success, latency_ms=None):
+        alpha = self.alpha
+        max_entries = self.max_entries
+        with self._lock:
+            for scores, key in ((self._users, user_id), (self._proxies, proxy_id)):
+                success_rate, latency = scores.setdefault(key, (Ewma(1.0), Ewma()))
+                scores.move_to_end(key)
+                success_rate.add(1.0 if success else 0.0, alpha)
+                if latency_ms is not None:
+                    latency.add(latency_ms, alpha)
+                while len(scores) > max_entries:
+                    # Вытесненный получает оценку по умолчанию, как новый
+                    scores.popitem(last=False)
+
+    def discard(self, user_ids=(), proxy_ids=()):
+        """
+        Забывает оценки удалённых пользователей и прокси.
+        """
+        with self._lock:
+            for scores, keys in ((self._users, user_ids), (self._proxies, proxy_ids)):
+                for key in keys:
+                    scores.pop(key, None)
+
+    def __len__(self):
+        return len(self._users) + len(self._proxies)
+
+    def _score(self, scores, key):
+        item = scores.get(key)
+        if item is None:
+            return 1.0
+        success_rate, latency = item
+        score = success_rate.value
+        if latency.value is not None:
+            reference = getattr(settings, "HEALTH_SCORE_LATENCY_MS", 1000)
+            score *= reference / (reference + latency.value)
+        # Минимальный вес оставляет шанс восстановиться даже плохим прокси
+        return max(score, getattr(settings, "HEALTH_SCORE_MIN_WEIGHT", 0.01))
+
+    def user_score(self, user_id):
+        return self._score(self._users, user_id)
+
+    def proxy_score(self, proxy_id):
+        return self._score(self._proxies, proxy_id)
+
+    def snapshot(self, user_id=None, proxy_id=None):
+        """
+        Возвращает текущие оценки (доля успехов, задержка) пользователя и прокси.
+        """
+        with self._lock:
+            result = {}
+            for name, scores, key in (("user", self._users, user_id), ("proxy", self._proxies, proxy_id)):
+                item = scores.get(key)
+                if item is not None:
+                    result[name] = {"success_rate": item[0].value, "latency_ms": item[1].value}
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._proxies.clear()
+
+
+health_scores = HealthScores()
@@ -1,6 +1,18 @@
 from rest_framework import serializers
 
-from .models import Proxy, User, UserAgent
+from .domains import normalize_domain
+from .models import Proxy, User, UserAgent, UserDomainStatus
+
+# Поля компактного ответа (?format=compact), выбираемые через values_list без ModelSerializer
+COMPACT_USER_FIELDS = ("id", "proxy__url", "user_agent__agent")
+
+
+def compact_user(row):
+    """
+    Преобразует кортеж из values_list(*COMPACT_USER_FIELDS) в компактный словарь.
+    """
+    user_id, proxy_url, agent = row
+    return {"id": user_id, "proxy": proxy_url, "user_agent": agent}
 
 
 class ProxySerializer(serializers.ModelSerializer):
@@ -9,6 +21,16 @@ class ProxySerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class ProxyLookupSerializer(serializers.ModelSerializer):
+    """
+    Прокси без URL: ответ на поиск не требует расшифровки.
+    """
+
+    class Meta:
+        model = Proxy
+        fields = ("id", "expire_at", "is_alive", "latency_ms", "last_checked_at")
+
+
 class UserAgentSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserAgent
@@ -22,3 +44,44 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = "__all__"
+        # Аренду меняют только lease/release: иначе клиент мог бы перехватить или снять чужую
+        read_only_fields = ("consecutive_failures", "next_available_at", "lease_token", "leased_until")
+
+
+class DomainField(serializers.CharField):
+    """
+    Домен целевого сайта: принимает домен или URL и приводит его к нижнему регистру.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("max_length", 2048)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        domain = normalize_domain(super().to_internal_value(data))
+        if domain is None:
+            raise serializers.ValidationError("Ожидается домен или URL сайта.")
+        return domain
+
+
+class UserStatusSerializer(serializers.Serializer):
+    status = serializers.IntegerField()
+    latency_ms = serializers.FloatField(required=False, min_value=0)
+    # Статус на отдельном сайте; без domain меняется общий статус пользователя
+    domain = DomainField(required=False)
+
+
+class UserDomainStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserDomainStatus
+        fields = ("user", "domain", "status", "consecutive_failures", "next_available_at", "last_used_at")
+
+
+class UserStatusItemSerializer(UserStatusSerializer):
+    id = serializers.IntegerField()
+
+
+class LeaseReleaseSerializer(serializers.Serializer):
+    token = serializers.CharField(max_length=32)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    statuses = UserStatusItemSerializer(many=True, required=False)
@@ -0,0 +1,258 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from logger import logger
+
+from .cooldown import HEALTHY_STATUS
+from .domains import domain_pools
+from .models import Proxy, User, UserDomainStatus
+from .pool import available_users, healthy_pool
+from .ratelimit import proxy_limiter
+from .scoring import health_scores
+
+
+def lease_users(count, ttl=None, pool=healthy_pool, fields=None, limiter=proxy_limiter):
+    """
+    Выдаёт в аренду до count различных доступных пользователей.
+
+    Пользователи захватываются одним условным UPDATE, поэтому параллельные
+    клиенты никогда не получат одну и ту же пару прокси × User-Agent.
+    С PROXY_MAX_LEASES на один прокси выдаётся не больше этого числа одновременных аренд,
+    с PROXY_RATE_LIMIT за каждого пользователя берётся токен выдачи его прокси.
+    Возвращает токен аренды, время её окончания и список пользователей
+    (моделей или, если переданы fields, кортежей values_list; первым полем должно быть "id").
+    """
+    ttl = ttl or getattr(settings, "USER_LEASE_TTL_SECONDS", 300)
+    oversample = getattr(settings, "USER_LEASE_OVERSAMPLE", 2)
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    leased_until = now + timezone.timedelta(seconds=ttl)
+
+    limiter = limiter if limiter is not None and (limiter.leases_enabled or limiter.enabled) else None
+    capacity = {}
+    claimed = 0
+    candidates = pool.sample(count * oversample)
+    # Сначала пробуем ID из пула, затем добираем недостающих прямо из базы
+    for candidate_ids in (candidates, None):
+        needed = count - claimed
+        if needed <= 0:
+            break
+        free = available_users(now)
+        if candidate_ids is not None:
+            free = free.filter(pk__in=candidate_ids)
+        if limiter is None:
+            free = free.values("pk")[:needed]
+        elif candidate_ids is not None:
+            pairs = [(user_id, pool.proxy_of(user_id)) for user_id in candidate_ids]
+            free = free.filter(pk__in=limiter.admit(pairs, needed, capacity))
+        else:
+            free = free.exclude(limiter.saturated_filter(now)).values_list("pk", "proxy_id")[: needed * oversample]
+            free = limiter.admit(free, needed, capacity)
+        # Условие свободности повторяется во внешнем запросе, чтобы UPDATE перепроверил его после блокировки строк
+        claimed += available_users(now).filter(pk__in=free).update(leased_until=leased_until, lease_token=token)
+
+    leased = User.objects.filter(lease_token=token)
+    if fields:
+        rows = list(leased.values_list(*fields, "proxy_id"))
+        users = [row[:-1] for row in rows]
+        pairs = [(row[0], row[-1]) for row in rows]
+    else:
+        users = list(leased.select_related("proxy", "user_agent"))
+        pairs = [(user.pk, user.proxy_id) for user in users]
+    for user_id, proxy_id in pairs:
+        pool.defer(user_id, proxy_id, leased_until)
+        if limiter is not None:
+            limiter.lease(proxy_id, leased_until)
+    logger.info(f"Выдано в аренду {len(users)} пользователей из {count} запрошенных.")
+    return token, leased_until, users
+
+
+def record_report(user_id, proxy_id, status, latency_ms=None, pool=healthy_pool, scores=health_scores):
+    """
+    Обновляет оценки здоровья пользователя и прокси по сообщению о статусе.
+    """
+    scores.record(user_id, proxy_id, status == HEALTHY_STATUS, latency_ms)
+    pool.reweight(user_id, proxy_id)
+
+
+def report_statuses(statuses, queryset=None, pool=healthy_pool, latencies=None):
+    """
+    Применяет статусы вида {id: status} и пересчитывает cooldown и оценки здоровья.
+
+    Статус 200 применяется одним UPDATE; неудачные статусы зависят от счётчика
+    неудач каждого пользователя и записываются одним bulk_update.
+    latencies — необязательные задержки запросов {id: мс}.
+    С общим пулом и USER_STATUS_WRITE_BEHIND статусы пользователей пула
+    записываются в базу асинхронно (см. api/sharedpool.py).
+    Возвращает множество ID, которые были найдены и обновлены.
+    """
+    latencies = latencies or {}
+    now = timezone.now()
+    updated_ids = set()
+    if queryset is None and getattr(pool, "write_behind", False):
+        # Пользователи общего пула обновляются в памяти, в базу их статусы запишет фоновый поток
+        for user in pool.apply_statuses(statuses, now):
+            record_report(user.pk, user.proxy_id, user.status, latencies.get(user.pk), pool=pool)
+            updated_ids.add(user.pk)
+        statuses = {user_id: status for user_id, status in statuses.items() if user_id not in updated_ids}
+    queryset = queryset if queryset is not None else User.objects.all()
+    healthy_ids = [user_id for user_id, status in statuses.items() if status == HEALTHY_STATUS]
+    failed_ids = [user_id for user_id, status in statuses.items() if status != HEALTHY_STATUS]
+
+    if healthy_ids:
+        matched = list(queryset.filter(pk__in=healthy_ids).values_list("pk", "proxy_id"))
+        User.objects.filter(pk__in=[user_id for user_id, _ in matched]).update(
+            status=HEALTHY_STATUS,
+            consecutive_failures=0,
+            next_available_at=None,
+            updated_at=now,
+            leased_until=None,
+            lease_token=None,
+        )
+        pool.add_many(matched)
+        for user_id, proxy_id in matched:
+            record_report(user_id, proxy_id, HEALTHY_STATUS, latencies.get(user_id), pool=pool)
+            updated_ids.add(user_id)
+
+    if failed_ids:
+        users = list(queryset.filter(pk__in=failed_ids).only("id", "proxy_id", "consecutive_failures"))
+        for user in users:
+            user.apply_status(statuses[user.pk], now)
+            user.leased_until = None
+            user.lease_token = None
+        User.objects.bulk_update(users, [*User.STATUS_FIELDS, "leased_until", "lease_token"], batch_size=500)
+        for user in users:
+            pool.sync(user)
+            record_report(user.pk, user.proxy_id, user.status, latencies.get(user.pk), pool=pool)
+            updated_ids.add(user.pk)
+    return updated_ids
+
+
+def report_domain_statuses(statuses, domains=domain_pools):
+    """
+    Применяет статусы вида {(id, домен): status} к статусам пользователей на сайтах.
+
+    Общий статус пользователя и оценки здоровья не меняются: 429 от одного сайта
+    не влияет на выдачу для остальных. Записи о новых парах создаются одним
+    bulk_create, существующие обновляются одним bulk_update.
+    Возвращает список обновлённых записей UserDomainStatus.
+    """
+    now = timezone.now()
+    user_ids = set(User.objects.filter(pk__in={user_id for user_id, _ in statuses}).values_list("pk", flat=True))
+    existing = {
+        (row.user_id, row.domain): row
+        for row in UserDomainStatus.objects.filter(
+            user_id__in=user_ids, domain__in={domain for _, domain in statuses}
+        ).only("id", "user_id", "domain", "consecutive_failures")
+    }
+    created, updated = [], []
+    for (user_id, domain), status in statuses.items():
+        if user_id not in user_ids:
+            continue
+        row = existing.get((user_id, domain))
+        if row is None:
+            row = UserDomainStatus(user_id=user_id, domain=domain)
+            created.append(row)
+        else:
+            updated.append(row)
+        row.apply_status(status, now)
+        row.last_used_at = now
+
+    fields = [*UserDomainStatus.STATUS_FIELDS, "last_used_at"]
+    # Пару могли создать параллельно: тогда её перезапишет последний отчёт
+    UserDomainStatus.objects.bulk_create(
+        created, update_conflicts=True, unique_fields=["user", "domain"], update_fields=fields, batch_size=500
+    )
+    UserDomainStatus.objects.bulk_update(updated, fields, batch_size=500)
+    for row in (*created, *updated):
+        domains.update(row.domain, row.user_id, row.status, row.next_available_at)
+    return [*created, *updated]
+
+
+def release_users(token, ids=None, statuses=None, pool=healthy_pool, latencies=None, limiter=proxy_limiter):
+    """
+    Завершает аренду по токену: сообщает статусы и освобождает пользователей.
+
+    Если ids не переданы, освобождаются все пользователи, выданные по токену.
+    Возвращает количество освобождённых и обновлённых пользователей.
+    """
+    leased = User.objects.filter(lease_token=token)
+    # Прокси запоминаются до того, как report_statuses снимет аренду с обновлённых пользователей
+    proxies = dict(leased.values_list("pk", "proxy_id")) if limiter is not None and limiter.leases_enabled else {}
+    updated_ids = report_statuses(statuses or {}, queryset=leased, pool=pool, latencies=latencies)
+
+    to_release = leased.exclude(pk__in=updated_ids)
+    if ids is not None:
+        to_release = to_release.filter(pk__in=ids)
+    released_users = list(to_release.values_list("pk", "proxy_id", "status", "next_available_at"))
+    released = to_release.update(leased_until=None, lease_token=None)
+    for user_id, proxy_id, status, until in released_users:
+        pool.update(user_id, proxy_id, status, until)
+    for user_id in [*updated_ids, *(row[0] for row in released_users)]:
+        if user_id in proxies:
+            limiter.release(proxies[user_id])
+    return released, len(updated_ids)
+
+
+def purge_expired_proxies(
+    now=None, proxy_batch_size=None, user_batch_size=None, pause=None, pool=healthy_pool, scores=health_scores
+):
+    """
+    Удаляет прокси с истёкшим сроком вместе с их пользователями ограниченными пачками.
+
+    Вместо одного QuerySet.delete(), который собирает весь каскад в памяти и держит
+    блокировку записи на всё время удаления, пользователи удаляются прямыми
+    DELETE по user_batch_size строк, затем прокси — по proxy_batch_size.
+    Каждая пачка — отдельная короткая транзакция, между пачками делается пауза,
+    чтобы запросы к API успевали получить блокировку.
+    Возвращает метрики: удалённые прокси и пользователи, число транзакций,
+    суммарное и максимальное время блокировки в мс.
+    """
+    now = now or timezone.now()
+    proxy_batch_size = proxy_batch_size or getattr(settings, "PROXY_DELETE_BATCH_SIZE", 100)
+    user_batch_size = user_batch_size or getattr(settings, "USER_DELETE_BATCH_SIZE", 5000)
+    pause = pause if pause is not None else getattr(settings, "PROXY_DELETE_PAUSE_SECONDS", 0.05)
+    metrics = {"proxies": 0, "users": 0, "batches": 0, "lock_ms_total": 0.0, "lock_ms_max": 0.0}
+
+    def run_batch(delete):
+        started = time.perf_counter()
+        with transaction.atomic():
+            deleted = delete()
+        lock_ms = (time.perf_counter() - started) * 1000
+        metrics["batches"] += 1
+        metrics["lock_ms_total"] += lock_ms
+        metrics["lock_ms_max"] = max(metrics["lock_ms_max"], lock_ms)
+        time.sleep(pause)
+        return deleted
+
+    expired = Proxy.objects.filter(expire_at__lte=now)
+    while proxy_ids := list(expired.order_by("pk").values_list("pk", flat=True)[:proxy_batch_size]):
+        users = User.objects.filter(proxy_id__in=proxy_ids)
+        while user_ids := list(users.values_list("pk", flat=True)[:user_batch_size]):
+
+            def delete_users():
+                # _raw_delete не каскадирует: статусы на сайтах удаляются в той же транзакции
+                UserDomainStatus.objects.filter(user_id__in=user_ids)._raw_delete(UserDomainStatus.objects.db)
+                return User.objects.filter(pk__in=user_ids)._raw_delete(User.objects.db)
+
+            metrics["users"] += run_batch(delete_users)
+            pool.discard_many(user_ids)
+            scores.discard(user_ids=user_ids)
+
+        def delete_proxies():
+            # Пользователи, созданные для этих прокси после удаления пачек выше
+            domain_statuses = UserDomainStatus.objects.filter(user__proxy_id__in=proxy_ids)
+            domain_statuses._raw_delete(UserDomainStatus.objects.db)
+            metrics["users"] += users._raw_delete(User.objects.db)
+            return Proxy.objects.filter(pk__in=proxy_ids)._raw_delete(Proxy.objects.db)
+
+        metrics["proxies"] += run_batch(delete_proxies)
+        scores.discard(proxy_ids=proxy_ids)
+
+    metrics["lock_ms_total"] = round(metrics["lock_ms_total"], 1)
+    metrics["lock_ms_max"] = round(metrics["lock_ms_max"], 1)
+    return metrics
@@ -0,0 +1,636 @@
+"""
+Пул доступных пользователей в общей памяти всех процессов одной машины.
+
+Пул хранится в файле, отображённом в память (mmap; по умолчанию в /dev/shm), и
+состоит из заголовка и параллельных массивов фиксированной ёмкости: ID
+пользователя, ID прокси, момент освобождения, время последней выдачи, счётчик
+неудач и байт состояния. Все воркеры gunicorn читают одни и те же страницы,
+поэтому изменение статуса — это запись одного байта, видимая остальным сразу,
+без базы данных и без Redis.
+
+Часть массивов до sorted_count отсортирована по ID (поиск слота — бинарный),
+пользователи, добавленные после загрузки, дописываются в хвост под файловой
+блокировкой. Перезагрузка пишет новый файл и атомарно подменяет им старый, а
+старый помечается retired: увидев пометку, процессы открывают новый файл. На время
+перезагрузки старый файл помечается reloading: запись, попавшая в него, повторяется
+под файловой блокировкой уже в новом файле.
+"""
+
+import atexit
+import bisect
+import fcntl
+import os
+import random
+import struct
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from mmap import mmap
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from logger import logger
+
+from .affinity import HashRing
+from .cooldown import available_statuses
+from .pool import available_at, available_users, deferred_users
+from .scoring import health_scores
+
+MAGIC = b"PMPOOL01"
+# magic, ёмкость, заполнено слотов, из них отсортировано, время загрузки, пометка retired
+HEADER = struct.Struct("<8sQQQdB")
+HEADER_SIZE = 64
+COUNT_OFFSET, SORTED_OFFSET, LOADED_AT_OFFSET, RETIRED_OFFSET = 16, 24, 32, 40
+# Значения пометки: файл актуален, заменён новым, перезагружается
+ACTIVE, RETIRED, RELOADING = 0, 1, 2
+
+FREE, AVAILABLE, DEFERRED = 0, 1, 2
+MAX_FAILURES = 0xFFFF
+# Случайных проб на выбор, прежде чем искать доступный слот перебором
+MAX_PROBES = 64
+# Кандидатов, из которых least-recently-used выбирает давнее всех выданного
+LRU_CANDIDATES = 8
+
+
+def layout(capacity):
+    """
+    Смещения массивов (формат, смещение) и полный размер файла для ёмкости capacity.
+    """
+    offsets = {}
+    offset = HEADER_SIZE
+    for name, fmt, size in (
+        ("ids", "q", 8),
+        ("proxies", "q", 8),
+        ("until", "d", 8),
+        ("used", "d", 8),
+        ("failures", "H", 2),
+        ("state", "B", 1),
+    ):
+        offsets[name] = (fmt, offset)
+        # Следующий массив выравнивается по 8 байтам
+        offset += (size * capacity + 7) // 8 * 8
+    return offsets, offset
+
+
+class SharedArrays:
+    """
+    Отображение файла пула: заголовок и массивы в виде memoryview.
+    """
+
+    def __init__(self, mm):
+        self.mm = mm
+        magic, self.capacity, *_ = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError("Файл не является пулом пользователей")
+        offsets, _ = layout(self.capacity)
+        view = memoryview(mm)
+        for name, (fmt, offset) in offsets.items():
+            size = struct.calcsize(fmt) * self.capacity
+            setattr(self, name, view[offset : offset + size].cast(fmt))
+
+    def _get(self, fmt, offset):
+        return struct.unpack_from(fmt, self.mm, offset)[0]
+
+    @property
+    def count(self):
+        return self._get("<Q", COUNT_OFFSET)
+
+    @count.setter
+    def count(self, value):
+        struct.pack_into("<Q", self.mm, COUNT_OFFSET, value)
+
+    @property
+    def sorted_count(self):
+        return self._get("<Q", SORTED_OFFSET)
+
+    @property
+    def loaded_at(self):
+        return self._get("<d", LOADED_AT_OFFSET)
+
+    @loaded_at.setter
+    def loaded_at(self, value):
+        struct.pack_into("<d", self.mm, LOADED_AT_OFFSET, value)
+
+    @property
+    def retired(self):
+        return self.mm[RETIRED_OFFSET] == RETIRED
+
+    @property
+    def replaced(self):
+        """
+        Файл заменён или заменяется новым: записи в него могут потеряться.
+        """
+        return self.mm[RETIRED_OFFSET] != ACTIVE
+
+    def retire(self):
+        self.mm[RETIRED_OFFSET] = RETIRED
+
+    def mark_reloading(self, reloading=True):
+        self.mm[RETIRED_OFFSET] = RELOADING if reloading else ACTIVE
+
+    def find(self, user_id):
+        """
+        Слот пользователя или None: бинарный поиск в отсортированной части и поиск в хвосте.
+        """
+        sorted_count = self.sorted_count
+        index = bisect.bisect_left(self.ids, user_id, 0, sorted_count)
+        if index < sorted_count and self.ids[index] == user_id:
+            return index
+        count = self.count
+        if count > sorted_count:
+            tail = self.ids[sorted_count:count].tobytes()
+            needle = struct.pack("<q", user_id)
+            position = tail.find(needle)
+            while position != -1:
+                if position % 8 == 0:
+                    return sorted_count + position // 8
+                position = tail.find(needle, position + 1)
+        return None
+
+    def selectable(self, index, now):
+        state = self.state[index]
+        if state == AVAILABLE:
+            return True
+        if state == DEFERRED and self.until[index] <= now:
+            # Отложенный пользователь возвращается в пул при первом обращении после освобождения
+            self.state[index] = AVAILABLE
+            return True
+        return False
+
+    def scan(self, start, now):
+        """
+        Ближайший после start доступный слот; нужен, когда случайные пробы не нашли его.
+        """
+        count = self.count
+        states = self.state[:count].tobytes()
+        for position in (states.find(AVAILABLE.to_bytes(), start), states.find(AVAILABLE.to_bytes(), 0, start)):
+            if position != -1:
+                return position
+        position = states.find(DEFERRED.to_bytes())
+        while position != -1:
+            if self.selectable(position, now):
+                return position
+            position = states.find(DEFERRED.to_bytes(), position + 1)
+        return None
+
+
+def write_pool_file(path, rows, loaded_at, headroom):
+    """
+    Записывает новый файл пула: rows — кортежи (ID, ID прокси, момент освобождения, неудачи),
+    отсортированные по ID. Файл подменяет старый атомарно.
+    """
+    count = len(rows)
+    capacity = count + headroom
+    offsets, size = layout(capacity)
+    buffer = bytearray(size)
+    HEADER.pack_into(buffer, 0, MAGIC, capacity, count, count, loaded_at, 0)
+    columns = {
+        "ids": array("q", (row[0] for row in rows)),
+        "proxies": array("q", (row[1] for row in rows)),
+        "until": array("d", (row[2] for row in rows)),
+        "failures": array("H", (min(row[3], MAX_FAILURES) for row in rows)),
+        "state": array("B", (DEFERRED if row[2] else AVAILABLE for row in rows)),
+    }
+    for name, column in columns.items():
+        fmt, offset = offsets[name]
+        data = column.tobytes()
+        buffer[offset : offset + len(data)] = data
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(buffer)
+    os.replace(temporary, path)
+
+
+class StatusFlusher:
+    """
+    Записывает в базу статусы, применённые в общем пуле, фоновым потоком раз в interval секунд.
+
+    Для каждого пользователя пишется только последний статус. При сбое записи
+    статусы возвращаются в очередь, при завершении процесса очередь дописывается.
+    """
+
+    def __init__(self, interval=None):
+        self._interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def interval(self):
+        if self._interval is not None:
+            return self._interval
+        return getattr(settings, "USER_STATUS_FLUSH_SECONDS", 1.0)
+
+    def enqueue(self, users):
+        with self._lock:
+            for user in users:
+                self._pending[user.pk] = user
+            # После fork поток родителя в дочернем процессе не работает
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="status-flusher", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        from .models import User
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            User.objects.bulk_update(
+                list(pending.values()), [*User.STATUS_FIELDS, "leased_until", "lease_token"], batch_size=500
+            )
+        except Exception:
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            raise
+        return len(pending)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Не удалось записать статусы пользователей: {e}")
+            finally:
+                close_old_connections()
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class SharedUserPool:
+    """
+    Пул доступных пользователей в общей памяти (см. описание модуля) с тем же
+    интерфейсом, что и HealthyUserPool.
+
+    Стратегии выбора работают случайными пробами слотов: uniform берёт первый
+    доступный, weighted принимает кандидата с вероятностью, равной произведению
+    оценок пользователя и прокси (то же распределение, что у HealthyUserPool),
+    least-recently-used выбирает давнее всех выданного из нескольких кандидатов,
+    то есть приближённо.
+
+    При write_behind статусы из PATCH /users/status/ применяются в общей памяти
+    сразу, а в базу пишутся StatusFlusher с задержкой до USER_STATUS_FLUSH_SECONDS.
+    """
+
+    def __init__(self, path=None, refresh_interval=None, scores=health_scores, flusher=None):
+        self._path = path
+        self._refresh_interval = refresh_interval
+        self._scores = scores
+        self._data = None
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._lock_pid = None
+        self.flusher = flusher if flusher is not None else StatusFlusher()
+        self._ring = HashRing()
+        self._ring_lock = threading.Lock()
+        self._ring_source = (None, 0)
+
+    @property
+    def path(self):
+        return self._path or settings.USER_POOL_SHARED_PATH
+
+    @property
+    def refresh_interval(self):
+        if self._refresh_interval is not None:
+            return self._refresh_interval
+        return getattr(settings, "USER_POOL_REFRESH_SECONDS", 300)
+
+    @property
+    def write_behind(self):
+        return getattr(settings, "USER_STATUS_WRITE_BEHIND", False)
+
+    def _file_lock(self):
+        # flock принадлежит открытому файлу, поэтому после fork файл открывается заново
+        if self._lock_pid != os.getpid():
+            self._lock_file = open(f"{self.path}.lock", "a+")
+            self._lock_pid = os.getpid()
+        return self._lock_file
+
+    @contextmanager
+    def _locked(self):
+        lock = self._file_lock()
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _open(self):
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        try:
+            return SharedArrays(mmap(fd, 0))
+        except ValueError:
+            return None
+        finally:
+            os.close(fd)
+
+    def _arrays(self):
+        data = self._data
+        if data is None or data.retired:
+            with self._lock:
+                data = self._data
+                if data is None or data.retired:
+                    data = self._data = self._open()
+        return data
+
+    @property
+    def loaded(self):
+        data = self._arrays()
+        return data is not None and data.loaded_at > 0
+
+    def needs_reload(self):
+        data = self._arrays()
+        return data is None or time.time() - data.loaded_at > self.refresh_interval
+
+    def _ensure_loaded(self):
+        if self.needs_reload():
+            # Пока пул перезагружает другой процесс, используется текущий
+            self.load(blocking=self._arrays() is None)
+        return self._arrays()
+
+    def load(self, blocking=True):
+        """
+        Перечитывает пул из базы и публикует его всем процессам.
+        """
+        lock = self._file_lock()
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return
+        previous = None
+        try:
+            previous = self._open()
+            if previous is not None and not blocking and time.time() - previous.loaded_at <= self.refresh_interval:
+                # Пока ждали блокировку, пул уже перезагрузил другой процесс
+                return
+            if previous is not None:
+                # До чтения базы: всё, что запишут в старый файл дальше, повторится в новом (см. _set)
+                previous.mark_reloading()
+            if self.write_behind:
+                self.flusher.flush()
+            now = timezone.now()
+            rows = [
+                (user_id, proxy_id, 0.0, failures)
+                for user_id, proxy_id, failures in available_users(now).values_list(
+                    "id", "proxy_id", "consecutive_failures"
+                )
+            ]
+            deferred = 0
+            for user_id, proxy_id, failures, *moments in deferred_users(now).values_list(
+                "id", "proxy_id", "consecutive_failures", "next_available_at", "leased_until"
+            ):
+                rows.append((user_id, proxy_id, max(m for m in moments if m is not None).timestamp(), failures))
+                deferred += 1
+            rows.sort()
+            headroom = max(getattr(settings, "USER_POOL_SHARED_HEADROOM", 4096), len(rows) // 16)
+            write_pool_file(self.path, rows, time.time(), headroom)
+            if previous is not None:
+                previous.retire()
+            with self._lock:
+                self._data = self._open()
+        finally:
+            if previous is not None and not previous.retired:
+                previous.mark_reloading(False)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        logger.info(f"Общий пул пользователей загружен: {len(rows) - deferred} доступных ID, {deferred} отложенных.")
+
+    def _append(self, data, user_id, proxy_id, until, failures=0):
+        """
+        Дописывает пользователя в хвост; вызывается под файловой блокировкой.
+        """
+        index = data.find(user_id)
+        if index is None:
+            index = data.count
+            if index >= data.capacity:
+                # Хвост заполнен: новые ID появятся после перезагрузки
+                data.loaded_at = 0
+                return
+            data.ids[index] = user_id
+            data.count = index + 1
+        data.proxies[index] = proxy_id
+        data.until[index] = until
+        data.failures[index] = min(failures, MAX_FAILURES)
+        data.state[index] = DEFERRED if until else AVAILABLE
+
+    @staticmethod
+    def _store(data, user_id, state, until, failures):
+        """
+        Записывает состояние в слот пользователя; False, если слота нет.
+        """
+        index = data.find(user_id)
+        if index is None:
+            return False
+        data.until[index] = until
+        if failures is not None:
+            data.failures[index] = min(failures, MAX_FAILURES)
+        data.state[index] = state
+        return True
+
+    def _set(self, user_id, proxy_id, state, until=0.0, failures=None):
+        data = self._arrays()
+        if data is None:
+            return
+        # Запись без блокировки, если файл не заменяется; иначе она повторяется в новом файле
+        # после окончания перезагрузки, которая держит блокировку, пока не опубликует его
+        if self._store(data, user_id, state, until, failures) and not data.replaced:
+            return
+        with self._locked():
+            data = self._arrays()
+            if data is not None and not self._store(data, user_id, state, until, failures) and state != FREE:
+                self._append(data, user_id, proxy_id, until, failures or 0)
+
+    def add(self, user_id, proxy_id):
+        self._set(user_id, proxy_id, AVAILABLE)
+
+    def add_many(self, pairs):
+        for user_id, proxy_id in pairs:
+            self.add(user_id, proxy_id)
+
+    def discard(self, user_id):
+        self._set(user_id, None, FREE)
+
+    def discard_many(self, user_ids):
+        for user_id in user_ids:
+            self.discard(user_id)
+
+    def defer(self, user_id, proxy_id, until):
+        self._set(user_id, proxy_id, DEFERRED, until.timestamp())
+
+    def update(self, user_id, proxy_id, status, until=None, failures=None):
+        """
+        Синхронизирует пул с новым статусом пользователя и временем его освобождения.
+        """
+        if status not in available_statuses():
+            self._set(user_id, proxy_id, FREE, failures=failures)
+        elif until is not None and until > timezone.now():
+            self._set(user_id, proxy_id, DEFERRED, until.timestamp(), failures)
+        else:
+            self._set(user_id, proxy_id, AVAILABLE, failures=failures)
+
+    def sync(self, user):
+        self.update(user.pk, user.proxy_id, user.status, available_at(user), user.consecutive_failures)
+
+    def reweight(self, user_id, proxy_id):
+        # Оценки читаются при каждом выборе, пересчитывать нечего
+        pass
+
+    def apply_statuses(self, statuses, now=None):
+        """
+        Применяет статусы {id: status} к пользователям пула в общей памяти и ставит их
+        в очередь на запись в базу. Возвращает несохранённые модели обновлённых пользователей.
+        """
+        from .models import User
+
+        now = now or timezone.now()
+        data = self._ensure_loaded()
+        if data is None:
+            return []
+        users = []
+        for user_id, status in statuses.items():
+            index = data.find(user_id)
+            if index is None:
+                continue
+            user = User(pk=user_id, proxy_id=data.proxies[index], consecutive_failures=data.failures[index])
+            user.apply_status(status, now)
+            user.leased_until = None
+            user.lease_token = None
+            self.update(user_id, user.proxy_id, user.status, user.next_available_at, user.consecutive_failures)
+            users.append(user)
+        self.flusher.enqueue(users)
+        return users
+
+    def _weight(self, data, index):
+        return self._scores.user_score(data.ids[index]) * self._scores.proxy_score(data.proxies[index])
+
+    def choice(self, strategy="uniform"):
+        """
+        Возвращает ID из пула по стратегии strategy или None, если пул пуст.
+        """
+        data = self._ensure_loaded()
+        if data is None or not data.count:
+            return None
+        count = data.count
+        now = time.time()
+        found = None
+        candidates = []
+        for _ in range(MAX_PROBES):
+            index = random.randrange(count)
+            if not data.selectable(index, now):
+                continue
+            if strategy == "least-recently-used":
+                candidates.append(index)
+                if len(candidates) >= LRU_CANDIDATES:
+                    break
+                continue
+            if strategy == "weighted" and random.random() > self._weight(data, index):
+                found = index if found is None else found
+                continue
+            found = index
+            break
+        if candidates:
+            found = min(candidates, key=lambda index: data.used[index])
+        if found is None:
+            found = data.scan(random.randrange(count), now)
+            if found is None:
+                return None
+        data.used[found] = now
+        return data.ids[found]
+
+    def proxy_of(self, user_id):
+        data = self._arrays()
+        index = data.find(user_id) if data is not None else None
+        return data.proxies[index] if index is not None else None
+
+    def _sync_ring(self, data):
+        # Кольцо своё у каждого процесса: дополняется ID из нового файла и из хвоста текущего
+        source, synced = self._ring_source
+        count = data.count
+        if source is data and synced == count:
+            return
+        if source is not data:
+            synced = 0
+        members = data.ids[synced:count].tolist()
+        if not self._ring.active or (synced == 0 and len(self._ring) > 2 * len(members)):
+            self._ring.build(members)
+        else:
+            self._ring.add_many(members)
+        self._ring_source = (data, count)
+
+    def choice_for_session(self, session, exclude=None):
+        """
+        Возвращает ID, закреплённый за сессией session (см. api/affinity.py), или None.
+        """
+        data = self._ensure_loaded()
+        if data is None:
+            return None
+        now = time.time()
+
+        def accept(user_id):
+            index = data.find(user_id)
+            return index is not None and data.selectable(index, now) and not (exclude and exclude(user_id))
+
+        with self._ring_lock:
+            self._sync_ring(data)
+            user_id = self._ring.lookup(session, accept)
+        if user_id is not None:
+            data.used[data.find(user_id)] = now
+        return user_id
+
+    def sample(self, k):
+        """
+        Возвращает до k различных случайных ID из пула.
+        """
+        data = self._ensure_loaded()
+        if data is None or not data.count:
+            return []
+        count = data.count
+        now = time.time()
+        found = set()
+        for _ in range(4 * k + MAX_PROBES):
+            if len(found) >= k:
+                break
+            index = random.randrange(count)
+            if data.selectable(index, now):
+                found.add(index)
+        if len(found) < k:
+            states = data.state[:count].tobytes()
+            position = states.find(AVAILABLE.to_bytes())
+            while position != -1 and len(found) < k:
+                found.add(position)
+                position = states.find(AVAILABLE.to_bytes(), position + 1)
+        return [data.ids[index] for index in found]
+
+    def clear(self):
+        """
+        Помечает пул устаревшим: при следующем обращении один из процессов перечитает его из базы.
+        """
+        data = self._arrays()
+        if data is not None:
+            data.loaded_at = 0
+
+    def __len__(self):
+        data = self._arrays()
+        if data is None:
+            return 0
+        return data.state[: data.count].tobytes().count(AVAILABLE.to_bytes())
+
+    def __contains__(self, user_id):
+        data = self._arrays()
+        if data is None:
+            return False
+        index = data.find(user_id)
+        return index is not None and data.state[index] == AVAILABLE
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cooldown import HEALTHY_STATUS
+from .domains import domain_pools
+from .models import Proxy, User, UserDomainStatus
+from .pool import healthy_pool
+from .scoring import health_scores
+
+
+@receiver(post_save, sender=User)
+def sync_pool_on_save(sender, instance, **kwargs):
+    """
+    Обновляет пул здоровых пользователей при сохранении пользователя.
+    """
+    if healthy_pool.loaded:
+        healthy_pool.sync(instance)
+
+
+@receiver(post_delete, sender=User)
+def sync_pool_on_delete(sender, instance, **kwargs):
+    """
+    Удаляет пользователя из пула и его оценку здоровья при удалении записи.
+    """
+    healthy_pool.discard(instance.pk)
+    health_scores.discard(user_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Proxy)
+def discard_proxy_scores_on_delete(sender, instance, **kwargs):
+    """
+    Оценка удалённого прокси больше не понадобится.
+    """
+    health_scores.discard(proxy_ids=[instance.pk])
+
+
+@receiver(post_save, sender=UserDomainStatus)
+def sync_domain_pool_on_save(sender, instance, **kwargs):
+    """
+    Обновляет пул сайта при сохранении статуса пользователя на нём (например, в админке).
+    """
+    domain_pools.update(instance.domain, instance.user_id, instance.status, instance.next_available_at)
+
+
+@receiver(post_delete, sender=UserDomainStatus)
+def sync_domain_pool_on_delete(sender, instance, **kwargs):
+    """
+    Без записи для сайта действует общий статус пользователя.
+    """
+    domain_pools.update(instance.domain, instance.user_id, HEALTHY_STATUS)
@@ -1,21 +1,67 @@
+import time
+
+from django.conf import settings
 from django.utils import timezone
+from django_apscheduler.models import DjangoJobExecution
+from django_apscheduler.util import close_old_connections
 
-from api.models import Proxy, User
+from api.cooldown import cooldown_statuses
+from api.healthcheck import run_health_check
+from api.metrics import observe_job
+from api.models import User, UserDomainStatus
+from api.services import purge_expired_proxies
 from logger import logger
 
 
+@close_old_connections
+@observe_job("delete_expired_proxies", rows=("proxies", "users"))
 def delete_expired_proxies():
-    now = timezone.now()
-    expired_proxies = Proxy.objects.filter(expire_at__lte=now)
-    count = expired_proxies.count()
-    expired_proxies.delete()
-    logger.info(f"Удалено {count} прокси, у которых истек срок действия.")
+    """
+    Удаляет прокси с истёкшим сроком и их пользователей пачками (см. purge_expired_proxies).
+    """
+    started = time.perf_counter()
+    metrics = purge_expired_proxies()
+    logger.info(
+        f"Удалено {metrics['proxies']} прокси, у которых истек срок действия, и {metrics['users']} пользователей "
+        f"за {time.perf_counter() - started:.1f} с: {metrics['batches']} транзакций, "
+        f"блокировка {metrics['lock_ms_total']} мс всего, до {metrics['lock_ms_max']} мс за транзакцию."
+    )
+    return metrics
 
 
+@close_old_connections
+@observe_job("update_user_statuses", rows=("users", "domain_statuses"))
 def update_user_statuses():
+    """
+    Переводит в статус 200 пользователей и их статусы на сайтах с истёкшим cooldown.
+
+    Выбор пользователей от этой задачи не зависит (см. available_users), она лишь
+    поддерживает поле status актуальным для админки и статистики. Счётчик неудач
+    не сбрасывается: повторный 429 продолжит рост задержки. Статусы на сайтах
+    сбрасываются каждый по своему cooldown, общий статус пользователя их не затрагивает.
+    """
     now = timezone.now()
-    one_minute_ago = now - timezone.timedelta(minutes=1)
-    users_to_update = User.objects.filter(updated_at__lte=one_minute_ago, status=429)
-    count = users_to_update.count()
-    users_to_update.update(status=200)
-    logger.info(f"Обновлено {count} статусов пользователей на '200'.")
+    users_to_update = User.objects.filter(status__in=cooldown_statuses(), next_available_at__lte=now)
+    count = users_to_update.update(status=200, next_available_at=None)
+    domain_statuses = UserDomainStatus.objects.filter(status__in=cooldown_statuses(), next_available_at__lte=now)
+    domain_count = domain_statuses.update(status=200, next_available_at=None)
+    logger.info(f"Обновлено {count} статусов пользователей и {domain_count} статусов на сайтах на '200'.")
+    return {"users": count, "domain_statuses": domain_count}
+
+
+@close_old_connections
+@observe_job("check_proxy_health", rows=("checked", "changed"))
+def check_proxy_health():
+    """
+    Проверяет все прокси и выключает выдачу пользователей мёртвых прокси.
+    """
+    return run_health_check()
+
+
+@close_old_connections
+@observe_job("delete_old_job_executions")
+def delete_old_job_executions():
+    """
+    Удаляет историю запусков задач старше SCHEDULER_HISTORY_DAYS дней.
+    """
+    DjangoJobExecution.objects.delete_old_job_executions(settings.SCHEDULER_HISTORY_DAYS * 24 * 60 * 60)
@@ -0,0 +1,22 @@
+import pytest
+
+from api.domains import domain_pools
+from api.pool import healthy_pool
+from api.ratelimit import proxy_limiter
+from api.scoring import health_scores
+
+
+@pytest.fixture(autouse=True)
+def reset_healthy_pool():
+    """
+    Reset the in-process user and domain pools health scores and proxy limits so state doesn't leak between tests.
+    """
+    healthy_pool.clear()
+    domain_pools.clear()
+    health_scores.clear()
+    proxy_limiter.clear()
+    yield
+    healthy_pool.clear()
+    domain_pools.clear()
+    health_scores.clear()
+    proxy_limiter.clear()
@@ -0,0 +1,218 @@
+"""
+Local stand-ins for a target site, an HTTP proxy and a SOCKS5 proxy.
+
+The servers run on an asyncio loop in a background thread, so synchronous code under test
+(which may start its own event loop) can talk to them over 127.0.0.1.
+"""
+
+import asyncio
+import base64
+import datetime
+import ipaddress
+import socket
+import ssl
+import threading
+from urllib.parse import urlsplit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+
+def self_signed_certificate(directory):
+    """
+    Writes a self-signed certificate for 127.0.0.1 and its key to directory; returns their paths.
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.UTC)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), True)
+        .sign(key, hashes.SHA256())
+    )
+    certfile, keyfile = directory / "proxy.crt", directory / "proxy.key"
+    certfile.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    keyfile.write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+    return str(certfile), str(keyfile)
+
+
+async def pipe(reader, writer):
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def tunnel(client_reader, client_writer, upstream_reader, upstream_writer):
+    await asyncio.gather(pipe(client_reader, upstream_writer), pipe(upstream_reader, client_writer))
+
+
+class LocalServers:
+    """
+    Target answers 204 on every path except /status/<code> and keeps the connection open
+    if asked to. The HTTP proxy supports both absolute-form requests and CONNECT and,
+    if credentials are set, requires Basic auth.
+    """
+
+    def __init__(self, credentials=None, certificate=None):
+        self.credentials = credentials
+        # (certfile, keyfile): the HTTP proxy is also served over TLS as an https:// proxy
+        self.certificate = certificate
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.requests = []
+        self.target_connections = 0
+
+    def start(self):
+        self.thread.start()
+        self.target_port = self._serve(self.handle_target)
+        self.http_proxy_port = self._serve(self.handle_http_proxy)
+        self.socks_proxy_port = self._serve(self.handle_socks_proxy)
+        self.socks4_proxy_port = self._serve(self.handle_socks4_proxy)
+        if self.certificate:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(*self.certificate)
+            self.https_proxy_port = self._serve(self.handle_http_proxy, ssl=context)
+        return self
+
+    def stop(self):
+        async def cancel_handlers():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(cancel_handlers(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def _serve(self, handler, ssl=None):
+        async def start():
+            server = await asyncio.start_server(handler, "127.0.0.1", 0, ssl=ssl)
+            return server.sockets[0].getsockname()[1]
+
+        return asyncio.run_coroutine_threadsafe(start(), self.loop).result()
+
+    @property
+    def target_url(self):
+        return f"http://127.0.0.1:{self.target_port}/generate_204"
+
+    def proxy_url(self, scheme="http"):
+        ports = {"socks4": self.socks4_proxy_port, "socks5": self.socks_proxy_port, "socks5h": self.socks_proxy_port}
+        port = ports.get(scheme, self.https_proxy_port if scheme == "https" else self.http_proxy_port)
+        userinfo = f"{self.credentials[0]}:{self.credentials[1]}@" if self.credentials else ""
+        return f"{scheme}://{userinfo}127.0.0.1:{port}"
+
+    @staticmethod
+    def dead_proxy_url():
+        # A free port nobody listens on, so the connection is refused
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    async def handle_target(self, reader, writer):
+        self.target_connections += 1
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            path = head.split(b" ", 2)[1].decode()
+            self.requests.append(head)
+            status = int(path.rsplit("/", 1)[1]) if path.startswith("/status/") else 204
+            keep_alive = b"Connection: keep-alive" in head
+            connection = "keep-alive" if keep_alive else "close"
+            writer.write(f"HTTP/1.1 {status} Test\r\nContent-Length: 0\r\nConnection: {connection}\r\n\r\n".encode())
+            await writer.drain()
+            if not keep_alive:
+                break
+        writer.close()
+
+    def authorized(self, head):
+        if not self.credentials:
+            return True
+        token = base64.b64encode(f"{self.credentials[0]}:{self.credentials[1]}".encode())
+        return b"Proxy-Authorization: Basic " + token in head
+
+    async def handle_http_proxy(self, reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        method, target, rest = head.split(b" ", 2)
+        if not self.authorized(head):
+            writer.write(b"HTTP/1.1 407 Proxy Authentication Required\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            writer.close()
+            return
+        if method == b"CONNECT":
+            host, port = target.decode().rsplit(":", 1)
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+            writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+            await writer.drain()
+        else:
+            url = urlsplit(target.decode())
+            upstream_reader, upstream_writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            upstream_writer.write(method + b" " + (url.path or "/").encode() + b" " + rest)
+            await upstream_writer.drain()
+        await tunnel(reader, writer, upstream_reader, upstream_writer)
+
+    async def handle_socks_proxy(self, reader, writer):
+        _, count = await reader.readexactly(2)
+        methods = await reader.readexactly(count)
+        if self.credentials:
+            if 2 not in methods:
+                writer.write(b"\x05\xff")
+                writer.close()
+                return
+            writer.write(b"\x05\x02")
+            _, length = await reader.readexactly(2)
+            username = await reader.readexactly(length)
+            password = await reader.readexactly((await reader.readexactly(1))[0])
+            ok = (username.decode(), password.decode()) == tuple(self.credentials)
+            writer.write(b"\x01\x00" if ok else b"\x01\x01")
+            if not ok:
+                writer.close()
+                return
+        else:
+            writer.write(b"\x05\x00")
+        _, _, _, address_type = await reader.readexactly(4)
+        if address_type == 1:
+            host = socket.inet_ntoa(await reader.readexactly(4))
+        else:
+            host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+        port = int.from_bytes(await reader.readexactly(2), "big")
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        writer.write(b"\x05\x00\x00\x01\x7f\x00\x00\x01\x00\x00")
+        await writer.drain()
+        await tunnel(reader, writer, upstream_reader, upstream_writer)
+
+    async def handle_socks4_proxy(self, reader, writer):
+        header = await reader.readexactly(8)
+        port = int.from_bytes(header[2:4], "big")
+        user_id = (await reader.readuntil(b"\x00"))[:-1].decode()
+        if header[4:7] == b"\x00\x00\x00":
+            # SOCKS4a: the host name follows the user id
+            host = (await reader.readuntil(b"\x00"))[:-1].decode()
+        else:
+            host = socket.inet_ntoa(header[4:8])
+        if self.credentials and user_id != self.credentials[0]:
+            writer.write(b"\x00\x5b" + bytes(6))
+            writer.close()
+            return
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        writer.write(b"\x00\x5a" + bytes(6))
+        await writer.drain()
+        await tunnel(reader, writer, upstream_reader, upstream_writer)
@@ -50,3 +50,26 @@ def test_proxy_admin_form_valid_none_url():
     form_data = {"url": None}
     form = ProxyAdminForm(data=form_data)
     assert form.is_valid()
+
+
+@pytest.mark.django_db
+def test_user_agent_admin_create_users_action(monkeypatch):
+    """
+    Test that the admin action creates users for the selected agents.
+    """
+    from django.contrib.admin.sites import site
+
+    from api.admin import UserAgentAdmin
+    from api.models import User, UserAgent
+
+    Proxy.objects.create(url="http://127.0.0.1:8080")
+    Proxy.objects.create(url="http://127.0.0.1:8081")
+    agent = UserAgent.objects.create(agent="ua")
+    model_admin = UserAgentAdmin(UserAgent, site)
+    messages = []
+    monkeypatch.setattr(model_admin, "message_user", lambda request, message: messages.append(message))
+
+    model_admin.create_users(None, UserAgent.objects.filter(pk=agent.pk))
+
+    assert User.objects.filter(user_agent=agent).count() == 2
+    assert messages == ["Создано 2 пользователей."]
@@ -2,7 +2,7 @@ import pytest
 from cryptography.fernet import Fernet
 from django.conf import settings
 
-from api.fields import ENCRYPTED_PREFIX, EncryptedCharField
+from api.fields import ENCRYPTED_PREFIX, DecryptionCache, EncryptedCharField, decryption_cache
 
 
 @pytest.fixture
@@ -89,6 +89,16 @@ def test_encrypted_char_field_encryption_failure(encrypted_char_field, monkeypat
         encrypted_char_field.get_prep_value("test")
 
 
+def test_encrypted_char_field_keeps_encrypted_value(encrypted_char_field, monkeypatch):
+    """
+    Test that an already encrypted value is stored as is instead of being decrypted and encrypted again.
+    """
+    token = Fernet(settings.CRYPTOGRAPHY_KEY.encode()).encrypt(b"http://10.0.0.1:8000").decode()
+    monkeypatch.setattr(encrypted_char_field, "get_cipher", lambda: pytest.fail("cipher must not be used"))
+
+    assert encrypted_char_field.get_prep_value(f"{ENCRYPTED_PREFIX}{token}") == f"{ENCRYPTED_PREFIX}{token}"
+
+
 @pytest.mark.django_db
 def test_encrypted_char_field_incorrect_key(encrypted_char_field, monkeypatch):
     """
@@ -97,3 +107,81 @@ def test_encrypted_char_field_incorrect_key(encrypted_char_field, monkeypatch):
     monkeypatch.delattr(settings, "CRYPTOGRAPHY_KEY", raising=True)
     with pytest.raises(AttributeError):
         encrypted_char_field.get_cipher()
+
+
+@pytest.mark.django_db
+def test_encrypted_char_field_decryption_cached(encrypted_char_field, monkeypatch):
+    """
+    Test that repeated decryption of the same value is served from the cache.
+    """
+    encrypted_value = encrypted_char_field.get_prep_value("Cached secret")
+    decryption_cache.clear()
+    assert encrypted_char_field.from_db_value(encrypted_value, None, None) == "Cached secret"
+    assert decryption_cache.stats()["misses"] == 1
+
+    class FailingCipher:
+        def decrypt(self, value):
+            raise AssertionError("cipher must not be used on a cache hit")
+
+    monkeypatch.setattr(encrypted_char_field, "get_cipher", lambda: FailingCipher())
+    assert encrypted_char_field.to_python(encrypted_value) == "Cached secret"
+    assert decryption_cache.stats()["hits"] == 1
+
+
+@pytest.mark.django_db
+def test_encrypted_char_field_cache_ignored_after_key_removal(encrypted_char_field, settings):
+    """
+    Test that cached plaintext is not served once the key it was encrypted with is removed.
+    """
+    encrypted_value = encrypted_char_field.get_prep_value("Old key secret")
+    assert encrypted_char_field.from_db_value(encrypted_value, None, None) == "Old key secret"
+    settings.CRYPTOGRAPHY_KEY = Fernet.generate_key().decode()
+    settings.CRYPTOGRAPHY_KEYS = [settings.CRYPTOGRAPHY_KEY]
+    assert encrypted_char_field.from_db_value(encrypted_value, None, None) == "(Decryption Error)"
+
+
+@pytest.mark.django_db
+def test_encrypted_char_field_decrypts_with_previous_keys(encrypted_char_field, settings):
+    """
+    Test that after rotation new values use the new key and old values still decrypt with the previous one.
+    """
+    old_value = encrypted_char_field.get_prep_value("Old key secret")
+    old_key = settings.CRYPTOGRAPHY_KEY
+    settings.CRYPTOGRAPHY_KEY = Fernet.generate_key().decode()
+    settings.CRYPTOGRAPHY_KEYS = [settings.CRYPTOGRAPHY_KEY, old_key]
+    decryption_cache.clear()
+
+    assert encrypted_char_field.from_db_value(old_value, None, None) == "Old key secret"
+    new_value = encrypted_char_field.get_prep_value("New key secret")
+    token = new_value[len(ENCRYPTED_PREFIX) :].encode()
+    assert Fernet(settings.CRYPTOGRAPHY_KEY.encode()).decrypt(token) == b"New key secret"
+
+
+def test_decryption_cache_lru_eviction():
+    """
+    Test that the cache evicts the least recently used entry when full.
+    """
+    cache = DecryptionCache(maxsize=2, ttl=None)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert len(cache) == 2
+
+
+def test_decryption_cache_ttl(monkeypatch):
+    """
+    Test that expired entries are not returned.
+    """
+    now = [1000.0]
+    monkeypatch.setattr("api.fields.time.monotonic", lambda: now[0])
+    cache = DecryptionCache(maxsize=10, ttl=60)
+    cache.set("a", "1")
+    now[0] += 30
+    assert cache.get("a") == "1"
+    now[0] += 31
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 0, "maxsize": 10, "hits": 1, "misses": 1}
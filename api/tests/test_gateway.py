@@ -0,0 +1,222 @@
+import asyncio
+import base64
+
+import pytest
+
+from api.gateway import Gateway, StatusReporter
+from api.models import Proxy, User, UserAgent, UserDomainStatus
+
+from api.tests.servers import LocalServers, self_signed_certificate
+
+
+@pytest.fixture
+def servers():
+    servers = LocalServers().start()
+    yield servers
+    servers.stop()
+
+
+def create_users(proxy_url, count=2):
+    proxy = Proxy.objects.create(url=proxy_url)
+    return [
+        User.objects.create(user_agent=UserAgent.objects.create(agent=f"Pool-Agent/{i}"), proxy=proxy, status=200)
+        for i in range(count)
+    ]
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1]), head
+
+
+def run_client(scenario, **kwargs):
+    """
+    Starts a gateway on a free port, runs scenario(reader, writer, gateway) against it and flushes reports.
+    """
+
+    async def main():
+        gateway = Gateway(**kwargs)
+        server = await gateway.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+        try:
+            return await scenario(reader, writer, gateway)
+        finally:
+            writer.close()
+            server.close()
+            await gateway.close()
+
+    return asyncio.run(main())
+
+
+def get(url, *headers):
+    return f"GET {url} HTTP/1.1\r\nHost: ignored\r\nUser-Agent: scraper/1.0\r\n{''.join(headers)}\r\n".encode()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("scheme", ["http", "socks5", "socks4"])
+def test_gateway_forwards_with_user_agent_and_reports_status(servers, scheme):
+    """
+    Test that the gateway sends the pool user's User-Agent upstream and records the response status.
+    """
+    users = create_users(servers.proxy_url(scheme), count=1)
+    target = f"http://127.0.0.1:{servers.target_port}"
+
+    async def scenario(reader, writer, gateway):
+        writer.write(get(f"{target}/status/429"))
+        return (await read_response(reader))[0]
+
+    assert run_client(scenario) == 429
+    head = servers.requests[-1]
+    assert head.startswith(b"GET /status/429 ")
+    assert b"User-Agent: Pool-Agent/0\r\n" in head
+    assert b"scraper/1.0" not in head
+    user = User.objects.get(pk=users[0].pk)
+    assert (user.status, user.consecutive_failures) == (429, 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_gateway_target_errors_keep_user_available(servers):
+    """
+    Test that 404 and 500 from the target site do not count against the user.
+    """
+    users = create_users(servers.proxy_url("socks5"), count=1)
+    target = f"http://127.0.0.1:{servers.target_port}"
+
+    async def scenario(reader, writer, gateway):
+        statuses = []
+        for code in (404, 500):
+            writer.write(get(f"{target}/status/{code}"))
+            statuses.append((await read_response(reader))[0])
+        return statuses
+
+    assert run_client(scenario) == [404, 500]
+    user = User.objects.get(pk=users[0].pk)
+    assert (user.status, user.consecutive_failures) == (200, 0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_gateway_through_https_proxy(tmp_path, settings):
+    """
+    Test that the gateway talks TLS to an https:// proxy both for forwarded requests and CONNECT.
+    """
+    certificate = self_signed_certificate(tmp_path)
+    servers = LocalServers(certificate=certificate).start()
+    settings.PROXY_TLS_CA_FILE = certificate[0]
+    create_users(servers.proxy_url("https"), count=1)
+
+    async def scenario(reader, writer, gateway):
+        writer.write(get(f"http://127.0.0.1:{servers.target_port}/generate_204"))
+        forwarded = (await read_response(reader))[0]
+        reader, writer = await asyncio.open_connection(*writer.get_extra_info("peername"))
+        writer.write(f"CONNECT 127.0.0.1:{servers.target_port} HTTP/1.1\r\n\r\n".encode())
+        established = (await read_response(reader))[0]
+        writer.close()
+        return forwarded, established
+
+    try:
+        assert run_client(scenario) == (204, 200)
+    finally:
+        servers.stop()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reporter_keeps_statuses_when_write_fails(monkeypatch):
+    """
+    Test that statuses are merged back after a failed write without overriding newer ones.
+    """
+    reporter = StatusReporter()
+    reporter.add(1, 429, latency_ms=10.0)
+    reporter.add(2, 200, domain="example.com")
+
+    def failing_write(statuses, latencies, domain_statuses):
+        reporter.add(1, 200)  # код, пришедший во время записи
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(reporter, "write", failing_write)
+    with pytest.raises(RuntimeError):
+        asyncio.run(reporter.flush())
+    assert reporter.statuses == {1: 200}
+    assert reporter.latencies == {1: 10.0}
+    assert reporter.domain_statuses == {(2, "example.com"): 200}
+
+    written = []
+    monkeypatch.setattr(reporter, "write", lambda *args: written.append(args))
+    assert asyncio.run(reporter.flush()) == 2
+    assert written == [({1: 200}, {1: 10.0}, {(2, "example.com"): 200})]
+    assert len(reporter) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_gateway_reuses_upstream_connections(servers):
+    """
+    Test that keep-alive connections through the proxy are pooled between requests.
+    """
+    create_users(servers.proxy_url("socks5"))
+    target = f"http://127.0.0.1:{servers.target_port}"
+
+    async def scenario(reader, writer, gateway):
+        statuses = []
+        for _ in range(3):
+            writer.write(get(f"{target}/generate_204", "X-Proxy-Session: login-1\r\n"))
+            statuses.append((await read_response(reader))[0])
+        return statuses, len(gateway.upstreams)
+
+    statuses, idle = run_client(scenario)
+    assert statuses == [204, 204, 204]
+    assert idle == 1
+    assert servers.target_connections == 1
+    assert User.objects.filter(status=200, consecutive_failures=0).count() == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_gateway_connect_tunnel(servers):
+    """
+    Test that CONNECT builds a tunnel through the proxy and a refusal is reported as the user's status.
+    """
+    create_users(servers.proxy_url("http"))
+
+    async def scenario(reader, writer, gateway):
+        writer.write(f"CONNECT 127.0.0.1:{servers.target_port} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        established = (await read_response(reader))[0]
+        writer.write(b"GET /generate_204 HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        return established, (await read_response(reader))[0]
+
+    assert run_client(scenario) == (200, 204)
+
+    async def refused(reader, writer, gateway):
+        writer.write(f"CONNECT 127.0.0.1:{servers.target_port} HTTP/1.1\r\n\r\n".encode())
+        return (await read_response(reader))[0]
+
+    servers.credentials = ("user", "secret")  # прокси требует логин, которого нет в URL пользователей
+    assert run_client(refused) == 502
+    assert User.objects.filter(status=407).count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_gateway_authentication_and_domain_statuses(servers):
+    """
+    Test that GATEWAY_TOKEN is enforced and per-domain reporting leaves the global status alone.
+    """
+    create_users(servers.proxy_url("http"), count=1)
+    target = f"http://127.0.0.1:{servers.target_port}"
+    credentials = base64.b64encode(b"session-1:secret").decode()
+
+    async def scenario(reader, writer, gateway):
+        writer.write(get(f"{target}/status/403"))
+        refused = (await read_response(reader))[0]
+        reader, writer = await asyncio.open_connection(*writer.get_extra_info("peername"))
+        writer.write(get(f"{target}/status/403", f"Proxy-Authorization: Basic {credentials}\r\n"))
+        allowed = (await read_response(reader))[0]
+        writer.close()
+        return refused, allowed
+
+    assert run_client(scenario, token="secret", domain_statuses=True) == (407, 403)
+    assert User.objects.get().status == 200
+    assert UserDomainStatus.objects.get().status == 403
+
+    async def no_users(reader, writer, gateway):
+        writer.write(get(f"{target}/generate_204"))
+        return (await read_response(reader))[0]
+
+    # Единственный пользователь заблокирован для этого сайта
+    assert run_client(no_users, domain_statuses=True) == 503
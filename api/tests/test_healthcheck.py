@@ -0,0 +1,125 @@
+import asyncio
+import ssl
+
+import pytest
+from django.utils import timezone
+
+from api.healthcheck import check_many, probe, run_health_check
+from api.models import Proxy, User, UserAgent
+from api.pool import HealthyUserPool, available_users
+
+from api.tests.servers import LocalServers, self_signed_certificate
+
+
+@pytest.fixture
+def servers():
+    servers = LocalServers().start()
+    yield servers
+    servers.stop()
+
+
+@pytest.fixture
+def auth_servers():
+    servers = LocalServers(credentials=("user", "secret")).start()
+    yield servers
+    servers.stop()
+
+
+@pytest.mark.parametrize("scheme", ["http", "socks5", "socks4"])
+def test_probe_through_proxy(servers, scheme):
+    """
+    Test that the target is reached through HTTP and SOCKS5 stand-in proxies.
+    """
+    status, latency_ms = asyncio.run(probe(servers.proxy_url(scheme), servers.target_url, timeout=5))
+
+    assert status == 204
+    assert latency_ms > 0
+    assert servers.requests[-1].startswith(b"GET /generate_204 ")
+
+
+@pytest.mark.parametrize("scheme", ["http", "socks5", "socks4"])
+def test_probe_with_credentials(auth_servers, scheme):
+    """
+    Test that proxy credentials from the URL are sent to HTTP and SOCKS5 proxies.
+    """
+    status, _ = asyncio.run(probe(auth_servers.proxy_url(scheme), auth_servers.target_url, timeout=5))
+
+    assert status == 204
+
+
+def test_probe_through_https_proxy(tmp_path, settings):
+    """
+    Test that an https:// proxy is reached over TLS and the certificate is verified.
+    """
+    certificate = self_signed_certificate(tmp_path)
+    servers = LocalServers(certificate=certificate).start()
+    try:
+        with pytest.raises(ssl.SSLCertVerificationError):
+            asyncio.run(probe(servers.proxy_url("https"), servers.target_url, timeout=5))
+
+        settings.PROXY_TLS_CA_FILE = certificate[0]
+        status, _ = asyncio.run(probe(servers.proxy_url("https"), servers.target_url, timeout=5))
+    finally:
+        servers.stop()
+    assert status == 204
+
+
+def test_check_many_reports_failures(servers):
+    """
+    Test that refused connections, bad credentials and error statuses are reported as failures.
+    """
+    failing_target = f"http://127.0.0.1:{servers.target_port}/status/503"
+    proxies = [(1, servers.proxy_url()), (2, servers.dead_proxy_url()), (3, "ftp://127.0.0.1:1")]
+
+    ok, refused, unsupported = asyncio.run(check_many(proxies, servers.target_url, concurrency=2, timeout=5))
+    (error_status,) = asyncio.run(check_many([(4, servers.proxy_url())], failing_target, concurrency=1, timeout=5))
+
+    assert ok.ok and ok.latency_ms is not None
+    assert not refused.ok
+    assert not unsupported.ok
+    assert not error_status.ok and error_status.error == "HTTP 503"
+
+
+@pytest.mark.django_db
+def test_run_health_check_marks_dead_proxies(servers, settings):
+    """
+    Test that a proxy is marked dead after HEALTHCHECK_MAX_FAILURES failed checks and its users are not handed out.
+    """
+    settings.HEALTHCHECK_MAX_FAILURES = 2
+    alive = Proxy.objects.create(url=servers.proxy_url())
+    dead = Proxy.objects.create(url=servers.dead_proxy_url())
+    agent = UserAgent.objects.create(agent="ua")
+    alive_user = User.objects.create(proxy=alive, user_agent=agent)
+    User.objects.create(proxy=dead, user_agent=agent)
+    pool = HealthyUserPool()
+    pool.load()
+
+    first = run_health_check(target_url=servers.target_url, pool=pool)
+    dead.refresh_from_db()
+    assert first == {"checked": 2, "alive": 1, "changed": 0}
+    assert dead.is_alive and dead.check_failures == 1
+
+    second = run_health_check(target_url=servers.target_url, pool=pool)
+    alive.refresh_from_db()
+    dead.refresh_from_db()
+    assert second["changed"] == 1
+    assert not dead.is_alive
+    assert alive.is_alive and alive.last_success_at is not None and alive.latency_ms is not None
+    assert dead.last_success_at is None and dead.last_checked_at <= timezone.now()
+    assert list(available_users().values_list("pk", flat=True)) == [alive_user.pk]
+    assert not pool.loaded
+
+
+@pytest.mark.django_db
+def test_run_health_check_revives_proxy(servers):
+    """
+    Test that a successful check brings a dead proxy back.
+    """
+    proxy = Proxy.objects.create(url=servers.proxy_url(), is_alive=False)
+    Proxy.objects.filter(pk=proxy.pk).update(check_failures=5)
+
+    stats = run_health_check(target_url=servers.target_url)
+
+    proxy.refresh_from_db()
+    assert stats["changed"] == 1
+    assert proxy.is_alive and proxy.check_failures == 0
@@ -0,0 +1,49 @@
+import pytest
+from django.db import connection
+from django.utils import timezone
+
+from api.cooldown import cooldown_statuses
+from api.models import Proxy, User
+from api.pool import available_users
+
+
+def query_plan(queryset):
+    """
+    Return the EXPLAIN output, forbidding sequential scans on PostgreSQL
+    so that tiny test tables don't hide a missing index.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+        try:
+            return queryset.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+    return queryset.explain()
+
+
+def assert_uses_index(queryset, index_name):
+    plan = query_plan(queryset)
+    if connection.vendor == "postgresql":
+        assert "Seq Scan" not in plan, plan
+    else:
+        assert "SEARCH" in plan, plan
+    assert index_name in plan, plan
+
+
+@pytest.mark.django_db
+def test_update_user_statuses_query_uses_index():
+    queryset = User.objects.filter(status__in=cooldown_statuses(), next_available_at__lte=timezone.now())
+    assert_uses_index(queryset, "user_status_available_idx")
+
+
+@pytest.mark.django_db
+def test_available_users_query_uses_index():
+    assert_uses_index(available_users().values("id"), "user_status_available_idx")
+
+
+@pytest.mark.django_db
+def test_expired_proxies_query_uses_index():
+    queryset = Proxy.objects.filter(expire_at__lte=timezone.now())
+    assert_uses_index(queryset, "proxy_expire_at_idx")
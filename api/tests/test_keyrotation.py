@@ -0,0 +1,97 @@
+import pytest
+from cryptography.fernet import Fernet
+from django.core.management import call_command
+from django.db import connection
+
+from api.fields import ENCRYPTED_PREFIX, decryption_cache
+from api.keyrotation import reencrypt_proxies
+from api.models import Proxy
+
+
+def raw_urls():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, url FROM api_proxy ORDER BY id")
+        return dict(cursor.fetchall())
+
+
+def decrypts_with(key, value):
+    try:
+        Fernet(key.encode()).decrypt(value[len(ENCRYPTED_PREFIX) :].encode())
+        return True
+    except Exception:
+        return False
+
+
+@pytest.fixture
+def rotated(settings):
+    """
+    Ten proxies encrypted with the current key, then a new key put in front of it.
+    """
+    proxies = [Proxy.objects.create(url=f"http://10.0.0.{i}:8000") for i in range(10)]
+    old_key = settings.CRYPTOGRAPHY_KEY
+    settings.CRYPTOGRAPHY_KEY = Fernet.generate_key().decode()
+    settings.CRYPTOGRAPHY_KEYS = [settings.CRYPTOGRAPHY_KEY, old_key]
+    decryption_cache.clear()
+    return proxies, old_key
+
+
+@pytest.mark.django_db
+def test_reencrypt_proxies(rotated, settings):
+    """
+    Test that every URL is rewritten under the new key in batches and stays readable.
+    """
+    proxies, old_key = rotated
+    batches = []
+
+    result = reencrypt_proxies(batch_size=3, progress=lambda result: batches.append(result.last_id))
+
+    assert result.scanned == 10
+    assert result.rewritten == 10
+    assert result.errors == 0
+    assert batches == [proxies[2].pk, proxies[5].pk, proxies[8].pk, proxies[9].pk]
+    assert all(decrypts_with(settings.CRYPTOGRAPHY_KEY, value) for value in raw_urls().values())
+    assert not any(decrypts_with(old_key, value) for value in raw_urls().values())
+
+    settings.CRYPTOGRAPHY_KEYS = [settings.CRYPTOGRAPHY_KEY]
+    decryption_cache.clear()
+    assert Proxy.objects.get(pk=proxies[0].pk).url == "http://10.0.0.0:8000"
+
+
+@pytest.mark.django_db
+def test_reencrypt_proxies_resumes_and_skips_rotated_rows(rotated):
+    """
+    Test that a run can resume after a given id and that a repeated run rewrites nothing.
+    """
+    proxies, _ = rotated
+
+    first = reencrypt_proxies(start_after=proxies[4].pk)
+    assert (first.scanned, first.rewritten) == (5, 5)
+    second = reencrypt_proxies()
+    assert (second.scanned, second.rewritten) == (10, 5)
+    assert reencrypt_proxies().rewritten == 0
+
+
+@pytest.mark.django_db
+def test_reencrypt_proxies_reports_undecryptable_rows(rotated):
+    """
+    Test that rows no key can decrypt are left untouched and reported.
+    """
+    proxies, _ = rotated
+    Proxy.objects.filter(pk=proxies[3].pk).update(url=f"{ENCRYPTED_PREFIX}not-a-token")
+
+    result = reencrypt_proxies()
+
+    assert result.errors == 1
+    assert result.error_ids == [proxies[3].pk]
+    assert raw_urls()[proxies[3].pk] == f"{ENCRYPTED_PREFIX}not-a-token"
+
+
+@pytest.mark.django_db
+def test_reencrypt_proxies_command(rotated, capsys):
+    """
+    Test that the management command reports progress and the summary.
+    """
+    call_command("reencrypt_proxies", "--batch-size", "4")
+    output = capsys.readouterr().out
+    assert "Просмотрено 10 из 10" in output
+    assert "перешифровано 10 из 10" in output
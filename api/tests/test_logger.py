@@ -0,0 +1,84 @@
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+
+from logger import DroppingQueueHandler, JSONFormatter, LogRecordServer, SamplingFilter
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.received = threading.Event()
+
+    def emit(self, record):
+        self.records.append(record)
+        self.received.set()
+
+
+def make_record(msg="message", **extra):
+    record = logging.LogRecord("test", logging.ERROR, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter():
+    """
+    Test that a record is rendered as a single JSON object line.
+    """
+    line = JSONFormatter().format(make_record("Ошибка расшифровки", sample="decryption_error"))
+    data = json.loads(line)
+    assert "\n" not in line
+    assert data["message"] == "Ошибка расшифровки"
+    assert data["level"] == "ERROR"
+    assert data["sample"] == "decryption_error"
+
+
+def test_sampling_filter_limits_marked_messages():
+    """
+    Test that only `limit` sampled records pass per window and the next window reports the rest.
+    """
+    sampling = SamplingFilter(limit=2, interval=60)
+    passed = [sampling.filter(make_record(sample="decryption_error")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert all(sampling.filter(make_record()) for _ in range(5))  # unmarked records are never sampled
+
+    sampling.interval = 0  # start a new window
+    record = make_record(sample="decryption_error")
+    assert sampling.filter(record)
+    assert record.msg.endswith("(пропущено похожих сообщений: 3)")
+
+
+def test_dropping_queue_handler_does_not_block():
+    """
+    Test that records are dropped, not waited on, when the queue is full.
+    """
+    handler = DroppingQueueHandler(queue.Queue(1))
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_socket_sink_delivers_records():
+    """
+    Test that records sent by SocketHandler reach the log server's handlers.
+    """
+    target = logging.getLogger("test-logserver")
+    target.propagate = False
+    capture = ListHandler()
+    target.addHandler(capture)
+    server = LogRecordServer("127.0.0.1", 0, target)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sender = logging.handlers.SocketHandler("127.0.0.1", server.server_address[1])
+    try:
+        sender.handle(make_record("from worker"))
+        assert capture.received.wait(5)
+        assert capture.records[0].getMessage() == "from worker"
+    finally:
+        sender.close()
+        server.shutdown()
+        server.server_close()
+        target.removeHandler(capture)
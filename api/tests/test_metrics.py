@@ -0,0 +1,114 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from api.fields import ENCRYPTED_PREFIX
+from api.metrics import DatabaseCollector, database_collector
+from api.models import Proxy, User, UserAgent
+from api.tasks import update_user_statuses
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture(autouse=True)
+def reset_database_collector():
+    database_collector.clear()
+    yield
+    database_collector.clear()
+
+
+@pytest.fixture
+def users():
+    agent = UserAgent.objects.create(agent="Mozilla/5.0")
+    soon = timezone.now() + timezone.timedelta(minutes=30)
+    proxies = [
+        Proxy.objects.create(url="http://127.0.0.1:8000", expire_at=soon),
+        Proxy.objects.create(url="http://127.0.0.1:8001"),
+        Proxy.objects.create(url="http://127.0.0.1:8002", is_alive=False),
+    ]
+    return [
+        User.objects.create(proxy=proxies[0], user_agent=agent, status=200),
+        User.objects.create(proxy=proxies[1], user_agent=agent, status=200),
+        User.objects.create(proxy=proxies[2], user_agent=agent, status=403),
+    ]
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_exports_gauges(client, users):
+    """
+    Test that /metrics returns Prometheus text with user, proxy and pool gauges.
+    """
+    response = client.get(reverse("metrics"))
+
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain")
+    body = response.content.decode()
+    assert 'proxy_manager_users{status="200"} 2.0' in body
+    assert 'proxy_manager_users{status="403"} 1.0' in body
+    assert 'proxy_manager_proxies{state="dead"} 1.0' in body
+    assert "proxy_manager_proxies_expiring 1.0" in body
+    assert "proxy_manager_pool_users" in body
+
+
+@pytest.mark.django_db
+def test_database_gauges_are_cached(users):
+    """
+    Test that repeated collection within the TTL doesn't query the database again.
+    """
+    collector = DatabaseCollector(ttl=60)
+    with CaptureQueriesContext(connection) as first:
+        list(collector.collect())
+    User.objects.filter(status=403).update(status=200)
+    with CaptureQueriesContext(connection) as second:
+        metrics = list(collector.collect())
+
+    assert len(first) == 2
+    assert len(second) == 0
+    assert [s.value for s in metrics[0].samples] == [2, 1]
+
+
+@pytest.mark.django_db
+def test_request_latency_is_recorded_per_view(client):
+    """
+    Test that the middleware labels request latency by URL name, not by path.
+    """
+    labels = {"view": "random-user", "method": "GET", "status": "404"}
+    before = sample("proxy_manager_http_request_duration_seconds_count", **labels)
+
+    client.get(reverse("random-user"))
+
+    assert sample("proxy_manager_http_request_duration_seconds_count", **labels) == before + 1
+
+
+@pytest.mark.django_db
+def test_decryption_errors_are_counted(users):
+    """
+    Test that a value that can't be decrypted increments the decryption error counter.
+    """
+    before = sample("proxy_manager_decryption_errors_total", source="from_db_value")
+    Proxy.objects.filter(pk=users[0].proxy_id).update(url=f"{ENCRYPTED_PREFIX}not-a-token")
+
+    assert Proxy.objects.get(pk=users[0].proxy_id).url == "(Decryption Error)"
+    assert sample("proxy_manager_decryption_errors_total", source="from_db_value") == before + 1
+
+
+@pytest.mark.django_db
+def test_job_metrics(users):
+    """
+    Test that scheduler jobs record their duration, result and affected rows.
+    """
+    User.objects.filter(pk=users[0].pk).update(status=429, next_available_at=timezone.now())
+    runs = sample("proxy_manager_job_runs_total", job="update_user_statuses", result="success")
+    rows = sample("proxy_manager_job_rows_total", job="update_user_statuses", kind="users")
+    durations = sample("proxy_manager_job_duration_seconds_count", job="update_user_statuses")
+
+    assert update_user_statuses() == {"users": 1, "domain_statuses": 0}
+
+    assert sample("proxy_manager_job_runs_total", job="update_user_statuses", result="success") == runs + 1
+    assert sample("proxy_manager_job_rows_total", job="update_user_statuses", kind="users") == rows + 1
+    assert sample("proxy_manager_job_duration_seconds_count", job="update_user_statuses") == durations + 1
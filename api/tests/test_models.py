@@ -100,3 +100,47 @@ def base_proxy():
     p1 = Proxy.objects.create(url=None, expire_at=None)
     p2 = Proxy.objects.create(url="https://192121@pass@login", expire_at=timezone.now())
     return p1, p2
+
+
+@pytest.mark.django_db
+def test_user_apply_status_exponential_backoff(base_user_agents, base_proxy, settings):
+    """
+    Test that consecutive 429s grow the cooldown exponentially up to the cap and 200 resets it.
+    """
+    settings.USER_COOLDOWN_JITTER = 0
+    settings.USER_COOLDOWN_BASE_SECONDS = 60
+    settings.USER_COOLDOWN_MAX_SECONDS = 300
+    user = User.objects.create(user_agent=base_user_agents[0], proxy=base_proxy[0], status=200)
+    now = timezone.now()
+
+    delays = []
+    for _ in range(5):
+        user.apply_status(429, now)
+        delays.append((user.next_available_at - now).total_seconds())
+    assert delays == [60, 120, 240, 300, 300]
+    assert user.consecutive_failures == 5
+
+    user.apply_status(200, now)
+    assert user.consecutive_failures == 0
+    assert user.next_available_at is None
+
+
+@pytest.mark.django_db
+def test_user_apply_status_without_cooldown(base_user_agents, base_proxy):
+    """
+    Test that statuses outside USER_COOLDOWN_STATUSES disable the user without a cooldown.
+    """
+    user = User.objects.create(user_agent=base_user_agents[0], proxy=base_proxy[0], status=200)
+    user.apply_status(403)
+    assert user.status == 403
+    assert user.consecutive_failures == 1
+    assert user.next_available_at is None
+
+
+@pytest.mark.django_db
+def test_user_created_with_cooldown_status(base_user_agents, base_proxy):
+    """
+    Test that saving a user with status 429 directly puts it on cooldown.
+    """
+    user = User.objects.create(user_agent=base_user_agents[0], proxy=base_proxy[0], status=429)
+    assert user.next_available_at > timezone.now()
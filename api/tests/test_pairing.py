@@ -0,0 +1,142 @@
+import io
+from contextlib import contextmanager
+
+import pytest
+from django.core.management import call_command
+from django.db import transaction
+
+from api import pairing
+from api.importers import ProxyImporter, UserAgentImporter
+from api.models import Proxy, User, UserAgent
+from api.pairing import pair_users
+from api.pool import HealthyUserPool
+
+
+def make_proxies(n):
+    return [Proxy.objects.create(url=f"http://10.0.0.{i}:8000") for i in range(n)]
+
+
+def make_agents(n):
+    return [UserAgent.objects.create(agent=f"ua-{i}") for i in range(n)]
+
+
+@pytest.mark.django_db
+def test_pair_all_creates_missing_pairs_only():
+    """
+    Test that the full cross product is created once and existing pairs are kept.
+    """
+    proxies = make_proxies(3)
+    agents = make_agents(4)
+    existing = User.objects.create(proxy=proxies[0], user_agent=agents[0], status=403)
+
+    assert pair_users(policy="all") == 11
+    assert pair_users(policy="all") == 0
+    assert User.objects.count() == 12
+    existing.refresh_from_db()
+    assert existing.status == 403
+    assert set(User.objects.exclude(pk=existing.pk).values_list("status", flat=True)) == {200}
+
+
+@pytest.mark.django_db
+def test_pair_all_scoped_to_querysets():
+    """
+    Test that proxies and agents restrict the cross product.
+    """
+    proxies = make_proxies(3)
+    make_agents(2)
+
+    created = pair_users(policy="all", proxies=Proxy.objects.filter(pk=proxies[1].pk))
+
+    assert created == 2
+    assert set(User.objects.values_list("proxy_id", flat=True)) == {proxies[1].pk}
+
+
+@pytest.mark.django_db
+def test_pair_random_tops_up_to_k_agents():
+    """
+    Test that the random policy gives each proxy exactly K distinct agents.
+    """
+    proxies = make_proxies(5)
+    agents = make_agents(10)
+    User.objects.create(proxy=proxies[0], user_agent=agents[0])
+
+    created = pair_users(policy="random", per_proxy=3)
+
+    assert created == 14
+    for proxy in proxies:
+        assert proxy.users.count() == 3
+    assert pair_users(policy="random", per_proxy=3) == 0
+
+
+@pytest.mark.django_db
+def test_pair_random_does_not_count_pairs_inserted_concurrently(monkeypatch):
+    """
+    Test that pairs created by another process between the read and the insert are not counted or reloaded.
+    """
+    proxies = make_proxies(2)
+    agents = make_agents(1)
+    concurrent = [proxies[0]]
+    atomic = transaction.atomic
+
+    @contextmanager
+    def atomic_after_concurrent_insert(*args, **kwargs):
+        for proxy in concurrent:
+            if not User.objects.filter(proxy=proxy).exists():
+                User.objects.create(proxy=proxy, user_agent=agents[0])
+        with atomic(*args, **kwargs):
+            yield
+
+    monkeypatch.setattr(pairing.transaction, "atomic", atomic_after_concurrent_insert)
+    assert pair_users(policy="random", per_proxy=1) == 1
+    assert User.objects.count() == 2
+
+    User.objects.filter(proxy=proxies[1]).delete()
+    concurrent.append(proxies[1])
+    pool = HealthyUserPool(refresh_interval=3600)
+    monkeypatch.setattr(pool, "clear", lambda: pytest.fail("pool reloaded without new users"))
+    assert pair_users(policy="random", per_proxy=1, pool=pool) == 0
+
+
+@pytest.mark.django_db
+def test_pair_users_invalidates_pool():
+    """
+    Test that the pool is reloaded after new users are created.
+    """
+    pool = HealthyUserPool(refresh_interval=3600)
+    pool.load()
+    make_proxies(1)
+    make_agents(1)
+
+    pair_users(policy="all", pool=pool)
+
+    assert pool.choice() == User.objects.get().pk
+
+
+@pytest.mark.django_db
+def test_import_creates_users():
+    """
+    Test that importing proxies and agents pairs the new rows.
+    """
+    make_agents(2)
+
+    proxies = ProxyImporter().run(io.StringIO("http://10.0.0.1:8000\nhttp://10.0.0.2:8000\n"))
+    agents = UserAgentImporter().run(io.StringIO("ua-new\n"))
+    skipped = UserAgentImporter(pair=False).run(io.StringIO("ua-unpaired\n"))
+
+    assert (proxies.paired, agents.paired, skipped.paired) == (4, 2, 0)
+    assert User.objects.count() == 6
+
+
+@pytest.mark.django_db
+def test_pair_users_command():
+    """
+    Test the pair_users management command.
+    """
+    make_proxies(2)
+    make_agents(2)
+    out = io.StringIO()
+
+    call_command("pair_users", "--policy", "random", "--per-proxy", "1", stdout=out)
+
+    assert User.objects.count() == 2
+    assert "Создано 2" in out.getvalue()
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+from apscheduler.executors.debug import DebugExecutor
+from django.utils import timezone
+from django_apscheduler.models import DjangoJob, DjangoJobExecution
+
+from api.scheduler import FileLeaderLock, create_scheduler, is_management_command, start_scheduler
+
+
+def test_file_leader_lock_is_exclusive(tmp_path):
+    """
+    Test that only one holder of the file lock can be the leader at a time.
+    """
+    path = tmp_path / "scheduler.lock"
+    leader, follower = FileLeaderLock(path), FileLeaderLock(path)
+
+    assert leader.acquire()
+    assert not follower.acquire()
+    leader.release()
+    assert follower.acquire()
+    follower.release()
+
+
+@pytest.mark.parametrize(
+    "argv, expected",
+    [
+        (["manage.py", "migrate"], True),
+        (["/srv/app/manage.py", "import_proxies", "list.txt"], True),
+        (["manage.py", "runserver"], False),
+        (["/srv/venv/bin/gunicorn", "core.asgi:application"], False),
+    ],
+)
+def test_is_management_command(argv, expected):
+    """
+    Test that management commands other than runserver don't start the embedded scheduler.
+    """
+    assert is_management_command(argv) is expected
+
+
+@pytest.fixture
+def scheduler(settings):
+    settings.HEALTHCHECK_INTERVAL_MINUTES = 0
+    scheduler = create_scheduler()
+    yield scheduler
+    if scheduler.running:
+        scheduler.shutdown(wait=True)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_jobs_are_persisted_and_keep_their_schedule(scheduler):
+    """
+    Test that jobs are stored in DjangoJobStore and a restarted leader keeps the stored next run time.
+    """
+    start_scheduler(scheduler)
+    scheduler.shutdown()
+    stored = dict(DjangoJob.objects.values_list("id", "next_run_time"))
+
+    restarted = create_scheduler()
+    start_scheduler(restarted)
+    restarted.shutdown()
+
+    assert set(stored) == {"delete_expired_proxies", "update_user_statuses", "delete_old_job_executions"}
+    assert dict(DjangoJob.objects.values_list("id", "next_run_time")) == stored
+
+
+@pytest.mark.django_db(transaction=True)
+def test_job_runs_are_recorded(scheduler):
+    """
+    Test that every job run is written to the execution history.
+    """
+    executed = threading.Event()
+    # Jobs run on the scheduler thread: the in-memory test database can't take concurrent writers
+    scheduler.add_executor(DebugExecutor(), "default")
+    start_scheduler(scheduler)
+    # Registered after the job store's own listener, so it fires once the history row is written
+    scheduler.add_listener(lambda event: executed.set(), EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    scheduler.modify_job("update_user_statuses", next_run_time=timezone.now())
+    scheduler.wakeup()
+
+    assert executed.wait(10), "job did not run"
+    assert DjangoJobExecution.objects.filter(job_id="update_user_statuses", status=DjangoJobExecution.SUCCESS).exists()
@@ -0,0 +1,77 @@
+import pytest
+from django.utils import timezone
+
+from api.models import Proxy, User, UserAgent, UserDomainStatus
+from api.pool import HealthyUserPool
+from api.scoring import HealthScores
+from api.services import purge_expired_proxies
+from api.tasks import delete_expired_proxies
+
+
+@pytest.fixture
+def proxies():
+    agents = [UserAgent.objects.create(agent=f"ua-{i}") for i in range(5)]
+    past = timezone.now() - timezone.timedelta(minutes=1)
+    expired = [Proxy.objects.create(url=f"http://10.0.0.{i}:8000", expire_at=past) for i in range(7)]
+    kept = [
+        Proxy.objects.create(url="http://10.0.1.1:8000", expire_at=timezone.now() + timezone.timedelta(days=1)),
+        Proxy.objects.create(url="http://10.0.1.2:8000"),
+    ]
+    for proxy in expired + kept:
+        for agent in agents:
+            User.objects.create(proxy=proxy, user_agent=agent)
+    return expired, kept
+
+
+@pytest.mark.django_db
+def test_purge_expired_proxies_in_batches(proxies):
+    """
+    Test that expired proxies and their users are deleted in bounded batches and metrics are reported.
+    """
+    expired, kept = proxies
+    pool = HealthyUserPool()
+    pool.load()
+    scores = HealthScores()
+    for user in User.objects.all():
+        scores.record(user.pk, user.proxy_id, success=True)
+
+    metrics = purge_expired_proxies(proxy_batch_size=3, user_batch_size=4, pause=0, pool=pool, scores=scores)
+
+    assert metrics["proxies"] == 7
+    assert metrics["users"] == 35
+    # 3 proxy batches: 15 + 15 + 5 users in batches of 4, then one delete per proxy batch
+    assert metrics["batches"] == (4 + 4 + 2) + 3
+    assert metrics["lock_ms_max"] <= metrics["lock_ms_total"]
+    assert set(Proxy.objects.values_list("pk", flat=True)) == {proxy.pk for proxy in kept}
+    assert User.objects.count() == 10
+    assert len(pool) == 10
+    assert len(scores) == 10 + 2
+
+
+@pytest.mark.django_db
+def test_delete_expired_proxies_task(proxies, settings):
+    """
+    Test the scheduled task wrapper.
+    """
+    settings.PROXY_DELETE_PAUSE_SECONDS = 0
+
+    metrics = delete_expired_proxies()
+
+    assert (metrics["proxies"], metrics["users"]) == (7, 35)
+    assert not Proxy.objects.filter(expire_at__lte=timezone.now()).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_delete_expired_proxies_with_domain_statuses(proxies, settings):
+    """
+    Test that per-domain statuses of deleted users don't break the foreign key on commit.
+    """
+    settings.PROXY_DELETE_PAUSE_SECONDS = 0
+    expired, kept = proxies
+    for user in User.objects.filter(proxy__in=[expired[0], kept[0]]):
+        UserDomainStatus.objects.create(user=user, domain="a.example", status=429)
+
+    metrics = delete_expired_proxies()
+
+    assert (metrics["proxies"], metrics["users"]) == (7, 35)
+    assert set(UserDomainStatus.objects.values_list("user__proxy_id", flat=True)) == {kept[0].pk}
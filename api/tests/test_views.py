@@ -22,7 +22,7 @@ def add_base_user_agents():
 
 def add_base_proxy():
     p1 = Proxy.objects.create(url=None, expire_at=None)
-    p2 = Proxy.objects.create(url="https://192121@pass@login", expire_at=timezone.now())
+    p2 = Proxy.objects.create(url="https://192121@pass@login", expire_at=timezone.now() + timezone.timedelta(days=1))
     return (p1, p2)
 
 
@@ -67,8 +67,206 @@ def test_update_status(client, users):
     assert data["status"] == 409
 
 
+@pytest.mark.django_db
+def test_update_status_cannot_change_lease(client, users):
+    """
+    Test that lease fields are read-only in the status update.
+    """
+    token = client.post(f"{reverse('user-lease')}?count=1").json()["token"]
+    leased = User.objects.get(lease_token=token)
+    response = client.patch(
+        reverse("user-status-update", args=[leased.pk]),
+        {"status": 200, "lease_token": "stolen", "leased_until": None},
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    leased.refresh_from_db()
+    assert (leased.lease_token, leased.leased_until is not None) == (token, True)
+
+
 @pytest.mark.django_db
 def test_update_bad_id_status(client):
     url = reverse("user-status-update", args=[12])
     response = client.patch(url, {"status": 409}, content_type="application/json")
     assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_lease_users(client, users):
+    url = reverse("user-lease")
+    response = client.post(f"{url}?count=3")
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["users"]) == 3
+    assert len({user["id"] for user in data["users"]}) == 3
+    assert User.objects.filter(lease_token=data["token"]).count() == 3
+
+    # Leased users are not handed out again until released
+    response = client.post(f"{url}?count=3")
+    assert len(response.json()["users"]) == 1
+    response = client.post(f"{url}?count=1")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_leased_users_skipped_by_random_user(client, users):
+    response = client.post(f"{reverse('user-lease')}?count=3")
+    leased_ids = {user["id"] for user in response.json()["users"]}
+    free_id = ({user["id"] for user in users} - leased_ids).pop()
+    for _ in range(10):
+        assert client.get(reverse("random-user")).json()["id"] == free_id
+
+
+@pytest.mark.django_db
+def test_lease_bad_count(client, users):
+    url = reverse("user-lease")
+    assert client.post(f"{url}?count=0").status_code == 400
+    assert client.post(f"{url}?count=abc").status_code == 400
+
+
+@pytest.mark.django_db
+def test_release_leased_users(client, users):
+    data = client.post(f"{reverse('user-lease')}?count=4").json()
+    first, second, *rest = [user["id"] for user in data["users"]]
+    response = client.post(
+        reverse("user-lease-release"),
+        {"token": data["token"], "statuses": [{"id": first, "status": 429}, {"id": second, "status": 200}]},
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    assert response.json() == {"released": 2, "updated": 2}
+    assert User.objects.get(pk=first).status == 429
+    assert not User.objects.filter(lease_token=data["token"]).exists()
+
+    response = client.post(f"{reverse('user-lease')}?count=4")
+    assert {user["id"] for user in response.json()["users"]} == {second, *rest}
+
+
+@pytest.mark.django_db
+def test_release_with_unknown_token(client, users):
+    response = client.post(reverse("user-lease-release"), {"token": "missing"}, content_type="application/json")
+    assert response.status_code == 200
+    assert response.json() == {"released": 0, "updated": 0}
+
+
+@pytest.mark.django_db
+def test_bulk_update_status(client, users):
+    first, second, *_ = [user["id"] for user in users]
+    response = client.patch(
+        reverse("user-status-bulk-update"),
+        [{"id": first, "status": 429}, {"id": second, "status": 403}, {"id": 10_000, "status": 429}],
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    assert response.json() == {"updated": sorted([first, second]), "not_found": [10_000]}
+    assert User.objects.get(pk=first).status == 429
+    assert User.objects.get(pk=second).status == 403
+
+
+@pytest.mark.django_db
+def test_bulk_update_status_removes_users_from_pool(client, users):
+    ids = [user["id"] for user in users]
+    client.patch(
+        reverse("user-status-bulk-update"),
+        [{"id": user_id, "status": 429} for user_id in ids[1:]],
+        content_type="application/json",
+    )
+    for _ in range(10):
+        assert client.get(reverse("random-user")).json()["id"] == ids[0]
+
+
+@pytest.mark.django_db
+def test_bulk_update_status_invalid_payload(client):
+    url = reverse("user-status-bulk-update")
+    assert client.patch(url, [], content_type="application/json").status_code == 400
+    assert client.patch(url, [{"id": 1}], content_type="application/json").status_code == 400
+    assert client.patch(url, {"id": 1, "status": 200}, content_type="application/json").status_code == 400
+
+
+@pytest.mark.django_db
+def test_get_random_user_compact(client, users):
+    response = client.get(reverse("random-user"), {"format": "compact"})
+    assert response.status_code == 200
+    assert response["content-type"] == "application/json"
+    data = response.json()
+    expected = {
+        user["id"]: {"id": user["id"], "proxy": user["proxy"]["url"], "user_agent": user["user_agent"]["agent"]}
+        for user in users
+    }
+    assert data == expected[data["id"]]
+
+
+@pytest.mark.django_db
+def test_get_empty_random_user_compact(client):
+    response = client.get(reverse("random-user"), {"format": "compact"})
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_lease_users_compact(client, users):
+    response = client.post(f"{reverse('user-lease')}?count=2&format=compact")
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["users"]) == 2
+    assert all(set(user) == {"id", "proxy", "user_agent"} for user in data["users"])
+
+
+@pytest.mark.django_db
+def test_update_status_starts_cooldown(client, users):
+    user_id = users[0]["id"]
+    for failures in (1, 2):
+        response = client.patch(
+            reverse("user-status-update", args=[user_id]), {"status": 429}, content_type="application/json"
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["consecutive_failures"] == failures
+        assert data["next_available_at"] is not None
+    for _ in range(10):
+        assert client.get(reverse("random-user")).json()["id"] != user_id
+
+
+@pytest.mark.django_db
+def test_bulk_update_status_cooldown(client, users):
+    first, second, *_ = [user["id"] for user in users]
+    User.objects.filter(pk=first).update(consecutive_failures=2)
+    client.patch(
+        reverse("user-status-bulk-update"),
+        [{"id": first, "status": 429}, {"id": second, "status": 200}],
+        content_type="application/json",
+    )
+    first_user = User.objects.get(pk=first)
+    assert first_user.consecutive_failures == 3
+    assert first_user.next_available_at > timezone.now()
+    assert User.objects.get(pk=second).consecutive_failures == 0
+
+
+@pytest.mark.django_db
+def test_get_random_user_strategy(client, users):
+    url = reverse("random-user")
+    for strategy in ("uniform", "weighted", "least-recently-used"):
+        response = client.get(url, {"strategy": strategy})
+        assert response.status_code == 200
+        assert response.json() in users
+    assert client.get(url, {"strategy": "unknown"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_status_reports_update_health_scores(client, users):
+    from api.scoring import health_scores
+
+    first, second, *_ = users
+    client.patch(
+        reverse("user-status-update", args=[first["id"]]),
+        {"status": 429, "latency_ms": 250},
+        content_type="application/json",
+    )
+    client.patch(
+        reverse("user-status-bulk-update"),
+        [{"id": second["id"], "status": 200, "latency_ms": 100}],
+        content_type="application/json",
+    )
+    first_scores = health_scores.snapshot(first["id"], first["proxy"]["id"])
+    assert first_scores["user"]["success_rate"] < 1.0
+    assert first_scores["user"]["latency_ms"] == 250
+    assert health_scores.snapshot(second["id"])["user"] == {"success_rate": 1.0, "latency_ms": 100}
@@ -0,0 +1,156 @@
+"""
+Соединения с прокси пользователей: общие для проверки здоровья (api/healthcheck.py)
+и шлюза (api/gateway.py).
+
+Поддерживаются HTTP-прокси (CONNECT), https://-прокси (то же поверх TLS), SOCKS5
+с логином и паролем и SOCKS4/SOCKS4a.
+"""
+
+import asyncio
+import base64
+import ipaddress
+import ssl
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+
+SOCKS_SCHEMES = ("socks5", "socks5h")
+SOCKS4_SCHEMES = ("socks4", "socks4a")
+HTTP_SCHEMES = ("http", "https")
+SUPPORTED_SCHEMES = (*SOCKS_SCHEMES, *SOCKS4_SCHEMES, *HTTP_SCHEMES)
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        # Код ответа прокси, если он отказал в CONNECT
+        self.status = status
+
+
+def split_endpoint(url, default_port):
+    parts = urlsplit(url)
+    return parts, parts.hostname, parts.port or default_port
+
+
+def proxy_endpoint(proxy_url):
+    """
+    Разобранный URL прокси, его хост и порт; проверяет, что схема поддерживается.
+    """
+    proxy, host, port = split_endpoint(proxy_url, 1080 if proxy_url.startswith("socks") else 8080)
+    if not host:
+        raise UpstreamError("В URL прокси нет адреса")
+    if proxy.scheme not in SUPPORTED_SCHEMES:
+        raise UpstreamError(f"Схема {proxy.scheme} не поддерживается")
+    return proxy, host, port
+
+
+async def read_status(reader):
+    """
+    Читает ответ HTTP до конца заголовков и возвращает код статуса.
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    try:
+        return int(head.split(b" ", 2)[1])
+    except (IndexError, ValueError):
+        raise UpstreamError(f"Некорректный ответ: {head[:50]!r}")
+
+
+def proxy_authorization(proxy):
+    if proxy.username is None:
+        return b""
+    credentials = f"{unquote(proxy.username)}:{unquote(proxy.password or '')}".encode()
+    return b"Proxy-Authorization: Basic " + base64.b64encode(credentials) + b"\r\n"
+
+
+async def http_connect(reader, writer, proxy, host, port):
+    writer.write(
+        f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n".encode() + proxy_authorization(proxy) + b"\r\n"
+    )
+    await writer.drain()
+    status = await read_status(reader)
+    if status != 200:
+        raise UpstreamError(f"CONNECT вернул {status}", status=status)
+
+
+async def socks5_connect(reader, writer, proxy, host, port):
+    """
+    Устанавливает туннель через SOCKS5 (RFC 1928) с необязательной авторизацией по логину (RFC 1929).
+    """
+    methods = b"\x00\x02" if proxy.username is not None else b"\x00"
+    writer.write(b"\x05" + bytes([len(methods)]) + methods)
+    await writer.drain()
+    version, method = await reader.readexactly(2)
+    if version != 5 or method == 0xFF:
+        raise UpstreamError("SOCKS5: нет подходящего метода авторизации")
+    if method == 2:
+        username = unquote(proxy.username).encode()
+        password = unquote(proxy.password or "").encode()
+        writer.write(b"\x01" + bytes([len(username)]) + username + bytes([len(password)]) + password)
+        await writer.drain()
+        if (await reader.readexactly(2))[1] != 0:
+            raise UpstreamError("SOCKS5: неверный логин или пароль")
+
+    try:
+        address = ipaddress.ip_address(host)
+        destination = (b"\x01" if address.version == 4 else b"\x04") + address.packed
+    except ValueError:
+        destination = b"\x03" + bytes([len(host)]) + host.encode()
+    writer.write(b"\x05\x01\x00" + destination + port.to_bytes(2, "big"))
+    await writer.drain()
+    _, reply, _, address_type = await reader.readexactly(4)
+    if reply != 0:
+        raise UpstreamError(f"SOCKS5: код ошибки {reply}")
+    # Пропускаем адрес, к которому привязан сервер
+    if address_type == 3:
+        length = (await reader.readexactly(1))[0]
+    else:
+        length = 4 if address_type == 1 else 16
+    await reader.readexactly(length + 2)
+
+
+async def socks4_connect(reader, writer, proxy, host, port):
+    """
+    Устанавливает туннель через SOCKS4; имя хоста передаётся по расширению SOCKS4a.
+    """
+    user_id = unquote(proxy.username or "").encode()
+    try:
+        address = ipaddress.IPv4Address(host).packed
+        hostname = b""
+    except ValueError:
+        address = b"\x00\x00\x00\x01"
+        hostname = host.encode() + b"\x00"
+    writer.write(b"\x04\x01" + port.to_bytes(2, "big") + address + user_id + b"\x00" + hostname)
+    await writer.drain()
+    _, reply = (await reader.readexactly(8))[:2]
+    if reply != 0x5A:
+        raise UpstreamError(f"SOCKS4: код ошибки {reply}")
+
+
+def proxy_ssl_context():
+    """
+    Контекст TLS для соединения с https://-прокси (PROXY_TLS_CA_FILE — свой корневой сертификат).
+    """
+    return ssl.create_default_context(cafile=getattr(settings, "PROXY_TLS_CA_FILE", None) or None)
+
+
+async def open_proxy(proxy, host, port):
+    """
+    Соединение с прокси; с https://-прокси клиент говорит по TLS.
+    """
+    if proxy.scheme == "https":
+        return await asyncio.open_connection(host, port, ssl=proxy_ssl_context(), server_hostname=host)
+    return await asyncio.open_connection(host, port)
+
+
+async def tunnel(reader, writer, proxy, host, port):
+    """
+    Строит туннель к host:port через прокси любой поддерживаемой схемы.
+    """
+    if proxy.scheme in SOCKS_SCHEMES:
+        await socks5_connect(reader, writer, proxy, host, port)
+    elif proxy.scheme in SOCKS4_SCHEMES:
+        await socks4_connect(reader, writer, proxy, host, port)
+    elif proxy.scheme in HTTP_SCHEMES:
+        await http_connect(reader, writer, proxy, host, port)
+    else:
+        raise UpstreamError(f"Схема {proxy.scheme} не поддерживается")
@@ -1,16 +1,28 @@
 from django.urls import path
 
 # from rest_framework import routers
-from . import views
+from . import async_views, views
 
 # router = routers.DefaultRouter()
 
 urlpatterns = [
     path("random-user/", views.RandomUserView.as_view(), name="random-user"),
+    path("users/status/", views.BulkUserStatusUpdateView.as_view(), name="user-status-bulk-update"),
+    path("users/lease/", views.UserLeaseView.as_view(), name="user-lease"),
+    path("users/lease/release/", views.UserLeaseReleaseView.as_view(), name="user-lease-release"),
     path(
         "users/<int:pk>/status/",
         views.UserStatusUpdateView.as_view(),
         name="user-status-update",
     ),
+    path("proxies/lookup/", views.ProxyLookupView.as_view(), name="proxy-lookup"),
+    path("proxies/import/", views.ProxyImportView.as_view(), name="proxy-import"),
+    path("user-agents/import/", views.UserAgentImportView.as_view(), name="user-agent-import"),
+    path("async/random-user/", async_views.AsyncRandomUserView.as_view(), name="async-random-user"),
+    path(
+        "async/users/<int:pk>/status/",
+        async_views.AsyncUserStatusUpdateView.as_view(),
+        name="async-user-status-update",
+    ),
     # path("", include(router.urls)),
 ]
@@ -1,31 +1,126 @@
-import random
-
-from rest_framework import generics, status
-from rest_framework.exceptions import NotFound
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST
+from rest_framework import generics, serializers, status
+from rest_framework.exceptions import NotFound, Throttled, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from . import metrics as prometheus_metrics
+from .domains import normalize_domain
+from .importers import FORMATS, ProxyImporter, UserAgentImporter, guess_format, open_text
+from .models import Proxy, User, hash_endpoint, hash_url
+from .pool import STRATEGIES, pick_random_user
+from .ratelimit import Saturated
+from .renderers import CompactJSONRenderer
+from .serializers import (
+    COMPACT_USER_FIELDS,
+    LeaseReleaseSerializer,
+    ProxyLookupSerializer,
+    UserDomainStatusSerializer,
+    UserSerializer,
+    UserStatusItemSerializer,
+    UserStatusSerializer,
+    compact_user,
+)
+from .services import lease_users, record_report, release_users, report_domain_statuses, report_statuses
+
+
+def is_compact(request):
+    """
+    Клиент запросил компактный ответ (?format=compact).
+    """
+    return request.accepted_renderer.format == CompactJSONRenderer.format
+
+
+def get_strategy(params):
+    """
+    Читает стратегию выбора пользователя (?strategy=uniform|weighted|least-recently-used).
+    """
+    strategy = params.get("strategy", settings.USER_SELECTION_STRATEGY)
+    if strategy not in STRATEGIES:
+        raise ValidationError({"strategy": f"Допустимые значения: {', '.join(STRATEGIES)}."})
+    return strategy
+
+
+def get_domain(params):
+    """
+    Читает сайт, для которого выбирается пользователь (?domain=example.com).
+    """
+    raw = params.get("domain")
+    if raw is None:
+        return None
+    domain = normalize_domain(raw)
+    if domain is None:
+        raise ValidationError({"domain": "Ожидается домен или URL сайта."})
+    return domain
+
+
+def split_statuses(items):
+    """
+    Разделяет элементы отчёта на общие статусы {id: status}, статусы на сайтах
+    {(id, домен): status} и задержки {id: мс}.
+    """
+    statuses = {item["id"]: item["status"] for item in items if "domain" not in item}
+    domain_statuses = {(item["id"], item["domain"]): item["status"] for item in items if "domain" in item}
+    latencies = {item["id"]: item["latency_ms"] for item in items if "latency_ms" in item and "domain" not in item}
+    return statuses, domain_statuses, latencies
+
 
-from .models import User
-from .serializers import UserSerializer
+def get_session(params):
+    """
+    Читает ключ сессии клиента (?session=): одна сессия получает одного пользователя, пока он доступен.
+    """
+    session = params.get("session")
+    if session is not None and not 0 < len(session) <= 256:
+        raise ValidationError({"session": "Ожидается строка длиной от 1 до 256 символов."})
+    return session
+
+
+def pick_user(**kwargs):
+    """
+    pick_random_user, у которого исчерпанный лимит прокси (api/ratelimit.py) превращается в ответ 429.
+    """
+    try:
+        return pick_random_user(**kwargs)
+    except Saturated as exc:
+        raise Throttled(wait=exc.retry_after, detail=str(exc)) from exc
 
 
 class RandomUserView(generics.RetrieveAPIView):
     """
     Получение случайного пользователя со статусом 200.
+    С ?format=compact возвращает только id, URL прокси и строку User-Agent,
+    ?strategy= задаёт стратегию выбора (см. HealthyUserPool), ?domain= — сайт,
+    для которого пользователь не должен быть заблокирован (см. api/domains.py),
+    ?session= закрепляет пользователя за сессией клиента (см. api/affinity.py).
+    Если прокси всех кандидатов исчерпали лимит выдачи, отвечает 429 с Retry-After.
     """
 
     serializer_class = UserSerializer
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CompactJSONRenderer]
 
     def get_object(self):
         """
         Возвращает случайного пользователя со статусом 200.
         """
-        users = User.objects.filter(status=200)
-        if users.exists():
-            return random.choice(users)
-        else:
-            return None
+        params = self.request.query_params
+        return pick_user(strategy=get_strategy(params), domain=get_domain(params), session=get_session(params))
 
     def retrieve(self, request, *args, **kwargs):
+        if is_compact(request):
+            row = pick_user(
+                fields=COMPACT_USER_FIELDS,
+                strategy=get_strategy(request.query_params),
+                domain=get_domain(request.query_params),
+                session=get_session(request.query_params),
+            )
+            if row is None:
+                return Response(status=404, data={"message": "Нет пользователей со статусом 200"})
+            return Response(compact_user(row))
         instance = self.get_object()
         if instance is None:
             return Response(status=404, data={"message": "Нет пользователей со статусом 200"})
@@ -33,9 +128,76 @@ class RandomUserView(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
+def get_int_param(params, name, default, min_value, max_value):
+    """
+    Читает целочисленный query-параметр и проверяет его границы.
+    """
+    raw = params.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValidationError({name: "Ожидается целое число."})
+    if not min_value <= value <= max_value:
+        raise ValidationError({name: f"Значение должно быть от {min_value} до {max_value}."})
+    return value
+
+
+class UserLeaseView(APIView):
+    """
+    Выдача в аренду N различных пользователей со статусом 200 одним запросом.
+    Поддерживает ?format=compact.
+    """
+
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CompactJSONRenderer]
+
+    def post(self, request, *args, **kwargs):
+        count = get_int_param(request.query_params, "count", 1, 1, settings.USER_LEASE_MAX_COUNT)
+        ttl = get_int_param(
+            request.query_params,
+            "ttl",
+            settings.USER_LEASE_TTL_SECONDS,
+            1,
+            settings.USER_LEASE_MAX_TTL_SECONDS,
+        )
+        if is_compact(request):
+            token, leased_until, rows = lease_users(count, ttl=ttl, fields=COMPACT_USER_FIELDS)
+            users = [compact_user(row) for row in rows]
+        else:
+            token, leased_until, users = lease_users(count, ttl=ttl)
+            users = UserSerializer(users, many=True).data
+        if not users:
+            return Response(status=404, data={"message": "Нет пользователей со статусом 200"})
+        return Response(
+            {
+                "token": token,
+                "leased_until": serializers.DateTimeField().to_representation(leased_until),
+                "users": users,
+            }
+        )
+
+
+class UserLeaseReleaseView(APIView):
+    """
+    Возврат арендованных пользователей с необязательной передачей их статусов.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = LeaseReleaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        statuses, domain_statuses, latencies = split_statuses(data.get("statuses", []))
+        released, updated = release_users(data["token"], ids=data.get("ids"), statuses=statuses, latencies=latencies)
+        if domain_statuses:
+            updated += len(report_domain_statuses(domain_statuses))
+        return Response({"released": released, "updated": updated})
+
+
 class UserStatusUpdateView(generics.UpdateAPIView):
     """
     Эндпоинт для обновления поля 'status' пользователя по ID (доступен всем).
+    С полем domain обновляется статус пользователя только на этом сайте.
     """
 
     serializer_class = UserSerializer
@@ -46,7 +208,7 @@ class UserStatusUpdateView(generics.UpdateAPIView):
         """
         try:
             user_id = self.kwargs["pk"]
-            return User.objects.get(pk=user_id)
+            return User.objects.select_related("proxy", "user_agent").get(pk=user_id)
         except User.DoesNotExist:
             raise NotFound(detail="User not found.")
 
@@ -58,7 +220,124 @@ class UserStatusUpdateView(generics.UpdateAPIView):
         serializer = self.get_serializer(
             user, data=request.data, partial=True
         )  # partial=True разрешает частичное обновление
+        report = UserStatusSerializer(data=request.data, partial=True)
+        if not report.is_valid():
+            return Response(report.errors, status=status.HTTP_400_BAD_REQUEST)
+        if "domain" in report.validated_data:
+            if "status" not in report.validated_data:
+                return Response({"status": ["Обязательное поле."]}, status=status.HTTP_400_BAD_REQUEST)
+            [row] = report_domain_statuses(
+                {(user.pk, report.validated_data["domain"]): report.validated_data["status"]}
+            )
+            return Response(UserDomainStatusSerializer(row).data)
         if serializer.is_valid():
-            serializer.save()
+            # Пишем только изменённые колонки, чтобы не перезаписывать строку целиком
+            data = dict(serializer.validated_data)
+            update_fields = {*data, "updated_at"}
+            if "status" in data:
+                user.apply_status(data.pop("status"))
+                update_fields.update(User.STATUS_FIELDS)
+            for attr, value in data.items():
+                setattr(user, attr, value)
+            user.save(update_fields=update_fields)
+            if "status" in serializer.validated_data:
+                record_report(user.pk, user.proxy_id, user.status, report.validated_data.get("latency_ms"))
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class BulkUserStatusUpdateView(APIView):
+    """
+    Массовое обновление статусов: принимает список пар {"id", "status"}
+    (с необязательным "domain" — статус на отдельном сайте).
+
+    Статусы применяются одним UPDATE на каждое значение статуса, в ответе
+    возвращаются только ID обновлённых и не найденных пользователей.
+    """
+
+    def patch(self, request, *args, **kwargs):
+        serializer = UserStatusItemSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.USER_STATUS_BULK_MAX_ITEMS,
+        )
+        serializer.is_valid(raise_exception=True)
+        statuses, domain_statuses, latencies = split_statuses(serializer.validated_data)
+        updated_ids = report_statuses(statuses, latencies=latencies)
+        if domain_statuses:
+            updated_ids |= {row.user_id for row in report_domain_statuses(domain_statuses)}
+        requested = {item["id"] for item in serializer.validated_data}
+        return Response(
+            {
+                "updated": sorted(updated_ids),
+                "not_found": sorted(requested - updated_ids),
+            }
+        )
+
+
+class ProxyLookupView(generics.ListAPIView):
+    """
+    Поиск прокси по полному URL (?url=) или по адресу (?endpoint=host:port)
+    через слепой индекс: один индексированный запрос без расшифровки.
+    """
+
+    serializer_class = ProxyLookupSerializer
+
+    def get_queryset(self):
+        params = self.request.query_params
+        # URL не читается вовсе: from_db_value расшифровал бы его
+        proxies = Proxy.objects.only(*ProxyLookupSerializer.Meta.fields).order_by("pk")
+        if url := params.get("url"):
+            return proxies.filter(url_hash=hash_url(url.strip()))
+        if endpoint := params.get("endpoint"):
+            endpoint_hash = hash_endpoint(endpoint.strip())
+            if endpoint_hash is None:
+                raise ValidationError({"endpoint": "Ожидается host:port."})
+            return proxies.filter(endpoint_hash=endpoint_hash)
+        raise ValidationError({"url": "Укажите url или endpoint."})
+
+
+class ImportView(APIView):
+    """
+    Потоковый импорт из загруженного файла (multipart, поле file).
+    Формат определяется по расширению или задаётся ?input_format=text|csv|jsonl
+    (?format= занят DRF под выбор формата ответа).
+    """
+
+    parser_classes = [MultiPartParser]
+    importer_class = None
+
+    def post(self, request, *args, **kwargs):
+        uploaded = request.FILES.get("file")
+        if uploaded is None:
+            raise ValidationError({"file": "Файл не передан."})
+        fmt = request.query_params.get("input_format") or guess_format(uploaded.name)
+        if fmt not in FORMATS:
+            raise ValidationError({"input_format": f"Допустимые значения: {', '.join(FORMATS)}."})
+        result = self.importer_class().run(open_text(uploaded), fmt)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+
+class ProxyImportView(ImportView):
+    """
+    Импорт прокси: строки URL или колонки url и expire_at.
+    """
+
+    importer_class = ProxyImporter
+
+
+class UserAgentImportView(ImportView):
+    """
+    Импорт строк User-Agent (колонка agent).
+    """
+
+    importer_class = UserAgentImporter
+
+
+@require_GET
+def metrics(request):
+    """
+    Метрики в формате Prometheus. Доступ ограничивается на уровне nginx, как и для API.
+    """
+    return HttpResponse(prometheus_metrics.render(), content_type=CONTENT_TYPE_LATEST)
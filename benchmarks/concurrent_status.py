@@ -0,0 +1,99 @@
+"""
+Бенчмарк конкурентной записи статусов: много потоков шлют PATCH /api/v1/users/<id>/status/,
+пока отдельный поток в цикле выполняет задачу update_user_statuses.
+
+Запуск (SQLite WAL и PostgreSQL):
+    python -m benchmarks.concurrent_status --threads 32 --requests 200
+    DB_ENGINE=postgres python -m benchmarks.concurrent_status --threads 32 --requests 200
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.common import seed, setup_django, summary, test_database
+
+
+def run(n_users, threads, requests):
+    from django.db import OperationalError, connection
+    from django.test import Client
+    from django.urls import reverse
+
+    from api.models import User
+    from api.tasks import update_user_statuses
+
+    seed(n_users)
+    user_ids = list(User.objects.values_list("id", flat=True))
+    samples, errors = [], []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def writer():
+        client = Client()
+        local_samples, local_errors = [], []
+        for _ in range(requests):
+            url = reverse("user-status-update", args=[random.choice(user_ids)])
+            started = time.perf_counter()
+            try:
+                response = client.patch(url, {"status": random.choice([200, 429])}, content_type="application/json")
+                if response.status_code != 200:
+                    local_errors.append(response.status_code)
+            except OperationalError as e:
+                local_errors.append(str(e))
+            local_samples.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        with lock:
+            samples.extend(local_samples)
+            errors.extend(local_errors)
+
+    def scheduler():
+        while not stop.is_set():
+            try:
+                update_user_statuses()
+            except OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+            time.sleep(0.05)
+        connection.close()
+
+    workers = [threading.Thread(target=writer) for _ in range(threads)]
+    job = threading.Thread(target=scheduler)
+    started = time.perf_counter()
+    job.start()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stop.set()
+    job.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "vendor": connection.vendor,
+        "threads": threads,
+        "rps": round(len(samples) / elapsed, 1),
+        "errors": len(errors),
+        "locked_errors": sum(1 for error in errors if "locked" in str(error)),
+        **summary(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    with tempfile.TemporaryDirectory() as tmp:
+        with test_database(sqlite_file=Path(tmp) / "bench.sqlite3"):
+            print(json.dumps(run(args.users, args.threads, args.requests)))
+
+
+if __name__ == "__main__":
+    main()
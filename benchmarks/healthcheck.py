@@ -0,0 +1,100 @@
+"""
+Бенчмарк проверки здоровья прокси (api/healthcheck.py).
+
+В отдельном процессе поднимаются два локальных сервера: «живой» прокси, отвечающий
+204 с задержкой --latency-ms, и «мёртвый», который принимает соединение и молчит
+до таймаута. Доля мёртвых прокси задаётся --dead-ratio.
+
+Запуск:
+    python -m benchmarks.healthcheck --proxies 50000 --concurrency 1000 --timeout 5
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+
+from benchmarks.common import clear_data, setup_django, test_database
+
+
+def serve(latency_ms, ports):
+    async def alive(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            await asyncio.sleep(latency_ms / 1000)
+            writer.write(b"HTTP/1.1 204 No Content\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        writer.close()
+
+    async def dead(reader, writer):
+        await reader.read()
+        writer.close()
+
+    async def main():
+        alive_server = await asyncio.start_server(alive, "127.0.0.1", 0, backlog=4096)
+        dead_server = await asyncio.start_server(dead, "127.0.0.1", 0, backlog=4096)
+        ports.put((alive_server.sockets[0].getsockname()[1], dead_server.sockets[0].getsockname()[1]))
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def seed_proxies(n, dead_ratio, alive_port, dead_port):
+    from api.models import Proxy, hash_url
+
+    dead_every = round(1 / dead_ratio) if dead_ratio else 0
+    proxies = []
+    for i in range(n):
+        port = dead_port if dead_every and i % dead_every == 0 else alive_port
+        url = f"http://u{i}:p@127.0.0.1:{port}"
+        proxies.append(Proxy(url=url, url_hash=hash_url(url)))
+    Proxy.objects.bulk_create(proxies, batch_size=5000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--proxies", type=int, default=50_000)
+    parser.add_argument("--dead-ratio", type=float, default=0.1)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=5)
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(args.latency_ms, ports), daemon=True)
+    server.start()
+    alive_port, dead_port = ports.get()
+
+    setup_django()
+    from api.healthcheck import run_health_check
+
+    try:
+        with test_database():
+            clear_data()
+            seed_proxies(args.proxies, args.dead_ratio, alive_port, dead_port)
+            started = time.perf_counter()
+            stats = run_health_check(
+                target_url="http://check.invalid/generate_204",
+                concurrency=args.concurrency,
+                timeout=args.timeout,
+            )
+            elapsed = time.perf_counter() - started
+            print(
+                json.dumps(
+                    {
+                        **vars(args),
+                        **stats,
+                        "elapsed_s": round(elapsed, 1),
+                        "proxies_per_s": round(stats["checked"] / elapsed, 1),
+                    }
+                )
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Нагрузочный тест HTTP-эндпоинта с большим числом одновременных соединений.
+
+Каждое соединение работает в режиме keep-alive и последовательно отправляет
+запросы (по умолчанию GET, --method и --data задают метод и JSON-тело) в течение
+заданного времени. Подходит для сравнения WSGI и ASGI:
+
+    gunicorn core.wsgi:application -w 4 --bind unix:/tmp/gunicorn.sock
+    python -m benchmarks.load_test --unix-socket /tmp/gunicorn.sock --path /api/v1/random-user/
+
+    gunicorn core.asgi:application -w 4 -k uvicorn_worker.UvicornWorker --bind unix:/tmp/gunicorn.sock
+    python -m benchmarks.load_test --unix-socket /tmp/gunicorn.sock --path /api/v1/async/random-user/
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import summary
+
+
+async def open_connection(args):
+    if args.unix_socket:
+        return await asyncio.open_unix_connection(args.unix_socket)
+    return await asyncio.open_connection(args.host, args.port)
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    keep_alive = True
+    for line in head.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.lower() == b"content-length":
+            length = int(value)
+        elif name.lower() == b"connection" and value.strip().lower() == b"close":
+            keep_alive = False
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+def build_request(args):
+    body = args.data.encode() if args.data else b""
+    head = f"{args.method} {args.path} HTTP/1.1\r\nHost: {args.host_header}\r\nConnection: keep-alive\r\n"
+    if body:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    return f"{head}\r\n".encode() + body
+
+
+async def worker(args, deadline, samples, errors):
+    request = build_request(args)
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await open_connection(args)
+            started = time.perf_counter()
+            writer.write(request)
+            status, keep_alive = await read_response(reader)
+            samples.append((time.perf_counter() - started) * 1000)
+            if status >= 500:
+                errors.append(status)
+            if not keep_alive:
+                # Синхронные воркеры gunicorn не поддерживают keep-alive
+                writer.close()
+                reader = writer = None
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            errors.append(None)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+async def run(args):
+    samples, errors = [], []
+    deadline = time.monotonic() + args.duration
+    started = time.monotonic()
+    await asyncio.gather(*(worker(args, deadline, samples, errors) for _ in range(args.concurrency)))
+    elapsed = time.monotonic() - started
+    return {
+        "method": args.method,
+        "path": args.path,
+        "concurrency": args.concurrency,
+        "rps": round(len(samples) / elapsed, 1),
+        "errors": len(errors),
+        **summary(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket")
+    parser.add_argument("--host-header", default="localhost")
+    parser.add_argument("--path", default="/api/v1/random-user/")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--data", help="JSON-тело запроса")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args))))
+
+
+if __name__ == "__main__":
+    main()
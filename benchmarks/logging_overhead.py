@@ -0,0 +1,99 @@
+"""
+Бенчмарк накладных расходов одного вызова logger.* (logger.py) в разных режимах:
+синхронная запись и очередь с фоновым потоком, текст и JSON, а также
+сообщения с сэмплированием (extra={"sample": ...}) сверх лимита.
+
+Файлы логов пишутся во временный каталог, вывод в консоль отключается.
+--disk-latency-ms добавляет задержку к каждой записи в файл, имитируя медленный
+диск: синхронный режим ждёт её в каждом вызове, режим с очередью — нет.
+Для режимов с очередью отдельно измеряется время дописывания очереди (drain_ms)
+и число записей, отброшенных из-за переполнения (dropped).
+
+Запуск:
+    python -m benchmarks.logging_overhead --calls 50000
+    python -m benchmarks.logging_overhead --calls 2000 --disk-latency-ms 1
+"""
+
+import argparse
+import json
+import logging.handlers
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import percentile
+
+MODES = [
+    ("sync-text", False, "text"),
+    ("sync-json", False, "json"),
+    ("queue-text", True, "text"),
+    ("queue-json", True, "json"),
+]
+
+
+def measure(log, calls, **kwargs):
+    samples = []
+    for i in range(calls):
+        started = time.perf_counter()
+        log(f"Сообщение {i} из бенчмарка", **kwargs)
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    return {
+        "p50_us": round(percentile(samples, 50), 2),
+        "p99_us": round(percentile(samples, 99), 2),
+        "mean_us": round(sum(samples) / len(samples), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=50_000)
+    parser.add_argument("--disk-latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    if args.disk_latency_ms:
+        emit = logging.handlers.TimedRotatingFileHandler.emit
+
+        def slow_emit(self, record):
+            time.sleep(args.disk_latency_ms / 1000)
+            emit(self, record)
+
+        logging.handlers.TimedRotatingFileHandler.emit = slow_emit
+
+    directory = tempfile.mkdtemp(prefix="log-bench-")
+    stderr = sys.stderr
+    # Обработчики консоли создаются с текущим sys.stderr
+    sys.stderr = open(os.devnull, "w")
+    import logger as logging_module
+
+    logging_module.log_dir = directory
+    logging_module.log_file = os.path.join(directory, "app.log")
+    results = []
+    try:
+        for name, use_queue, fmt in MODES:
+            logging_module.configure(use_queue=use_queue, sink="file", fmt=fmt)
+            result = {"mode": name, **measure(logging_module.logger.info, args.calls)}
+            started = time.perf_counter()
+            if use_queue:
+                result["dropped"] = logging_module.logger.handlers[0].dropped
+            logging_module.stop_listener()
+            result["drain_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            results.append(result)
+
+        logging_module.configure(use_queue=True, sink="file")
+        results.append(
+            {
+                "mode": "queue-sampled",
+                **measure(logging_module.logger.error, args.calls, extra={"sample": "decryption_error"}),
+            }
+        )
+        logging_module.stop_listener()
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+    for result in results:
+        print(json.dumps({"calls": args.calls, "disk_latency_ms": args.disk_latency_ms, **result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Бенчмарк задержки /api/v1/random-user/ в зависимости от размера таблицы User.
+
+Запуск:
+    python -m benchmarks.random_user --sizes 1000 10000 100000 1000000 --requests 500
+    python -m benchmarks.random_user --sizes 10000 --format compact
+"""
+
+import argparse
+import json
+
+from benchmarks.common import clear_data, seed, setup_django, summary, test_database, timed
+
+
+def run(sizes, requests, response_format=None):
+    from django.test import Client
+    from django.urls import reverse
+
+    client = Client()
+    url = reverse("random-user")
+    if response_format:
+        url = f"{url}?format={response_format}"
+    results = []
+    for size in sizes:
+        clear_data()
+        seed(size)
+        client.get(url)  # прогрев: загрузка пула
+        samples = timed(lambda: client.get(url), requests)
+        result = {"rows": size, "format": response_format or "json", **summary(samples)}
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--format", choices=["json", "compact"], default=None)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        run(args.sizes, args.requests, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Бенчмарк общего пула (api/sharedpool.py) в сравнении с пулом в памяти процесса:
+время загрузки, задержка выбора по стратегиям и задержка PATCH-статусов
+с синхронной записью и с write-behind.
+
+Запуск:
+    python -m benchmarks.shared_pool --sizes 10000 100000 --calls 2000
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import clear_data, seed, setup_django, summary, test_database, timed
+
+
+def run(sizes, calls):
+    from django.conf import settings
+
+    from api.models import User
+    from api.pool import STRATEGIES, HealthyUserPool
+    from api.services import report_statuses
+    from api.sharedpool import SharedUserPool, StatusFlusher
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            clear_data()
+            seed(size)
+            ids = list(User.objects.values_list("pk", flat=True))
+            flusher = StatusFlusher(interval=3600)
+            pools = {
+                "local": HealthyUserPool(refresh_interval=3600),
+                "shared": SharedUserPool(str(Path(directory) / f"pool-{size}"), refresh_interval=3600, flusher=flusher),
+            }
+            for backend, pool in pools.items():
+                started = time.perf_counter()
+                pool.load()
+                result = {"rows": size, "backend": backend, "load_ms": round((time.perf_counter() - started) * 1000, 1)}
+                for strategy in STRATEGIES:
+                    result[strategy] = summary(timed(lambda: pool.choice(strategy), calls))
+                print(json.dumps(result))
+                results.append(result)
+
+            for backend, write_behind in (("sync", False), ("write-behind", True)):
+                settings.USER_STATUS_WRITE_BEHIND = write_behind
+                pool = pools["shared"]
+                samples = timed(
+                    lambda: report_statuses({random.choice(ids): random.choice((200, 429))}, pool=pool), calls
+                )
+                result = {"rows": size, "backend": backend, "report_statuses": summary(samples)}
+                started = time.perf_counter()
+                flushed = flusher.flush()
+                result["flush"] = {"users": flushed, "ms": round((time.perf_counter() - started) * 1000, 1)}
+                print(json.dumps(result))
+                results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--calls", type=int, default=2_000)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        run(args.sizes, args.calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 import sys
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -27,11 +28,156 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.environ.get("SECRET_KEY")
 DEBUG = os.environ.get("DEBUG", "False") == "True"
-CRYPTOGRAPHY_KEY = os.environ.get("CRYPTOGRAPHY_KEY")
+# Ключи шифрования EncryptedCharField через запятую, новый — первым: им шифруются значения,
+# остальные только расшифровывают ещё не перешифрованные (manage.py reencrypt_proxies).
+# Без CRYPTOGRAPHY_KEYS используется единственный ключ CRYPTOGRAPHY_KEY
+CRYPTOGRAPHY_KEYS = [
+    key.strip()
+    for key in os.environ.get("CRYPTOGRAPHY_KEYS", os.environ.get("CRYPTOGRAPHY_KEY") or "").split(",")
+    if key.strip()
+]
+CRYPTOGRAPHY_KEY = CRYPTOGRAPHY_KEYS[0] if CRYPTOGRAPHY_KEYS else None
+# Ключ HMAC слепого индекса url_hash/endpoint_hash (api/blindindex.py), обязателен и не зависит
+# от SECRET_KEY. В отличие от ключей шифрования не ротируется: после смены нужно выполнить
+# manage.py rebuild_proxy_index, иначе поиск и дедупликация прокси перестанут находить записи
+BLIND_INDEX_KEY = os.environ.get("BLIND_INDEX_KEY") or None
+# Кеш расшифрованных значений EncryptedCharField (api/fields.py)
+ENCRYPTED_FIELD_CACHE_SIZE = int(os.environ.get("ENCRYPTED_FIELD_CACHE_SIZE", 10_000))
+ENCRYPTED_FIELD_CACHE_TTL = int(os.environ.get("ENCRYPTED_FIELD_CACHE_TTL", 3600))
 ALLOWED_HOSTS = ["83.222.25.147", "localhost", "127.0.0.1"]
 
 TESTING = "pytest" in sys.modules
-SCHEDULER_AUTOSTART = True
+if TESTING and not BLIND_INDEX_KEY:
+    BLIND_INDEX_KEY = "test-blind-index-key"
+# Планировщик (api/scheduler.py): при SCHEDULER_AUTOSTART задачи выполняет один веб-процесс-лидер,
+# без него — отдельный процесс manage.py run_scheduler. Лидер выбирается advisory lock
+# (PostgreSQL) или блокировкой файла SCHEDULER_LOCK_FILE (SQLite, только одна машина)
+SCHEDULER_AUTOSTART = os.environ.get("SCHEDULER_AUTOSTART", "True") == "True"
+SCHEDULER_LOCK_FILE = os.environ.get(
+    "SCHEDULER_LOCK_FILE", os.path.join(tempfile.gettempdir(), "proxy-manager-scheduler.lock")
+)
+SCHEDULER_LOCK_KEY = 0x70726F78  # ключ pg_advisory_lock
+SCHEDULER_LEADER_RETRY_SECONDS = 60
+SCHEDULER_MISFIRE_GRACE_SECONDS = 5 * 60
+SCHEDULER_HISTORY_DAYS = 14
+
+# Пул здоровых пользователей для RandomUserView (api/pool.py)
+USER_POOL_REFRESH_SECONDS = int(os.environ.get("USER_POOL_REFRESH_SECONDS", 300))
+USER_POOL_MAX_MISSES = 10
+# local — пул в памяти каждого процесса; shared — один пул на машину в файле USER_POOL_SHARED_PATH
+# (api/sharedpool.py), который читают все воркеры без обращений к базе
+USER_POOL_BACKEND = os.environ.get("USER_POOL_BACKEND", "local")
+USER_POOL_SHARED_PATH = os.environ.get(
+    "USER_POOL_SHARED_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "proxy_manager_pool"),
+)
+USER_POOL_SHARED_HEADROOM = 4096  # свободных слотов для пользователей, добавленных после загрузки
+# Только для shared: статусы из PATCH /users/status/ применяются в общей памяти сразу,
+# а в базу пишутся фоновым потоком раз в USER_STATUS_FLUSH_SECONDS
+USER_STATUS_WRITE_BEHIND = os.environ.get("USER_STATUS_WRITE_BEHIND", "False") == "True"
+USER_STATUS_FLUSH_SECONDS = float(os.environ.get("USER_STATUS_FLUSH_SECONDS", 1))
+# Стратегия выбора по умолчанию: uniform, weighted или least-recently-used
+USER_SELECTION_STRATEGY = os.environ.get("USER_SELECTION_STRATEGY", "uniform")
+
+# Статусы по сайтам (?domain=, api/domains.py): пулы доменов в памяти процесса,
+# давно не использованные вытесняются
+USER_DOMAIN_POOLS_MAX = int(os.environ.get("USER_DOMAIN_POOLS_MAX", 1000))
+# Сколько кандидатов подряд можно пропустить (заблокированы для сайта или их прокси исчерпал
+# лимит), прежде чем искать пользователя в базе или ответить 429
+USER_POOL_MAX_SKIPS = 100
+
+# Лимиты выдачи на прокси (api/ratelimit.py): выдач в секунду (0 — без ограничения) с запасом
+# PROXY_RATE_BURST (0 — не меньше одной секунды лимита) и одновременных аренд (0 — без ограничения).
+# PROXY_LIMIT_SCOPE=endpoint считает лимит на host:port, а не на каждый прокси;
+# PROXY_LIMIT_BACKEND=database — общий лимит для всех процессов и машин через базу
+PROXY_RATE_LIMIT = float(os.environ.get("PROXY_RATE_LIMIT", 0))
+PROXY_RATE_BURST = float(os.environ.get("PROXY_RATE_BURST", 0))
+PROXY_MAX_LEASES = int(os.environ.get("PROXY_MAX_LEASES", 0))
+PROXY_LIMIT_SCOPE = os.environ.get("PROXY_LIMIT_SCOPE", "proxy")
+PROXY_LIMIT_BACKEND = os.environ.get("PROXY_LIMIT_BACKEND", "memory")
+
+# Шлюз (python manage.py run_gateway, api/gateway.py): прямой HTTP-прокси, который сам выбирает
+# пользователя, подставляет его User-Agent и сообщает статусы. GATEWAY_TOKEN — пароль клиентов
+# в Proxy-Authorization (пустой — без авторизации, только для локального адреса);
+# GATEWAY_DOMAIN_STATUSES=True выбирает и записывает статусы по сайтам (api/domains.py)
+GATEWAY_HOST = os.environ.get("GATEWAY_HOST", "127.0.0.1")
+GATEWAY_PORT = int(os.environ.get("GATEWAY_PORT", 8888))
+GATEWAY_TOKEN = os.environ.get("GATEWAY_TOKEN", "")
+GATEWAY_DOMAIN_STATUSES = os.environ.get("GATEWAY_DOMAIN_STATUSES", "False") == "True"
+GATEWAY_TIMEOUT_SECONDS = float(os.environ.get("GATEWAY_TIMEOUT_SECONDS", 30))
+GATEWAY_REPORT_SECONDS = 0.5
+GATEWAY_MAX_IDLE_PER_PROXY = 8
+GATEWAY_IDLE_TIMEOUT_SECONDS = 30
+# Коды ответа, которые шлюз записывает пользователю как неудачу (вместе с USER_COOLDOWN_STATUSES):
+# отказ прокси (407) и блокировка адреса сайтом. Остальные ошибки сайта (404, 500, ...) — не вина
+# прокси, они записываются как 200
+GATEWAY_FAILURE_STATUSES = [403, 407]
+
+# Закрепление пользователей за сессиями (?session=, api/affinity.py): точек кольца на пользователя
+# (больше — ровнее распределение, но больше памяти) и сколько точек обходить в поисках доступного
+USER_SESSION_VNODES = int(os.environ.get("USER_SESSION_VNODES", 4))
+USER_SESSION_MAX_WALK = 64
+
+# Оценки здоровья для взвешенного выбора (api/scoring.py)
+HEALTH_SCORE_ALPHA = 0.1  # вес нового наблюдения в скользящем среднем
+HEALTH_SCORE_LATENCY_MS = 1000  # задержка, при которой оценка уменьшается вдвое
+HEALTH_SCORE_MIN_WEIGHT = 0.01
+# Сколько пользователей и сколько прокси помнить: давно не получавшие статусов вытесняются (LRU)
+HEALTH_SCORE_MAX_ENTRIES = int(os.environ.get("HEALTH_SCORE_MAX_ENTRIES", 200_000))
+
+# Cooldown пользователей после неудачных статусов (api/cooldown.py):
+# задержка = min(MAX, BASE * 2 ** (неудач подряд - 1)) ± JITTER
+USER_COOLDOWN_STATUSES = [429]
+USER_COOLDOWN_BASE_SECONDS = int(os.environ.get("USER_COOLDOWN_BASE_SECONDS", 60))
+USER_COOLDOWN_MAX_SECONDS = int(os.environ.get("USER_COOLDOWN_MAX_SECONDS", 6 * 60 * 60))
+USER_COOLDOWN_JITTER = 0.2
+
+# Аренда пользователей (POST /api/v1/users/lease/)
+USER_LEASE_TTL_SECONDS = int(os.environ.get("USER_LEASE_TTL_SECONDS", 300))
+USER_LEASE_MAX_TTL_SECONDS = 24 * 60 * 60
+USER_LEASE_MAX_COUNT = 1000
+USER_LEASE_OVERSAMPLE = 2
+
+# Удаление прокси с истёкшим сроком (api/services.py, purge_expired_proxies): размеры пачек
+# и пауза между транзакциями. Прокси, истекающие в ближайшие PROXY_EXPIRY_MARGIN_SECONDS, не выдаются
+PROXY_DELETE_BATCH_SIZE = 100
+USER_DELETE_BATCH_SIZE = 5000
+PROXY_DELETE_PAUSE_SECONDS = 0.05
+PROXY_EXPIRY_MARGIN_SECONDS = int(os.environ.get("PROXY_EXPIRY_MARGIN_SECONDS", 300))
+
+# Перешифрование прокси новым ключом (manage.py reencrypt_proxies): строк в транзакции
+REENCRYPT_BATCH_SIZE = 1000
+
+# Максимальный размер пакета для PATCH /api/v1/users/status/
+USER_STATUS_BULK_MAX_ITEMS = 10_000
+
+# Импорт прокси и User-Agent (api/importers.py): размер пачки и число процессов шифрования
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 2000))
+IMPORT_WORKERS = int(os.environ.get("IMPORT_WORKERS", 1))
+
+# Создание пользователей (api/pairing.py): all — все пары прокси × User-Agent,
+# random — USER_PAIRING_AGENTS_PER_PROXY случайных User-Agent на каждый прокси
+USER_PAIRING_POLICY = os.environ.get("USER_PAIRING_POLICY", "all")
+USER_PAIRING_AGENTS_PER_PROXY = int(os.environ.get("USER_PAIRING_AGENTS_PER_PROXY", 10))
+USER_PAIRING_CHUNK_SIZE = 1000
+USER_PAIRING_ON_IMPORT = os.environ.get("USER_PAIRING_ON_IMPORT", "True") == "True"
+
+# Проверка здоровья прокси (api/healthcheck.py): каждый прокси запрашивает HEALTHCHECK_TARGET_URL,
+# после HEALTHCHECK_MAX_FAILURES неудач подряд пользователи прокси перестают выдаваться.
+# HEALTHCHECK_INTERVAL_MINUTES=0 отключает проверку в планировщике (остаётся команда check_proxies)
+# https://-прокси проверяются по TLS; PROXY_TLS_CA_FILE — свой корневой сертификат вместо системных
+PROXY_TLS_CA_FILE = os.environ.get("PROXY_TLS_CA_FILE") or None
+HEALTHCHECK_TARGET_URL = os.environ.get("HEALTHCHECK_TARGET_URL", "http://www.gstatic.com/generate_204")
+HEALTHCHECK_INTERVAL_MINUTES = int(os.environ.get("HEALTHCHECK_INTERVAL_MINUTES", 15))
+HEALTHCHECK_CONCURRENCY = int(os.environ.get("HEALTHCHECK_CONCURRENCY", 500))
+HEALTHCHECK_TIMEOUT_SECONDS = float(os.environ.get("HEALTHCHECK_TIMEOUT_SECONDS", 5))
+HEALTHCHECK_MAX_FAILURES = 2
+HEALTHCHECK_CHUNK_SIZE = 10_000
+
+# Метрики Prometheus (GET /metrics, api/metrics.py): счётчики из базы кешируются на METRICS_CACHE_SECONDS.
+# Под gunicorn с несколькими воркерами нужен PROMETHEUS_MULTIPROC_DIR (см. README)
+METRICS_CACHE_SECONDS = int(os.environ.get("METRICS_CACHE_SECONDS", 30))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -47,6 +193,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -79,12 +226,56 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB_ENGINE=postgres включает PostgreSQL (параметры подключения берутся из окружения),
+# иначе используется SQLite в режиме WAL.
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgres":
+    POSTGRES_POOL = os.environ.get("POSTGRES_POOL", "True") == "True"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("POSTGRES_DB", "proxy_manager"),
+            "USER": os.environ.get("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+            # Пул соединений psycopg несовместим с постоянными соединениями Django
+            "CONN_MAX_AGE": 0 if POSTGRES_POOL else int(os.environ.get("CONN_MAX_AGE", 60)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": (
+                {
+                    "pool": {
+                        "min_size": int(os.environ.get("POSTGRES_POOL_MIN_SIZE", 2)),
+                        "max_size": int(os.environ.get("POSTGRES_POOL_MAX_SIZE", 20)),
+                        "timeout": int(os.environ.get("POSTGRES_POOL_TIMEOUT", 10)),
+                    }
+                }
+                if POSTGRES_POOL
+                else {}
+            ),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", 60)),
+            "OPTIONS": {
+                # WAL позволяет читать во время записи, IMMEDIATE сразу берёт блокировку записи
+                # и избавляет от "database is locked" при апгрейде блокировки внутри транзакции.
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA busy_timeout=5000;"
+                    "PRAGMA cache_size=-20000;"
+                ),
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+            },
+        }
     }
-}
 
 
 # Password validation
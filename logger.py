@@ -1,10 +1,35 @@
+import atexit
+import json
 import logging
 import logging.handlers
 import os
+import pickle
+import queue
+import socketserver
+import struct
+import threading
+import time
 
 # Определяем уровень логирования (DEBUG, INFO, WARNING, ERROR, CRITICAL)
 LOG_LEVEL = logging.INFO  # Можно изменить на другой уровень
 
+# Режим записи задаётся переменными окружения:
+# LOG_QUEUE=True — запись в фоновом потоке через QueueHandler/QueueListener, вызов logger.* не ждёт диска;
+# LOG_FORMAT=text|json;
+# LOG_SINK=file — общий logs/app.log (для одного процесса), process — свой файл logs/app.<pid>.log
+# у каждого процесса, socket — отправка на сервер логов (python logger.py serve), который один
+# пишет и ротирует logs/app.log
+LOG_QUEUE = os.environ.get("LOG_QUEUE", "False") == "True"
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10_000))
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_SINK = os.environ.get("LOG_SINK", "file")
+LOG_SOCKET_HOST = os.environ.get("LOG_SOCKET_HOST", "127.0.0.1")
+LOG_SOCKET_PORT = int(os.environ.get("LOG_SOCKET_PORT", logging.handlers.DEFAULT_TCP_LOGGING_PORT))
+# Сообщения с extra={"sample": <ключ>} пропускаются не чаще LOG_SAMPLE_LIMIT раз
+# за LOG_SAMPLE_INTERVAL секунд на ключ
+LOG_SAMPLE_LIMIT = int(os.environ.get("LOG_SAMPLE_LIMIT", 10))
+LOG_SAMPLE_INTERVAL = float(os.environ.get("LOG_SAMPLE_INTERVAL", 60))
+
 # Создаем логгер
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
@@ -12,33 +37,213 @@ logger.setLevel(LOG_LEVEL)
 # Создаем форматтер
 formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
-# Создаем обработчик (handler) для записи в файл с ротацией по времени
 log_dir = "logs"
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
 log_file = os.path.join(log_dir, "app.log")
-# Ротация каждый день, хранить 7 файлов
-rotating_file_handler = logging.handlers.TimedRotatingFileHandler(
-    log_file,
-    when="D",  # "D" - каждый день, "W" - каждую неделю, "M" - каждый месяц и т.д.
-    interval=1,  # Интервал ротации (1 - каждый день)
-    backupCount=7,  # Хранить 7 последних файлов
-)
-rotating_file_handler.setFormatter(formatter)
-
-# Создаем обработчик (handler) для вывода в консоль
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
-
-# Добавляем обработчики к логгеру
-logger.addHandler(rotating_file_handler)
-logger.addHandler(stream_handler)
-
-# Пример использования
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Одна запись — одна строка JSON.
+    """
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        if getattr(record, "sample", None):
+            data["sample"] = record.sample
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Ограничивает частоту однотипных сообщений, помеченных extra={"sample": <ключ>}.
+
+    За каждое окно interval пропускается не больше limit сообщений ключа, остальные
+    отбрасываются до постановки в очередь; первое сообщение следующего окна
+    сообщает, сколько было пропущено. Сообщения без ключа не ограничиваются.
+    """
+
+    def __init__(self, limit=LOG_SAMPLE_LIMIT, interval=LOG_SAMPLE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, count = now, 0
+            if count >= self.limit:
+                self._windows[key] = (started, count, suppressed + 1)
+                return False
+            self._windows[key] = (started, count + 1, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (пропущено похожих сообщений: {suppressed})"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который при переполненной очереди отбрасывает запись, а не блокирует вызов.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # В отличие от QueueHandler.prepare не форматирует запись целиком и не копирует её:
+        # в вызывающем потоке только подставляются аргументы, остальное делает поток записи
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def build_sink_handlers(sink=None, fmt=None):
+    """
+    Обработчики, которые непосредственно пишут записи: файл (или сокет) и консоль.
+    """
+    sink = sink or LOG_SINK
+    record_formatter = JSONFormatter() if (fmt or LOG_FORMAT) == "json" else formatter
+    if sink == "socket":
+        # Сервер логов форматирует записи сам
+        return [logging.handlers.SocketHandler(LOG_SOCKET_HOST, LOG_SOCKET_PORT)]
+    path = log_file if sink == "file" else os.path.join(log_dir, f"app.{os.getpid()}.log")
+    # Ротация каждый день, хранить 7 файлов
+    file_handler = logging.handlers.TimedRotatingFileHandler(path, when="D", interval=1, backupCount=7)
+    file_handler.setFormatter(record_formatter)
+    # Обработчик для вывода в консоль
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(record_formatter)
+    return [file_handler, stream_handler]
+
+
+_listener = None
+
+
+def stop_listener():
+    """
+    Дописывает оставшиеся в очереди записи и останавливает фоновый поток.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def configure(use_queue=None, sink=None, fmt=None):
+    """
+    (Пере)настраивает обработчики логгера.
+    """
+    global _listener
+    stop_listener()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    for log_filter in list(logger.filters):
+        logger.removeFilter(log_filter)
+    logger.addFilter(SamplingFilter())
+
+    handlers = build_sink_handlers(sink, fmt)
+    if use_queue if use_queue is not None else LOG_QUEUE:
+        _listener = logging.handlers.QueueListener(queue.Queue(LOG_QUEUE_SIZE), *handlers, respect_handler_level=True)
+        _listener.start()
+        logger.addHandler(DroppingQueueHandler(_listener.queue))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+
+class LogRecordStreamHandler(socketserver.StreamRequestHandler):
+    """
+    Принимает записи от SocketHandler: длина (4 байта) и pickle словаря записи.
+    """
+
+    def handle(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                break
+            length = struct.unpack(">L", header)[0]
+            data = self.rfile.read(length)
+            if len(data) < length:
+                break
+            record = logging.makeLogRecord(pickle.loads(data))
+            self.server.target.handle(record)
+
+
+class LogRecordServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host, port, target):
+        super().__init__((host, port), LogRecordStreamHandler)
+        self.target = target
+
+
+def serve(host=LOG_SOCKET_HOST, port=LOG_SOCKET_PORT):
+    """
+    Сервер логов для LOG_SINK=socket: единственный процесс, который пишет и ротирует logs/app.log.
+    Слушать следует только локальный адрес: записи передаются через pickle.
+    """
+    target = logging.getLogger("logserver")
+    target.propagate = False
+    for handler in build_sink_handlers(sink="file"):
+        target.addHandler(handler)
+    with LogRecordServer(host, port, target) as server:
+        server.serve_forever()
+
+
+def _reconfigure_after_fork():
+    # Поток записи в дочерний процесс не переходит (gunicorn --preload): останавливать нечего,
+    # очередь родителя бросаем и создаём обработчики заново (для LOG_SINK=process — с новым pid)
+    global _listener
+    _listener = None
+    configure()
+
+
+configure()
+atexit.register(stop_listener)
+os.register_at_fork(after_in_child=_reconfigure_after_fork)
+
 if __name__ == "__main__":
-    logger.debug("This is a debug message")
-    logger.info("This is an info message")
-    logger.warning("This is a warning message")
-    logger.error("This is an error message")
-    logger.critical("This is a critical message")
+    import sys
+
+    if sys.argv[1:2] == ["serve"]:
+        serve()
+    else:
+        # Пример использования
+        logger.debug("This is a debug message")
+        logger.info("This is an info message")
+        logger.warning("This is a warning message")
+        logger.error("This is an error message")
+        logger.critical("This is a critical message")
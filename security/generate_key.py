@@ -1,3 +1,4 @@
+import argparse
 import base64
 import getpass
 import os
@@ -5,7 +6,7 @@ import os
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from dotenv import load_dotenv, set_key
+from dotenv import dotenv_values, set_key, unset_key
 
 
 def generate_key(password: str) -> str:
@@ -23,14 +24,42 @@ def generate_key(password: str) -> str:
     return key.decode()
 
 
-password = getpass.getpass("Enter password to generate key: ")
-key = generate_key(password)
+def current_keys(values):
+    keys = values.get("CRYPTOGRAPHY_KEYS") or values.get("CRYPTOGRAPHY_KEY") or ""
+    return [key.strip() for key in keys.split(",") if key.strip()]
+
+
+parser = argparse.ArgumentParser(
+    description="Добавляет новый ключ шифрования первым в CRYPTOGRAPHY_KEYS, сохраняя прежние для расшифровки."
+)
+parser.add_argument(
+    "--drop-old",
+    action="store_true",
+    help="Оставить только основной ключ (после manage.py reencrypt_proxies)",
+)
+args = parser.parse_args()
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 dotenv_path = os.path.join(BASE_DIR, ".env")
+keys = current_keys(dotenv_values(dotenv_path)) if os.path.exists(dotenv_path) else []
 
-load_dotenv(dotenv_path)
+if args.drop_old:
+    if not keys:
+        raise SystemExit("В .env нет ключей шифрования.")
+    keys = keys[:1]
+    message = "Старые ключи удалены из .env, остался основной."
+else:
+    password = getpass.getpass("Enter password to generate key: ")
+    # Прежние ключи остаются после нового: без них уже сохранённые URL прокси не расшифровать
+    keys = [generate_key(password), *keys]
+    message = (
+        "Key generated and saved to .env file!\n"
+        "Перезапустите сервис, выполните python manage.py reencrypt_proxies "
+        "и затем удалите старые ключи: python security/generate_key.py --drop-old"
+    )
 
-set_key(dotenv_path, "CRYPTOGRAPHY_KEY", key)
+set_key(dotenv_path, "CRYPTOGRAPHY_KEYS", ",".join(keys))
+if "CRYPTOGRAPHY_KEY" in dotenv_values(dotenv_path):
+    unset_key(dotenv_path, "CRYPTOGRAPHY_KEY")
 
-print("Key generated and saved to .env file!")
+print(message)